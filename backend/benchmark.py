@@ -0,0 +1,394 @@
+# benchmark.py - Benchmark de ingesta y endpoints con workbooks sintéticos
+#
+# Uso:
+#   python benchmark.py --rows 100,1000,10000 --output bench.json
+#
+# Genera un Excel con la misma forma que el de SharePoint (FLO, TEX, FLO-COM, TEX-COM),
+# lo sirve desde un servidor HTTP local en lugar de SharePoint y mide
+# download_and_process_excel(), cada ruta /api/* con el test client de Flask
+# y el pico de memoria. El resultado se escribe en JSON para comparar entre commits.
+# Las rutas se miden con la caché de respuestas caliente (warm) y/o vaciándola antes
+# de cada request (cold, para detectar regresiones en los handlers).
+# main.py solo lee las filas 2-28 de FLO-COM y 2-59 de TEX-COM (COM_MAX_ROWS); para que
+# tablas, calendario, índice de tiendas y pivote crezcan con --rows, el benchmark sube esos
+# topes a las filas generadas mientras mide (como si el Excel real tuviera más tiendas).
+import argparse
+import atexit
+import json
+import logging
+import os
+import platform
+import random
+import secrets
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import openpyxl
+
+# Los snapshots sintéticos van a un directorio temporal, nunca al SNAPSHOT_DIR de un servidor real
+os.environ['SNAPSHOT_DIR'] = tempfile.mkdtemp(prefix='dashboard-benchmark-')
+atexit.register(shutil.rmtree, os.environ['SNAPSHOT_DIR'], ignore_errors=True)
+
+import main
+
+# Encabezados de las hojas COM (columnas A-X)
+COM_HEADERS = [
+    'STORE', 'ADDRESS', 'PHONE/STORE PHONE', 'DM', 'GM', 'A19', 'WIRING', 'FRESH AI',
+    'EDMB', 'IDMB', 'QB', 'KIOSK', 'A19 UP', 'NETXEO PRO', 'START REMOD', 'END REMOD',
+    'PROJECT', 'AUV', 'COST', 'STATUS', 'CABLE INSTALL', 'DELIVERY DATE',
+    'INSTALLATION DATE', 'INSTALL'
+]
+
+PROJECT_TYPES = ['FAI,EDMB,IDMB,QUE', 'EDMB-IDMB-QB', 'EDMB', 'IDMB-QB', '---']
+PROJECT_STATUS = ['PAID', 'SIGNED', 'QUOTE', 'PENDING']
+
+# Valores de ejemplo para las rutas con parámetros
+PARAM_ROUTES = {
+    '/api/table/<region>/detailed': ['/api/table/florida/detailed', '/api/table/texas/detailed'],
+    '/api/export/<table>': ['/api/export/projects?format=csv', '/api/export/texas?format=xlsx'],
+    '/api/stores/<store_id>': ['/api/stores/FL1000', '/api/stores/tx1001'],
+    '/api/projects/financials': ['/api/projects/financials', '/api/projects/financials?region=texas'],
+    '/api/pivot': ['/api/pivot?rows=DM&cols=STATUS', '/api/pivot?rows=WEEK&cols=REGION&filter=A19:SI'],
+    '/api/sheets/<name>/table': ['/api/sheets/FLO-COM/table', '/api/sheets/TEX-COM/table?filter=STATUS:PAID&limit=20'],
+}
+
+# Rutas que no se miden (disparan efectos secundarios)
+EXCLUDED_ROUTES = {'/api/refresh'}
+
+
+def fill_summary_sheet(sheet, region, rows, rng):
+    """Llena las celdas resumen que lee process_sheet_data() para FLO o TEX"""
+    start = datetime(2025, 6, 2)
+    sheet['C3'] = start
+    sheet['D3'] = start + timedelta(days=60)
+    sheet['C4'] = start + timedelta(days=61)
+    sheet['D4'] = start + timedelta(days=120)
+    sheet['E3'] = rows // 2
+    sheet['F3'] = rows - rows // 2
+    finished = rng.randint(0, rows)
+
+    if region == 'FLO':
+        cells = {
+            'B4': rows // 3, 'B5': finished, 'B6': rows,
+            'B11': finished, 'B12': rows - finished,
+            'C15': rng.randint(0, rows), 'C16': rng.randint(0, rows), 'C17': rng.randint(0, rows),
+            'C18': rng.randint(0, rows), 'C19': rng.randint(0, rows),
+            'B24': rng.randint(0, rows), 'B25': rng.randint(0, rows), 'B26': rng.randint(0, rows),
+            'B30': rng.randint(0, rows), 'B31': rng.randint(0, rows),
+        }
+    else:
+        close = rng.randint(0, rows - finished)
+        cells = {
+            'B4': rows // 3, 'B5': close, 'B6': finished, 'B7': rows,
+            'B12': rows - finished - close, 'B13': finished, 'B14': close,
+            'B18': rng.randint(0, rows), 'B19': rng.randint(0, rows), 'B20': rng.randint(0, rows),
+            'B21': rng.randint(0, rows), 'B22': rng.randint(0, rows),
+            'B26': rng.randint(0, rows), 'B27': rng.randint(0, rows), 'B28': rng.randint(0, rows),
+            'B33': rng.randint(0, rows), 'B34': rng.randint(0, rows), 'B35': rng.randint(0, rows),
+        }
+
+    for cell, value in cells.items():
+        sheet[cell] = value
+
+
+def fill_com_sheet(sheet, prefix, rows, rng):
+    """Llena una hoja COM (FLO-COM / TEX-COM) con filas de tiendas sintéticas"""
+    sheet.append(COM_HEADERS)
+    base_date = datetime(2025, 6, 2)
+
+    for i in range(rows):
+        a19_up = base_date + timedelta(days=rng.randint(0, 180))
+        a19 = rng.choice(['SI', 'NO', 'REPR'])
+        project = rng.choice(PROJECT_TYPES)
+        sheet.append([
+            f"{prefix}{1000 + i}",
+            f"{rng.randint(100, 9999)} Main St",
+            f"555-{rng.randint(1000, 9999)}",
+            f"DM {rng.randint(1, 12)}",
+            f"GM {rng.randint(1, 200)}",
+            a19,
+            rng.choice(['SI', 'NO', 'CLOSE']),
+            rng.choice(['YES', 'NO']),
+            rng.choice(['YES', 'NO']),
+            rng.choice(['YES', 'NO']),
+            rng.choice(['YES', 'NO']),
+            rng.choice(['YES', 'NO']),
+            a19_up if rng.random() > 0.1 else 'TBD',
+            a19_up + timedelta(days=7),
+            a19_up - timedelta(days=14),
+            a19_up + timedelta(days=14),
+            project,
+            rng.randint(800000, 2500000) if project != '---' else None,
+            f"${rng.randint(10000, 90000):,}" if project != '---' else '---',
+            rng.choice(PROJECT_STATUS),
+            a19_up - timedelta(days=3),
+            a19_up - timedelta(days=10),
+            a19_up - timedelta(days=2),
+            rng.choice(['YES', 'NO']),
+        ])
+
+
+def generate_workbook(rows, extra_sheets=0, seed=916):
+    """Genera un workbook sintético con la forma del Excel de SharePoint y devuelve sus bytes"""
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+
+    fill_summary_sheet(wb.create_sheet('FLO'), 'FLO', rows, rng)
+    fill_summary_sheet(wb.create_sheet('TEX'), 'TEX', rows, rng)
+    fill_com_sheet(wb.create_sheet('FLO-COM'), 'FL', rows, rng)
+    fill_com_sheet(wb.create_sheet('TEX-COM'), 'TX', rows, rng)
+
+    # Hojas adicionales no usadas por el dashboard
+    for n in range(extra_sheets):
+        extra = wb.create_sheet(f"EXTRA-{n + 1}")
+        for i in range(rows):
+            extra.append([f"X{i}", rng.random(), rng.randint(0, 1000), 'nota'])
+
+    buffer = BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class SharePointStub:
+    """Servidor HTTP local que responde cualquier GET con el workbook actual"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.payload = b""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = stub.payload
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/download.xlsx"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def benchmark_routes():
+    """Lista las rutas GET /api/* a medir, expandiendo las rutas con parámetros"""
+    paths = []
+    skipped = []
+    matched = set()
+    for rule in sorted(main.app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not rule.rule.startswith('/api/') or 'GET' not in rule.methods:
+            continue
+        if rule.rule in EXCLUDED_ROUTES:
+            continue
+        # PARAM_ROUTES también cubre rutas sin argumentos que necesitan query args (pivot, filtros)
+        if rule.rule in PARAM_ROUTES:
+            paths.extend(PARAM_ROUTES[rule.rule])
+            matched.add(rule.rule)
+        elif rule.arguments:
+            skipped.append(rule.rule)
+        else:
+            paths.append(rule.rule)
+    # Una entrada que no coincide con ninguna ruta GET registrada nunca se mediría
+    unused = sorted(set(PARAM_ROUTES) - matched)
+    if unused:
+        raise RuntimeError(f"PARAM_ROUTES sin ruta GET /api/ registrada: {unused}")
+    return paths, skipped
+
+
+def response_error(status, body):
+    """Mensaje de error de una respuesta (None si es correcta); los endpoints devuelven errores con HTTP 200"""
+    if status >= 400:
+        return f"HTTP {status}"
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and data.get('error'):
+        return str(data['error'])[:200]
+    return None
+
+
+def summarize(samples):
+    """Resumen estadístico de una lista de tiempos en segundos (en ms)"""
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[p95_index] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def time_ingest(repeat):
+    """Mide download_and_process_excel() y el pico de memoria de la ingesta"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        main.download_and_process_excel()
+        samples.append(time.perf_counter() - start)
+        if main.published.snapshot.status != "success":
+            raise RuntimeError(f"La ingesta falló: {main.published.snapshot.status}")
+
+    tracemalloc.start()
+    main.download_and_process_excel()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(samples)
+    result["peak_memory_bytes"] = peak
+    return result
+
+
+def time_routes(requests_per_route, cold=False):
+    """Mide cada ruta /api/* con el test client de Flask (cold: sin caché de respuestas)"""
+    client = main.app.test_client()
+    paths, skipped = benchmark_routes()
+    results = {}
+    # Los endpoints de administración exigen ADMIN_TOKEN: sin uno configurado se usa uno propio
+    if not main.ADMIN_TOKEN:
+        main.ADMIN_TOKEN = secrets.token_hex(16)
+    headers = {'X-Admin-Token': main.ADMIN_TOKEN}
+
+    for path in paths:
+        samples = []
+        size = 0
+        status = error = None
+        for _ in range(requests_per_route):
+            if cold:
+                main.invalidate_response_cache()
+            start = time.perf_counter()
+            response = client.get(path, headers=headers)
+            body = response.get_data()
+            samples.append(time.perf_counter() - start)
+            size = len(body)
+            status = response.status_code
+            error = response_error(status, body)
+        results[path] = summarize(samples)
+        results[path]["bytes"] = size
+        results[path]["status_code"] = status
+        results[path]["error"] = error
+
+    return results, skipped
+
+
+def git_commit():
+    """Commit actual del repo (si git está disponible)"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(row_counts, repeat=3, requests_per_route=20, extra_sheets=0, cache_modes=('warm', 'cold')):
+    """Ejecuta el benchmark completo para cada tamaño de workbook"""
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "rows": row_counts,
+            "repeat": repeat,
+            "requests_per_route": requests_per_route,
+            "extra_sheets": extra_sheets,
+            "cache_modes": list(cache_modes),
+        },
+        "results": []
+    }
+
+    original_url = main.SHAREPOINT_URL
+    original_max_rows = main.COM_MAX_ROWS
+    with SharePointStub() as stub:
+        main.SHAREPOINT_URL = stub.url
+        try:
+            for rows in row_counts:
+                print(f"Generando workbook sintético con {rows} filas por hoja COM...")
+                stub.payload = generate_workbook(rows, extra_sheets=extra_sheets)
+                # Fila 1 = encabezados; se leen todas las tiendas generadas
+                main.COM_MAX_ROWS = {sheet: rows + 1 for sheet in original_max_rows}
+
+                print(f"  Midiendo ingesta ({repeat} repeticiones)...")
+                ingest = time_ingest(repeat)
+
+                result = {
+                    "rows": rows,
+                    "workbook_bytes": len(stub.payload),
+                    "ingest": ingest,
+                }
+                for mode in cache_modes:
+                    print(f"  Midiendo rutas, caché {mode} ({requests_per_route} requests por ruta)...")
+                    routes, skipped = time_routes(requests_per_route, cold=mode == 'cold')
+                    result["routes" if mode == 'warm' else "routes_cold"] = routes
+                    result["skipped_routes"] = skipped
+                    failed = sorted(path for path, route in routes.items() if route["error"])
+                    result["failed_routes" if mode == 'warm' else "failed_routes_cold"] = failed
+                    if failed:
+                        print(f"  Rutas con error ({mode}): {', '.join(failed)}")
+                report["results"].append(result)
+                print(f"  Ingesta: {ingest['median_ms']} ms (pico {ingest['peak_memory_bytes'] / 1e6:.1f} MB)")
+        finally:
+            main.SHAREPOINT_URL = original_url
+            main.COM_MAX_ROWS = original_max_rows
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de ingesta y endpoints del dashboard")
+    parser.add_argument('--rows', default='100,1000,10000',
+                        help="Filas por hoja COM, separadas por coma (default: 100,1000,10000)")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones de la ingesta")
+    parser.add_argument('--requests', type=int, default=20, help="Requests por ruta")
+    parser.add_argument('--extra-sheets', type=int, default=0, help="Hojas adicionales no usadas")
+    parser.add_argument('--cache', choices=['warm', 'cold', 'both'], default='both',
+                        help="Medir rutas con la caché de respuestas caliente, vacía antes de cada request, o ambas")
+    parser.add_argument('--output', default='bench_output.json', help="Archivo JSON de salida")
+    parser.add_argument('--verbose', action='store_true', help="Mantener el logging INFO de main.py")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    # El logging INFO de main.py escribe cada celda y distorsiona los tiempos
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        main.logger.setLevel(logging.WARNING)
+
+    row_counts = [int(r) for r in args.rows.split(',') if r.strip()]
+    report = run_benchmark(row_counts, repeat=args.repeat,
+                           requests_per_route=args.requests, extra_sheets=args.extra_sheets,
+                           cache_modes=['warm', 'cold'] if args.cache == 'both' else [args.cache])
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados escritos en {args.output}")
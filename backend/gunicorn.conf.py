@@ -0,0 +1,58 @@
+# gunicorn.conf.py - Configuración de gunicorn con preload (gunicorn main:app desde backend/)
+#
+# Con preload_app el proceso maestro importa main.py y carga el snapshot una sola vez;
+# los workers lo heredan por fork y comparten esas páginas de memoria (copy-on-write).
+# Para que no se copien, el GC se congela antes del fork: así no escribe en los
+# encabezados de los objetos heredados cuando recorre las generaciones.
+#
+# Después de cada refresco lo que más se sirve no vuelve a multiplicarse por worker: solo
+# un worker (elegido con un lock en SNAPSHOT_DIR) consulta SharePoint y procesa el Excel,
+# y deja las respuestas precalculadas (JSON y variantes gzip/br) en un solo archivo de
+# SNAPSHOT_DIR que todos los workers sirven con mmap desde el page cache. Los demás
+# procesan el Excel (con el mismo número de versión) recién cuando un request pide algo
+# que no está en ese archivo (ver "PUBLICACIÓN COMPARTIDA ENTRE WORKERS" en main.py).
+#
+# Limitación: el snapshot procesado es un grafo de objetos de Python, así que los cambios
+# de refcount al servir requests igual copian parte de las páginas heredadas del maestro.
+# SNAPSHOT_DIR está desactivado por defecto: con más de un worker hay que definirlo
+# explícitamente (un directorio exclusivo de este despliegue).
+import gc
+import os
+import threading
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+if workers > 1 and not os.environ.get('SNAPSHOT_DIR', '').strip():
+    # Sin directorio compartido cada worker tendría sus propias versiones, rollback y refrescos
+    raise RuntimeError("Con WEB_CONCURRENCY > 1 hay que definir SNAPSHOT_DIR (o usar WEB_CONCURRENCY=1)")
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+wsgi_app = 'main:app'
+
+if preload_app:
+    # Sin colecciones durante la importación y la carga inicial del maestro
+    gc.disable()
+
+
+def when_ready(server):
+    """Maestro listo y antes de crear los workers: cargar el snapshot y congelar el GC"""
+    if not preload_app:
+        return
+    import main
+    main.preload_snapshot()
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Snapshot precargado (v{main.published.version}), {gc.get_freeze_count()} objetos congelados")
+
+
+def post_fork(server, worker):
+    """Cada worker reactiva el GC, sigue el snapshot compartido y compite por el scheduler"""
+    import main
+    if preload_app:
+        gc.enable()
+    else:
+        # Sin preload cada worker carga sus datos (el snapshot compartido si es reciente),
+        # en segundo plano para no retrasar el arranque
+        threading.Thread(target=main.load_initial_snapshot, daemon=True).start()
+    main.start_scheduler()
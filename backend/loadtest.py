@@ -0,0 +1,330 @@
+# loadtest.py - Prueba de carga concurrente con refrescos del snapshot en medio
+#
+# Uso:
+#   python loadtest.py --mode both --concurrency 16 --duration 30 --refresh-every 2
+#
+# Sirve varios workbooks sintéticos (benchmark.generate_workbook con distintas semillas)
+# desde el stub local de SharePoint y los va alternando con run_refresh() mientras N
+# clientes golpean la API, en proceso (test client de Flask) y/o por socket (servidor
+# WSGI local). Antes de la carga se registra la huella de cada ruta para cada workbook:
+# una respuesta que no coincide con ninguna es una lectura inconsistente (datos de dos
+# snapshots mezclados). Devuelve código 1 si hay errores o lecturas inconsistentes.
+import argparse
+import atexit
+import hashlib
+import http.client
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.serving import make_server
+
+# Los snapshots sintéticos van a un directorio temporal, nunca al SNAPSHOT_DIR de un servidor real
+os.environ['SNAPSHOT_DIR'] = tempfile.mkdtemp(prefix='dashboard-loadtest-')
+atexit.register(shutil.rmtree, os.environ['SNAPSHOT_DIR'], ignore_errors=True)
+
+import main
+from benchmark import SharePointStub, generate_workbook, git_commit, response_error
+
+DEFAULT_PATHS = [
+    '/api/calendar',
+    '/api/table/projects',
+    '/api/data',
+    '/api/bundle?parts=summary,calendar,tables',
+    '/api/table/florida/detailed',
+    '/api/kpis',
+    '/api/stores/FL1001',
+    '/api/pivot?rows=DM&cols=STATUS',
+]
+
+# Llaves que cambian en cada publicación aunque el workbook sea el mismo (el historial
+# de /api/stores depende de la secuencia de snapshots, no solo del workbook)
+VOLATILE_KEYS = {'last_update', 'checked_at', 'serving_version', 'snapshot_version', 'history'}
+
+
+def strip_volatile(value):
+    """Quita recursivamente las llaves volátiles de un JSON"""
+    if isinstance(value, dict):
+        return {k: strip_volatile(v) for k, v in value.items() if k not in VOLATILE_KEYS}
+    if isinstance(value, list):
+        return [strip_volatile(v) for v in value]
+    return value
+
+
+def fingerprint(body):
+    """Huella del contenido de una respuesta JSON (None si no es JSON)"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return None
+    canonical = json.dumps(strip_volatile(data), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def publish(stub, payload):
+    """Publica un workbook del stub con un refresco y verifica que se aplicó"""
+    stub.payload = payload
+    version = main.published.version
+    main.run_refresh("loadtest")
+    if main.published.version == version:
+        raise RuntimeError(f"El refresco no publicó un snapshot nuevo: {main.published.snapshot.status}")
+
+
+def record_fingerprints(stub, payloads, paths):
+    """Huellas válidas de cada ruta: una por workbook"""
+    client = main.app.test_client()
+    expected = {path: set() for path in paths}
+    for payload in payloads:
+        publish(stub, payload)
+        for path in paths:
+            response = client.get(path)
+            error = response_error(response.status_code, response.get_data())
+            if error:
+                raise RuntimeError(f"{path} falla antes de la carga: {error}")
+            expected[path].add(fingerprint(response.get_data()))
+    return expected
+
+
+class InProcessClient:
+    """Cliente con el test client de Flask (sin red)"""
+
+    def __init__(self):
+        self.client = main.app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class SocketClient:
+    """Cliente HTTP sobre el servidor WSGI local"""
+
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def get(self, path):
+        self.connection.request('GET', path)
+        response = self.connection.getresponse()
+        return response.status, response.read()
+
+    def close(self):
+        self.connection.close()
+
+
+class LoadStats:
+    """Resultados acumulados por ruta (protegidos con un lock)"""
+
+    def __init__(self, paths):
+        self.lock = threading.Lock()
+        self.paths = {path: {"latencies": [], "errors": 0, "inconsistent": 0} for path in paths}
+        self.samples = []
+
+    def record(self, path, latency, error, inconsistent):
+        with self.lock:
+            stats = self.paths[path]
+            stats["latencies"].append(latency)
+            if error:
+                stats["errors"] += 1
+                if len(self.samples) < 20:
+                    self.samples.append({"path": path, "error": error})
+            if inconsistent:
+                stats["inconsistent"] += 1
+                if len(self.samples) < 20:
+                    self.samples.append({"path": path, "error": "lectura inconsistente"})
+
+
+def run_clients(make_client, paths, expected, concurrency, duration, stats, stop):
+    """Lanza los clientes; cada uno recorre las rutas en orden rotado hasta que se acaba el tiempo"""
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        client = make_client()
+        index = offset
+        try:
+            while time.perf_counter() < deadline and not stop.is_set():
+                path = paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    status, body = client.get(path)
+                    error = response_error(status, body)
+                except Exception as e:
+                    status, body, error = None, b'', f"{type(e).__name__}: {e}"
+                latency = time.perf_counter() - start
+                inconsistent = False
+                if not error:
+                    print_ = fingerprint(body)
+                    inconsistent = print_ is not None and print_ not in expected[path]
+                stats.record(path, latency, error, inconsistent)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def run_refresher(stub, payloads, every, stop, log):
+    """Alterna los workbooks del stub y refresca cada `every` segundos"""
+    index = 0
+    while not stop.wait(every):
+        index += 1
+        start = time.perf_counter()
+        try:
+            publish(stub, payloads[index % len(payloads)])
+            log.append({"seconds": round(time.perf_counter() - start, 3), "version": main.published.version})
+        except Exception as e:
+            log.append({"seconds": round(time.perf_counter() - start, 3), "error": str(e)})
+
+
+def summarize_run(mode, stats, elapsed, refreshes):
+    """Throughput, latencias y errores de una corrida"""
+    routes = {}
+    all_latencies = []
+    total_errors = total_inconsistent = 0
+    for path, data in stats.paths.items():
+        ordered = sorted(data["latencies"])
+        all_latencies.extend(ordered)
+        total_errors += data["errors"]
+        total_inconsistent += data["inconsistent"]
+        routes[path] = {
+            "requests": len(ordered),
+            "p50_ms": round(percentile(ordered, 0.5) * 1000, 3) if ordered else None,
+            "p99_ms": round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+            "errors": data["errors"],
+            "inconsistent": data["inconsistent"],
+        }
+    all_latencies.sort()
+    requests_total = len(all_latencies)
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "requests": requests_total,
+        "throughput_rps": round(requests_total / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(all_latencies, 0.5) * 1000, 3) if all_latencies else None,
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 3) if all_latencies else None,
+        "errors": total_errors,
+        "error_rate": round(total_errors / requests_total, 5) if requests_total else None,
+        "inconsistent_reads": total_inconsistent,
+        "refreshes": refreshes,
+        "refresh_failures": sum(1 for r in refreshes if "error" in r),
+        "routes": routes,
+        "error_samples": stats.samples,
+    }
+
+
+def run_mode(mode, stub, payloads, paths, expected, args):
+    """Una corrida de carga (inprocess o socket) con refrescos en paralelo"""
+    server = None
+    if mode == 'socket':
+        server = make_server('127.0.0.1', 0, main.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_port
+        make_client = lambda: SocketClient(port)
+    else:
+        make_client = InProcessClient
+
+    stats = LoadStats(paths)
+    stop = threading.Event()
+    refreshes = []
+    refresher = threading.Thread(target=run_refresher, args=(stub, payloads, args.refresh_every, stop, refreshes), daemon=True)
+    start = time.perf_counter()
+    refresher.start()
+    try:
+        run_clients(make_client, paths, expected, args.concurrency, args.duration, stats, stop)
+    finally:
+        stop.set()
+        refresher.join()
+        if server is not None:
+            server.shutdown()
+    return summarize_run(mode, stats, time.perf_counter() - start, refreshes)
+
+
+def run_loadtest(args):
+    """Prepara los workbooks, registra las huellas y ejecuta las corridas pedidas"""
+    paths = args.paths or DEFAULT_PATHS
+    modes = ['inprocess', 'socket'] if args.mode == 'both' else [args.mode]
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "settings": {
+            "modes": modes,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "refresh_every": args.refresh_every,
+            "rows": args.rows,
+            "variants": args.variants,
+            "paths": paths,
+        },
+        "runs": []
+    }
+
+    original_url = main.SHAREPOINT_URL
+    with SharePointStub() as stub:
+        main.SHAREPOINT_URL = stub.url
+        try:
+            print(f"Generando {args.variants} workbooks sintéticos de {args.rows} filas...")
+            payloads = [generate_workbook(args.rows, seed=916 + i) for i in range(args.variants)]
+            print("Registrando huellas de cada ruta por workbook...")
+            expected = record_fingerprints(stub, payloads, paths)
+
+            for mode in modes:
+                print(f"Carga {mode}: {args.concurrency} clientes durante {args.duration}s, refresco cada {args.refresh_every}s...")
+                result = run_mode(mode, stub, payloads, paths, expected, args)
+                report["runs"].append(result)
+                print(f"  {result['throughput_rps']} req/s, p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+                      f"errores {result['errors']}, inconsistentes {result['inconsistent_reads']}, "
+                      f"refrescos {len(result['refreshes'])}")
+        finally:
+            main.SHAREPOINT_URL = original_url
+
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga con refrescos del snapshot en paralelo")
+    parser.add_argument('--mode', choices=['inprocess', 'socket', 'both'], default='both')
+    parser.add_argument('--concurrency', type=int, default=16, help="Clientes concurrentes")
+    parser.add_argument('--duration', type=float, default=30, help="Segundos por corrida")
+    parser.add_argument('--refresh-every', type=float, default=2, help="Segundos entre refrescos")
+    parser.add_argument('--rows', type=int, default=200, help="Filas por hoja COM de cada workbook")
+    parser.add_argument('--variants', type=int, default=3, help="Workbooks distintos que se alternan")
+    parser.add_argument('--paths', nargs='*', help="Rutas a probar (default: rutas de calendario, tablas y datos)")
+    parser.add_argument('--output', default='loadtest_output.json', help="Archivo JSON de salida")
+    parser.add_argument('--max-error-rate', type=float, default=0.0, help="Tasa de error tolerada antes de fallar")
+    parser.add_argument('--verbose', action='store_true', help="Mantener el logging INFO de main.py")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        main.logger.setLevel(logging.WARNING)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    report = run_loadtest(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultados escritos en {args.output}")
+
+    failed = any(run["inconsistent_reads"] or (run["error_rate"] or 0) > args.max_error_rate
+                 for run in report["runs"])
+    raise SystemExit(1 if failed else 0)
@@ -1,15 +1,43 @@
 # main.py - Backend completo con nuevas funcionalidades y fechas de remodelación
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, jsonify, send_from_directory, request, g
 from flask_cors import CORS
 import requests
-import openpyxl
-from io import BytesIO
-import schedule
+from io import BytesIO, StringIO
+import csv
+import tempfile
 import time
 import threading
 from datetime import datetime, timedelta
+from dataclasses import dataclass, field, replace
+from contextlib import contextmanager
+from typing import Optional
 import os
 import logging
+import cProfile
+import pstats
+import functools
+import hashlib
+import hmac
+import json
+import mimetypes
+import mmap
+import re
+import math
+from array import array
+import random
+from collections import Counter, deque
+import gzip
+from collections import OrderedDict
+
+try:
+    import brotli  # Opcional: variantes br además de gzip
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl  # Elección del worker que corre el scheduler (solo POSIX)
+except ImportError:
+    fcntl = None
 
 # Configurar logging para debug
 logging.basicConfig(level=logging.INFO)
@@ -18,65 +46,978 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
-# Variables globales
-dashboard_data = {
-    "last_update": None,
-    "florida_data": {},
-    "texas_data": {},
-    "global_data": {},
-    "remodel_dates": {},
-    "status": "waiting"
+# MODELO TIPADO DEL SNAPSHOT
+# Los valores numéricos se normalizan una sola vez en la ingesta; None = no aplica a la región
+# (no se incluye en el JSON, igual que las llaves que antes no existían en cada dict).
+
+def to_number(value):
+    """Normaliza un valor del Excel a float (0 para TBD, ---, vacíos o texto no numérico)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return 0.0
+
+def zero_if_none(value):
+    """0 para los campos que no aplican a la región"""
+    return value if value is not None else 0
+
+class SnapshotModel:
+    """Base de las secciones del snapshot: valida los números y serializa en una pasada"""
+    __slots__ = ()
+
+    def __post_init__(self):
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None and not isinstance(value, SnapshotModel):
+                object.__setattr__(self, name, to_number(value))
+
+    def to_dict(self):
+        result = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                result[name] = value.to_dict() if isinstance(value, SnapshotModel) else value
+        return result
+
+@dataclass(frozen=True, slots=True)
+class Aloha19Summary(SnapshotModel):
+    june: Optional[float] = None
+    july: Optional[float] = None
+    august: Optional[float] = None
+    stage2: Optional[float] = None
+    close: Optional[float] = None
+    finished: Optional[float] = None
+    total: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class WiringSummary(SnapshotModel):
+    pending: Optional[float] = None
+    finished: Optional[float] = None
+    close: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class TechnologiesSummary(SnapshotModel):
+    fresh_ai: Optional[float] = None
+    edmb: Optional[float] = None
+    idmb: Optional[float] = None
+    qb: Optional[float] = None
+    kiosk: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class ProjectsSummary(SnapshotModel):
+    signed: Optional[float] = None
+    quote: Optional[float] = None
+    paid: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class ProjectTypesSummary(SnapshotModel):
+    edmb: Optional[float] = None
+    edmb_idmb_qb: Optional[float] = None
+    fai_edmb_idmb_qb: Optional[float] = None
+    idmb_qb: Optional[float] = None
+
+@dataclass(frozen=True, slots=True)
+class RegionSummary(SnapshotModel):
+    """Datos resumen de una hoja regional (FLO o TEX)"""
+    aloha19: Aloha19Summary = field(default_factory=Aloha19Summary)
+    wiring: WiringSummary = field(default_factory=WiringSummary)
+    technologies: TechnologiesSummary = field(default_factory=TechnologiesSummary)
+    projects: ProjectsSummary = field(default_factory=ProjectsSummary)
+    project_types: ProjectTypesSummary = field(default_factory=ProjectTypesSummary)
+
+@dataclass(frozen=True, slots=True)
+class GlobalSummary(SnapshotModel):
+    """Datos combinados de Florida y Texas"""
+    aloha19: Aloha19Summary = field(default_factory=Aloha19Summary)
+    wiring: WiringSummary = field(default_factory=WiringSummary)
+    technologies: TechnologiesSummary = field(default_factory=TechnologiesSummary)
+    projects: ProjectsSummary = field(default_factory=ProjectsSummary)
+    project_types_florida: ProjectTypesSummary = field(default_factory=ProjectTypesSummary)
+    project_types_texas: ProjectTypesSummary = field(default_factory=ProjectTypesSummary)
+
+@dataclass(frozen=True, slots=True)
+class DashboardSnapshot:
+    """Snapshot publicado del dashboard (se reemplaza completo en cada refresco)"""
+    last_update: Optional[str] = None
+    status: str = "waiting"
+    florida_data: Optional[RegionSummary] = None
+    texas_data: Optional[RegionSummary] = None
+    global_data: Optional[GlobalSummary] = None
+    remodel_dates: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        """Serializa al formato JSON original de /api/data"""
+        return {
+            "last_update": self.last_update,
+            "florida_data": self.florida_data.to_dict() if self.florida_data else {},
+            "texas_data": self.texas_data.to_dict() if self.texas_data else {},
+            "global_data": self.global_data.to_dict() if self.global_data else {},
+            "remodel_dates": self.remodel_dates,
+            "status": self.status
+        }
+
+def empty_region_views():
+    return {"last_update": None, "florida": {}, "texas": {}, "global": {}}
+
+@dataclass(frozen=True, slots=True)
+class PublishedState:
+    """Todo lo que sirve la API para una versión; la ingesta lo reemplaza con una sola asignación.
+    Cada request toma `current = published` una vez y lee solo de ahí, así nunca mezcla versiones."""
+    snapshot: DashboardSnapshot = field(default_factory=DashboardSnapshot)
+    version: int = 0  # Se incrementa cada vez que se publica un snapshot nuevo
+    content_hash: Optional[str] = None  # sha256 del Excel del snapshot
+    fetched_at: Optional[str] = None  # Cuándo se obtuvo el Excel de la fuente (ISO); base de X-Data-Age
+    workbook: Optional[object] = None  # LazyWorkbook del snapshot
+    quality_report: dict = field(default_factory=lambda: {
+        "status": "not_checked",
+        "checked_at": None,
+        "checks": [],
+        "cell_anomalies": []
+    })
+    kpis: dict = field(default_factory=empty_region_views)      # KPIs precalculados para las tarjetas del dashboard
+    forecast: dict = field(default_factory=empty_region_views)  # Pronóstico de fin del rollout
+    store_index: dict = field(default_factory=dict)  # STORE -> registro combinado de FLO-COM / TEX-COM
+    pivot_cube: dict = field(default_factory=dict)   # (REGION, DM, GM, A19, WIRING, PROJECT, STATUS, WEEK) -> tiendas
+    financials: dict = field(default_factory=lambda: {"REGION": [], "PROJECT": [], "STATUS": [],
+                                                      "auv": array('d'), "cost": array('d')})
+    event_revisions: dict = field(default_factory=dict)  # UID -> {"hash", "stamp", "sequence"} de los eventos del .ics
+
+# Variable global: solo se reasigna completa (nunca se modifica un campo en su lugar)
+published = PublishedState()
+
+BURN_RATE_WEEKS = int(os.environ.get('BURN_RATE_WEEKS', 4))  # Semanas para el promedio de avance
+
+FORECAST_Z = 1.645          # Banda de confianza del 90%
+FORECAST_MAX_WEEKS = 520    # Horizonte máximo de proyección (10 años)
+
+# URL del SharePoint (se puede sobreescribir con SHAREPOINT_URL, p. ej. para benchmarks)
+#SharePoint del Excel de remodelación de tiendas Graficas
+SHAREPOINT_URL = os.environ.get(
+    'SHAREPOINT_URL',
+    "https://916foods-my.sharepoint.com/personal/it_support_916foods_com/_layouts/15/download.aspx?share=EZEBqKqQF9pFitMhSuZPwj4B4xV5tW0qtHLdceNN5-I9Ug"
+)
+# Share point del Excel de remodelación de tiendas c/ Marco
+SHAREPOINT_URL_SHP = "https://916foods-my.sharepoint.com/personal/it_support_916foods_com/_layouts/15/download.aspx?share=EZb5NHihKQ9Lnysp--9gH0UBOkCr7K-3Ud_mPhC2At2PPQ"
+
+# CACHÉ DE RESPUESTAS POR ENDPOINT (se invalida al publicar un snapshot nuevo)
+
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+RESPONSE_CACHE_BYTES = int(os.environ.get('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024))  # Cuerpo + variantes comprimidas
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))  # No comprimir respuestas pequeñas
+# Niveles (gzip, brotli): máximos solo fuera del request (prewarm, estáticos); baratos en un MISS
+COMPRESS_LEVELS_MAX = (9, 11)
+COMPRESS_LEVELS_FAST = (6, 5)
+RESPONSE_PREWARM = os.environ.get('RESPONSE_PREWARM', '1') == '1'
+
+# Rutas que se precalculan (y comprimen) al publicar cada snapshot. Los query args son parte
+# de la clave de la caché: van exactamente como los pide el frontend (frontend/index.html)
+PREWARM_PATHS = [
+    '/api/data',
+    '/api/kpis',
+    '/api/bundle?parts=summary,calendar',
+    '/api/calendar',
+    '/api/remodel-dates',
+    '/api/table/florida/detailed',
+    '/api/table/texas/detailed',
+    '/api/table/projects'
+]
+
+response_cache = OrderedDict()
+response_cache_lock = threading.Lock()
+response_cache_state = {"generation": 0, "hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+
+def invalidate_response_cache():
+    """Vacía la caché; las respuestas en curso de la generación anterior no se guardan"""
+    with response_cache_lock:
+        response_cache_state["generation"] += 1
+        response_cache_state["bytes"] = 0
+        response_cache.clear()
+
+def response_cache_key():
+    """Clave: generación + ruta + query args normalizados (sin importar el orden)"""
+    args = tuple(sorted(
+        (key, tuple(sorted(value.strip() for value in values)))
+        for key, values in request.args.lists()
+    ))
+    return (response_cache_state["generation"], request.path, args)
+
+def compress_variants(body, levels=COMPRESS_LEVELS_MAX):
+    """Variantes gzip/br del cuerpo, calculadas una sola vez al guardarlo en caché"""
+    variants = {}
+    if len(body) < COMPRESS_MIN_BYTES:
+        return variants
+    gzip_level, brotli_quality = levels
+    variants['gzip'] = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    if brotli is not None:
+        variants['br'] = brotli.compress(body, quality=brotli_quality)
+    return variants
+
+def is_prewarm_request():
+    """Request interno de prewarm_response_cache (no se puede marcar desde afuera)"""
+    return bool(request.environ.get('dashboard.prewarm'))
+
+def cache_entry_bytes(entry):
+    """Bytes que ocupa una entrada: cuerpo original más sus variantes comprimidas"""
+    body, _, _, variants = entry
+    return len(body) + sum(len(v) for v in variants.values())
+
+def cached_entry_response(entry, cache_status):
+    """Respuesta desde una entrada de caché, con la codificación que acepte el cliente"""
+    body, status, mimetype, variants = entry
+    encoding = request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in variants])
+    # Las entradas del paquete compartido son vistas de un mmap: se copian solo al responder
+    data = bytes(variants[encoding] if encoding else body)
+    response = app.response_class(data, status=status, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if variants:
+        response.vary.add('Accept-Encoding')
+    response.headers['X-Cache'] = cache_status
+    return response
+
+def cached_response(view):
+    """Cachea la respuesta JSON de un endpoint GET hasta el próximo snapshot (LRU acotado)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = response_cache_key()
+        with response_cache_lock:
+            entry = response_cache.get(key)
+            if entry is not None:
+                response_cache.move_to_end(key)
+                response_cache_state["hits"] += 1
+        if entry is not None:
+            return cached_entry_response(entry, 'HIT')
+        if shared_state["pending"] is not None:
+            # Fuera del paquete compartido: procesar antes el Excel de la versión servida
+            load_pending_snapshot()
+            return wrapper(*args, **kwargs)
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        body = response.get_data()
+        # El prewarm corre al publicar el snapshot y puede pagar la compresión máxima;
+        # un MISS de un cliente usa niveles baratos para no cargar el hilo del request
+        levels = COMPRESS_LEVELS_MAX if is_prewarm_request() else COMPRESS_LEVELS_FAST
+        entry = (body, response.status_code, response.mimetype, compress_variants(body, levels))
+        with response_cache_lock:
+            response_cache_state["misses"] += 1
+            size = cache_entry_bytes(entry)
+            # Si hubo un snapshot nuevo mientras se generaba (o no cabe en el presupuesto), no guardar
+            if key[0] == response_cache_state["generation"] and size <= RESPONSE_CACHE_BYTES:
+                previous = response_cache.pop(key, None)
+                if previous is not None:
+                    response_cache_state["bytes"] -= cache_entry_bytes(previous)
+                response_cache[key] = entry
+                response_cache_state["bytes"] += size
+                while len(response_cache) > RESPONSE_CACHE_SIZE or response_cache_state["bytes"] > RESPONSE_CACHE_BYTES:
+                    _, evicted = response_cache.popitem(last=False)
+                    response_cache_state["bytes"] -= cache_entry_bytes(evicted)
+                    response_cache_state["evictions"] += 1
+        return cached_entry_response(entry, 'MISS')
+    wrapper.response_cached = True
+    return wrapper
+
+def prewarm_response_cache():
+    """Genera y comprime las respuestas más pedidas apenas se publica el snapshot"""
+    if not RESPONSE_PREWARM:
+        return
+    try:
+        client = app.test_client()
+        for path in PREWARM_PATHS:
+            client.get(path, environ_overrides={'dashboard.prewarm': True})
+        logger.info(f"Caché de respuestas precalculada ({len(PREWARM_PATHS)} rutas)")
+    except Exception as e:
+        logger.error(f"Error precalculando caché de respuestas: {str(e)}")
+
+# FRESCURA DE LOS DATOS (stale-while-revalidate con último snapshot válido)
+
+DATA_SOURCE = "sharepoint"
+FRESH_SECONDS = int(os.environ.get('FRESH_SECONDS', 45 * 60))         # Hasta aquí los datos son "fresh"
+STALE_SECONDS = int(os.environ.get('STALE_SECONDS', 2 * 60 * 60))     # Hasta aquí "stale", después "expired"
+RETRY_BASE_SECONDS = int(os.environ.get('RETRY_BASE_SECONDS', 60))    # Primer reintento tras un fallo
+RETRY_MAX_SECONDS = int(os.environ.get('RETRY_MAX_SECONDS', 30 * 60)) # Tope del backoff exponencial
+
+freshness_state = {}
+freshness_lock = threading.Lock()
+retry_timer = None
+
+def source_state(source):
+    """Estado de frescura de una fuente (se crea al primer uso)"""
+    return freshness_state.setdefault(source, {
+        "last_attempt": None,
+        "last_success": None,
+        "last_error": None,
+        "consecutive_failures": 0,
+        "next_retry": None,
+        "content_hash": None,
+        "last_change": None
+    })
+
+def record_source_success(source, content_hash=None):
+    """Registra un refresco exitoso (y si el contenido cambió) y cancela el reintento pendiente"""
+    global retry_timer
+    with freshness_lock:
+        state = source_state(source)
+        state["last_attempt"] = state["last_success"] = datetime.now()
+        if content_hash and content_hash != state["content_hash"]:
+            state["content_hash"] = content_hash
+            state["last_change"] = state["last_success"]
+        state["last_error"] = None
+        state["consecutive_failures"] = 0
+        state["next_retry"] = None
+        if retry_timer is not None:
+            retry_timer.cancel()
+            retry_timer = None
+
+def record_source_failure(source, error, retry=True):
+    """Registra un fallo y programa un reintento con backoff exponencial"""
+    global retry_timer
+    with freshness_lock:
+        state = source_state(source)
+        state["last_attempt"] = datetime.now()
+        state["last_error"] = error
+        state["consecutive_failures"] += 1
+        if not retry:
+            logger.warning(f"Fuente {source} falló ({state['consecutive_failures']} seguidos), sin reintento")
+            return
+        delay = min(RETRY_BASE_SECONDS * 2 ** (state["consecutive_failures"] - 1), RETRY_MAX_SECONDS)
+        state["next_retry"] = datetime.now() + timedelta(seconds=delay)
+
+        if retry_timer is not None:
+            retry_timer.cancel()
+        retry_timer = threading.Timer(delay, run_refresh, args=("retry", source))
+        retry_timer.daemon = True
+        retry_timer.start()
+    logger.warning(f"Fuente {source} falló ({state['consecutive_failures']} seguidos), reintento en {delay}s")
+
+def data_age_seconds():
+    """Segundos desde que se obtuvo de la fuente el snapshot publicado (None si no hay ninguno).
+    Un rollback o un worker que sigue a otro conservan la fecha de la descarga original"""
+    pending = shared_state["pending"]
+    fetched_at = parse_iso_timestamp(
+        (pending.get("fetched_at") or pending["published"]) if pending else published.fetched_at)
+    if fetched_at is None:
+        return None
+    return max(0, int((datetime.now() - fetched_at).total_seconds()))
+
+def freshness_level(age):
+    """fresh / stale / expired según la edad de los datos; unavailable si no hay datos"""
+    if age is None:
+        return "unavailable"
+    if age <= FRESH_SECONDS:
+        return "fresh"
+    if age <= STALE_SECONDS:
+        return "stale"
+    return "expired"
+
+# VALIDACIÓN DE CALIDAD DE DATOS
+
+QUALITY_STRICT = os.environ.get('QUALITY_STRICT', '0') == '1'  # Rechazar snapshots con errores graves
+
+ingest_context = threading.local()  # Anomalías de celdas de la ingesta en curso
+
+# Valores de la columna M que no son fechas (los mismos que ignora el calendario)
+NON_DATE_MARKERS = ['FINISHED', 'TBD', '---', '', ' ', 'CLOSE']
+
+def quality_check(name, region, passed, severity, message, details=None):
+    """Resultado de una validación ('error' bloquea en modo estricto, 'warning' solo informa)"""
+    result = {
+        "check": name,
+        "region": region,
+        "passed": bool(passed),
+        "severity": severity,
+        "message": message
+    }
+    if details:
+        result["details"] = details
+    return result
+
+def check_region_summary(region, data):
+    """Invariantes entre campos de la hoja resumen de una región"""
+    checks = []
+    if data is None:
+        checks.append(quality_check("summary_parsed", region, False, "error",
+                                    "La hoja resumen no se pudo procesar"))
+        return checks
+
+    z = zero_if_none
+    total = z(data.aloha19.total)
+    finished = z(data.aloha19.finished)
+    checks.append(quality_check("total_positive", region, total > 0, "error",
+                                f"Total de tiendas = {total}"))
+    checks.append(quality_check("finished_le_total", region, finished <= total, "error",
+                                f"Aloha19 finished ({finished}) <= total ({total})"))
+
+    wiring_sum = z(data.wiring.pending) + z(data.wiring.finished) + z(data.wiring.close)
+    checks.append(quality_check("wiring_matches_total", region, wiring_sum == total, "warning",
+                                f"Wiring pending+finished+close ({wiring_sum}) = total ({total})"))
+    checks.append(quality_check("wiring_finished_le_total", region, z(data.wiring.finished) <= total, "error",
+                                f"Wiring finished ({z(data.wiring.finished)}) <= total ({total})"))
+    return checks
+
+def parse_report_date(value):
+    """Fecha MM/DD/YYYY de las fechas de remodelación (None si es TBD o no se reconoce)"""
+    try:
+        return datetime.strptime(value, "%m/%d/%Y")
+    except (TypeError, ValueError):
+        return None
+
+def check_remodel_dates(remodel_dates):
+    """Orden de las etapas: stage1 start <= end, stage2 start <= end, stage1 <= stage2"""
+    checks = []
+    for region, dates in (remodel_dates.get("regional_details") or {}).items():
+        parsed = {}
+        unparsed = []
+        for key in ("stage1_start", "stage1_end", "stage2_start", "stage2_end"):
+            value = dates.get(key)
+            parsed[key] = parse_report_date(value)
+            if parsed[key] is None and value not in (None, "TBD"):
+                unparsed.append(f"{key}={value}")
+        checks.append(quality_check("remodel_dates_parseable", region, not unparsed, "warning",
+                                    "Fechas de remodelación reconocidas", unparsed))
+
+        for first, second, severity in (("stage1_start", "stage1_end", "error"),
+                                        ("stage2_start", "stage2_end", "error"),
+                                        ("stage1_start", "stage2_start", "warning")):
+            if parsed[first] and parsed[second]:
+                checks.append(quality_check(f"{first}_le_{second}", region,
+                                            parsed[first] <= parsed[second], severity,
+                                            f"{first} ({dates[first]}) <= {second} ({dates[second]})"))
+    return checks
+
+def check_com_sheet(wb, sheet_name, region, summary):
+    """Validaciones por fila de una hoja COM, en una sola pasada sobre todas las filas"""
+    if not wb or sheet_name not in wb.sheetnames:
+        return [quality_check("com_sheet_present", region, False, "warning",
+                              f"Hoja {sheet_name} no encontrada")]
+
+    sheet = wb[sheet_name]
+    max_row = table_max_row(sheet_name, sheet)
+    stores = []
+    bad_dates = []
+    remod_inverted = []
+
+    # Columnas A (STORE), M (A19 UP), O (START REMOD) y P (END REMOD)
+    for row_num, row in enumerate(sheet.iter_rows(min_row=2, max_row=max_row, max_col=16, values_only=True), start=2):
+        row = tuple(row) + (None,) * (16 - len(row))
+        store, a19_up, start_remod, end_remod = row[0], row[12], row[14], row[15]
+        if store not in (None, "", " ", "---"):
+            stores.append(str(store).strip())
+        if a19_up and a19_up not in NON_DATE_MARKERS and parse_date_for_calendar(a19_up) is None:
+            bad_dates.append(f"M{row_num}={a19_up}")
+        start_date = parse_date_for_calendar(start_remod) if start_remod else None
+        end_date = parse_date_for_calendar(end_remod) if end_remod else None
+        if start_date and end_date and start_date > end_date:
+            remod_inverted.append(f"fila {row_num}")
+
+    duplicates = sorted(store for store, count in Counter(stores).items() if count > 1)
+    total = zero_if_none(summary.aloha19.total) if summary else 0
+
+    return [
+        quality_check("com_rows_match_total", region, len(stores) == total, "warning",
+                      f"Filas con tienda en {sheet_name} ({len(stores)}) = total resumen ({total})"),
+        quality_check("com_unique_stores", region, not duplicates, "warning",
+                      f"Tiendas duplicadas en {sheet_name}", duplicates),
+        quality_check("com_a19_up_dates", region, not bad_dates, "warning",
+                      f"Fechas A19 UP reconocidas en {sheet_name}", bad_dates),
+        quality_check("com_remod_order", region, not remod_inverted, "warning",
+                      f"START REMOD <= END REMOD en {sheet_name}", remod_inverted)
+    ]
+
+def validate_snapshot(wb, florida_data, texas_data, remodel_dates, anomalies):
+    """Ejecuta todas las validaciones de la ingesta y arma el reporte"""
+    checks = []
+    checks += check_region_summary("florida", florida_data)
+    checks += check_region_summary("texas", texas_data)
+    checks += check_remodel_dates(remodel_dates)
+    checks += check_com_sheet(wb, 'FLO-COM', "florida", florida_data)
+    checks += check_com_sheet(wb, 'TEX-COM', "texas", texas_data)
+
+    errors = sum(1 for c in checks if not c["passed"] and c["severity"] == "error")
+    warnings = sum(1 for c in checks if not c["passed"] and c["severity"] == "warning")
+    if errors:
+        status = "failed"
+    elif warnings or anomalies:
+        status = "warnings"
+    else:
+        status = "passed"
+
+    return {
+        "status": status,
+        "checked_at": datetime.now().isoformat(),
+        "errors": errors,
+        "warnings": warnings,
+        "anomaly_count": len(anomalies),
+        "checks": checks,
+        "cell_anomalies": anomalies
+    }
+
+# PROFILING OPCIONAL (se arma desde /api/admin/profile, sin costo si no está armado)
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # Se exige en X-Admin-Token; sin definir, /api/admin/* y /api/upload quedan cerrados
+MAX_STORED_PROFILES = 50  # Resúmenes en memoria y archivos .prof en PROFILE_DIR
+MAX_PROFILE_COUNT = 20    # Tope de refrescos/requests que se pueden armar de una vez
+
+profiling_state = {
+    "refresh": 0,          # Refrescos pendientes por perfilar
+    "request": 0,          # Requests pendientes por perfilar
+    "request_path": None,  # Prefijo de ruta a perfilar (None = cualquiera)
+    "profiles": []         # Resúmenes de los perfiles guardados
 }
+profiling_lock = threading.Lock()
 
-workbook = None  # Variable global para el workbook
+def take_profiler_slot(target, path=None):
+    """Consume un turno de profiling para 'refresh' o 'request' si está armado"""
+    with profiling_lock:
+        if profiling_state[target] <= 0:
+            return False
+        if target == "request" and profiling_state["request_path"]:
+            if not path or not path.startswith(profiling_state["request_path"]):
+                return False
+        profiling_state[target] -= 1
+        return True
 
-def download_and_process_excel():
-    """Descarga el Excel de SharePoint y procesa los datos"""
-    global dashboard_data, workbook
-    
+def start_profiler():
+    """Inicia un cProfile; devuelve None si ya hay otro profiler activo"""
+    profiler = cProfile.Profile()
     try:
-        logger.info("Iniciando descarga de SharePoint...")
-        
-        # URL del SharePoint
-        #SharePoint del Excel de remodelación de tiendas Graficas
-        url = "https://916foods-my.sharepoint.com/personal/it_support_916foods_com/_layouts/15/download.aspx?share=EZEBqKqQF9pFitMhSuZPwj4B4xV5tW0qtHLdceNN5-I9Ug"
-        # Share point del Excel de remodelación de tiendas c/ Marco
-        url_shp = "https://916foods-my.sharepoint.com/personal/it_support_916foods_com/_layouts/15/download.aspx?share=EZb5NHihKQ9Lnysp--9gH0UBOkCr7K-3Ud_mPhC2At2PPQ"
-        # Headers para evitar bloqueos
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        profiler.enable()
+    except ValueError as e:
+        logger.warning(f"No se pudo iniciar el profiler: {str(e)}")
+        return None
+    return profiler
+
+def summarize_profile(profiler, limit=15):
+    """Top de funciones por tiempo acumulado de un perfil"""
+    stats = pstats.Stats(profiler)
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, callers) in stats.stats.items():
+        rows.append({
+            "function": f"{os.path.basename(filename)}:{line}({func})",
+            "ncalls": nc,
+            "tottime": round(tt, 6),
+            "cumtime": round(ct, 6)
+        })
+    rows.sort(key=lambda r: r["cumtime"], reverse=True)
+    return {"total_time": round(stats.total_tt, 6), "top_functions": rows[:limit]}
+
+def save_profile(profiler, target, label):
+    """Guarda el perfil en disco y registra su resumen"""
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        safe_label = label.strip('/').replace('/', '_') or "root"
+        filename = f"{target}-{safe_label}-{timestamp}.prof"
+        profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+
+        summary = {
+            "file": filename,
+            "target": target,
+            "label": label,
+            "created": datetime.now().isoformat(),
+            **summarize_profile(profiler)
         }
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        logger.info(f"Respuesta SharePoint: Status {response.status_code}, Tamaño: {len(response.content)} bytes")
-        
-        response.raise_for_status()
+        with profiling_lock:
+            profiling_state["profiles"].append(summary)
+            del profiling_state["profiles"][:-MAX_STORED_PROFILES]
+        prune_profiles()
+        logger.info(f"Perfil guardado: {filename} ({summary['total_time']}s)")
+    except Exception as e:
+        logger.error(f"Error guardando perfil {target}: {str(e)}")
+
+def prune_profiles():
+    """Borra los .prof más viejos de PROFILE_DIR por encima de MAX_STORED_PROFILES"""
+    files = [os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")]
+    files.sort(key=os.path.getmtime)
+    for path in files[:-MAX_STORED_PROFILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def profiled_refresh(func):
+    """Perfila la función de refresco cuando el profiler está armado"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not profiling_state["refresh"] or not take_profiler_slot("refresh"):
+            return func(*args, **kwargs)
+        profiler = start_profiler()
+        if profiler is None:
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            save_profile(profiler, "refresh", func.__name__)
+    return wrapper
+
+# CARGA PEREZOSA DE HOJAS DEL WORKBOOK
+
+# Hojas que usa el dashboard; las demás se leen solo cuando algún endpoint las pide
+EAGER_SHEETS = ('FLO', 'TEX', 'FLO-COM', 'TEX-COM')
+
+class SheetCell:
+    """Celda ya leída (solo expone .value, como usan los lectores de celdas)"""
+    __slots__ = ('value',)
+    
+    def __init__(self, value):
+        self.value = value
+
+def split_coordinate(coordinate):
+    """'AB12' -> (28, 12): índice de columna (base 1) y fila"""
+    column = 0
+    for position, char in enumerate(coordinate):
+        if char.isdigit():
+            return column, int(coordinate[position:])
+        column = column * 26 + ord(char.upper()) - 64
+    raise ValueError(f"Coordenada no válida: {coordinate}")
+
+class MaterializedSheet:
+    """Hoja leída una sola vez a memoria con acceso por coordenada (sheet['B3'])"""
+    
+    def __init__(self, source):
+        self.title = source.title
+        self.rows = [row for row in source.iter_rows(values_only=True)]
+        # Quitar filas vacías al final para que max_row refleje el contenido real
+        while self.rows and all(value is None for value in self.rows[-1]):
+            self.rows.pop()
+        self.max_row = len(self.rows)
+        self.max_column = max((len(row) for row in self.rows), default=0)
+    
+    def value(self, row, column):
+        """Valor en fila/columna (base 1); None fuera del rango leído"""
+        if row < 1 or column < 1 or row > self.max_row:
+            return None
+        values = self.rows[row - 1]
+        return values[column - 1] if column <= len(values) else None
+    
+    def __getitem__(self, coordinate):
+        column, row = split_coordinate(coordinate)
+        return SheetCell(self.value(row, column))
+    
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        """Filas como tuplas de valores (compatible con el uso de openpyxl en este módulo)"""
+        max_row = self.max_row if max_row is None else max_row
+        max_col = self.max_column if max_col is None else max_col
+        for row in range(min_row, max_row + 1):
+            yield tuple(self.value(row, column) for column in range(1, max_col + 1))
+
+class LazyWorkbook:
+    """Workbook read_only: materializa cada hoja en su primer uso y la conserva mientras dure el snapshot"""
+    
+    def __init__(self, content, eager_sheets=EAGER_SHEETS):
+        # openpyxl solo se importa en la ruta de ingesta (los workers que no ingieren no lo cargan)
+        import openpyxl
+        self.source = openpyxl.load_workbook(BytesIO(content), read_only=True, data_only=True)
+        self.sheetnames = list(self.source.sheetnames)
+        self.sheets = {}
+        self.lock = threading.Lock()
+        for sheet_name in eager_sheets:
+            if sheet_name in self.sheetnames:
+                self[sheet_name]
+    
+    def __contains__(self, sheet_name):
+        return sheet_name in self.sheetnames
+    
+    def __getitem__(self, sheet_name):
+        sheet = self.sheets.get(sheet_name)
+        if sheet is not None:
+            return sheet
+        if sheet_name not in self.sheetnames:
+            raise KeyError(f"Worksheet {sheet_name} does not exist.")
+        # El archivo fuente no admite lecturas concurrentes
+        with self.lock:
+            sheet = self.sheets.get(sheet_name)
+            if sheet is None:
+                started = time.perf_counter()
+                sheet = MaterializedSheet(self.source[sheet_name])
+                self.sheets[sheet_name] = sheet
+                logger.info(f"Hoja {sheet_name} materializada: {sheet.max_row} filas en {(time.perf_counter() - started) * 1000:.1f} ms")
+        return sheet
+    
+    @property
+    def materialized(self):
+        return [name for name in self.sheetnames if name in self.sheets]
+
+# REGISTRO DE VERSIONES DEL SNAPSHOT
+# Cada versión publicada guarda el Excel original y el JSON de /api/data. Con SNAPSHOT_DIR
+# (desactivado por defecto; obligatorio para gunicorn con varios workers) la versión se escribe a disco al publicarse (SNAPSHOT_DIR/versions/v{N}.*, con el Excel en
+# blobs/<sha256>.xlsx) y el número lo asigna el worker que publica bajo un lock, así todos los
+# workers ven las mismas versiones. En memoria quedan las más recientes como caché (máximo
+# SNAPSHOT_HISTORY versiones y SNAPSHOT_MEMORY_BYTES); sin SNAPSHOT_DIR solo existen ahí.
+
+SNAPSHOT_HISTORY = int(os.environ.get('SNAPSHOT_HISTORY', 10))
+SNAPSHOT_MEMORY_BYTES = int(os.environ.get('SNAPSHOT_MEMORY_BYTES', 64 * 1024 * 1024))
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', '').strip()
+SNAPSHOT_DISK_KEEP = int(os.environ.get('SNAPSHOT_DISK_KEEP', 50))  # 0 = sin límite
+
+snapshot_registry = OrderedDict()  # versión -> entrada, en orden LRU
+snapshot_registry_lock = threading.Lock()
+# Tras un rollback se ignora el contenido revertido hasta que la fuente publique otro distinto.
+# Con SNAPSHOT_DIR el valor vigente es el de current.json; este dict es la copia del proceso
+rollback_state = {"blocked_hash": None, "last_rollback": None}
+
+def snapshot_meta(entry):
+    """Datos de una versión sin los bytes"""
+    return {key: entry.get(key) for key in ("version", "published", "fetched_at", "source", "content_hash", "bytes", "rollback_of")}
+
+def snapshot_path(version, extension):
+    return os.path.join(SNAPSHOT_DIR, "versions", f"v{version}.{extension}")
+
+def blob_path(content_hash):
+    return os.path.join(SNAPSHOT_DIR, "blobs", f"{content_hash}.xlsx")
+
+def cache_snapshot_entry(entry):
+    """Guarda la entrada en la caché en memoria y desaloja por LRU/presupuesto"""
+    with snapshot_registry_lock:
+        snapshot_registry[entry["version"]] = entry
+        snapshot_registry.move_to_end(entry["version"])
+        total = sum(e["bytes"] for e in snapshot_registry.values())
+        # La versión más reciente nunca se desaloja
+        while len(snapshot_registry) > 1 and (len(snapshot_registry) > SNAPSHOT_HISTORY or total > SNAPSHOT_MEMORY_BYTES):
+            _, old = snapshot_registry.popitem(last=False)
+            total -= old["bytes"]
+            if not SNAPSHOT_DIR:
+                logger.info(f"Snapshot v{old['version']} descartado (sin SNAPSHOT_DIR)")
+
+def persist_snapshot(entry, event_revisions):
+    """Escribe la versión en SNAPSHOT_DIR (llamar con el lock de publicación tomado) y recorta las más viejas"""
+    if not SNAPSHOT_DIR:
+        return
+    try:
+        if not os.path.exists(blob_path(entry["content_hash"])):
+            write_atomic(blob_path(entry["content_hash"]), entry["content"])
+        write_atomic(snapshot_path(entry["version"], "json"), entry["payload"])
+        write_atomic(snapshot_path(entry["version"], "events.json"), json.dumps(event_revisions).encode('utf-8'))
+        # El meta va al final: una versión listada siempre tiene su JSON y su Excel
+        write_atomic(snapshot_path(entry["version"], "meta.json"), json.dumps(snapshot_meta(entry)).encode('utf-8'))
+        prune_snapshot_dir()
+    except OSError as e:
+        logger.error(f"Error guardando snapshot v{entry['version']} en disco: {str(e)}")
+
+def prune_snapshot_dir():
+    """Borra las versiones más allá de SNAPSHOT_DISK_KEEP (0 = conservar todas) y los Excel que ya nadie referencia"""
+    if SNAPSHOT_DISK_KEEP <= 0:
+        return
+    marker = read_shared_marker()
+    current_version = marker.get("version") if marker else None
+    for version in disk_snapshot_versions()[:-SNAPSHOT_DISK_KEEP]:
+        # La versión de current.json nunca se borra (los workers la siguen)
+        if version == current_version:
+            continue
+        for extension in ("meta.json", "json", "events.json", "pack.json", "pack"):
+            try:
+                os.remove(snapshot_path(version, extension))
+            except OSError:
+                pass
+    referenced = {meta["content_hash"] for meta in map(read_snapshot_meta, disk_snapshot_versions()) if meta}
+    if marker:
+        referenced.add(marker["content_hash"])
+    for name in os.listdir(os.path.join(SNAPSHOT_DIR, "blobs")):
+        if name.endswith(".xlsx") and name[:-len(".xlsx")] not in referenced:
+            try:
+                os.remove(os.path.join(SNAPSHOT_DIR, "blobs", name))
+            except OSError:
+                pass
+
+def disk_snapshot_versions():
+    """Versiones guardadas en SNAPSHOT_DIR, de la más vieja a la más nueva"""
+    directory = os.path.join(SNAPSHOT_DIR, "versions") if SNAPSHOT_DIR else None
+    if not directory or not os.path.isdir(directory):
+        return []
+    return sorted(int(name[1:-len(".meta.json")]) for name in os.listdir(directory)
+                  if name.startswith("v") and name.endswith(".meta.json"))
+
+def read_snapshot_meta(version):
+    """Meta de una versión en disco (None si no existe o ya se borró)"""
+    try:
+        with open(snapshot_path(version, "meta.json")) as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def load_event_revisions(version):
+    """Revisiones de los eventos del .ics guardadas con una versión (None si no hay)"""
+    if not SNAPSHOT_DIR or not version:
+        return None
+    try:
+        with open(snapshot_path(version, "events.json")) as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def register_snapshot(current, source, content, rollback_of=None):
+    """Entrada de la versión recién publicada (queda en la caché en memoria)"""
+    payload = app.json.dumps(current.snapshot.to_dict()).encode('utf-8')
+    entry = {
+        "version": current.version,
+        "published": current.snapshot.last_update,
+        "fetched_at": current.fetched_at,
+        "source": source,
+        "content_hash": current.content_hash,
+        "content": content,
+        "payload": payload,
+        "bytes": len(content) + len(payload),
+        "rollback_of": rollback_of
+    }
+    cache_snapshot_entry(entry)
+    return entry
+
+def get_snapshot_entry(version):
+    """Entrada de una versión desde memoria (la marca como usada) o desde disco"""
+    if SNAPSHOT_DIR and not os.path.exists(snapshot_path(version, "meta.json")):
+        # Recortada del disco (quizá por otro worker): tampoco se sirve desde la caché
+        return None
+    with snapshot_registry_lock:
+        entry = snapshot_registry.get(version)
+        if entry is not None:
+            snapshot_registry.move_to_end(version)
+            return entry
+    entry = read_snapshot_meta(version) if SNAPSHOT_DIR else None
+    if entry is None:
+        return None
+    try:
+        with open(blob_path(entry["content_hash"]), 'rb') as f:
+            entry["content"] = f.read()
+        with open(snapshot_path(version, "json"), 'rb') as f:
+            entry["payload"] = f.read()
+    except OSError:
+        return None
+    cache_snapshot_entry(entry)
+    return entry
+
+# Continuar la numeración después de las versiones que dejaron en disco procesos anteriores
+published = replace(published, version=max(disk_snapshot_versions(), default=0))
+
+def next_snapshot_version(marker):
+    """Número para la próxima versión (llamar con el lock de publicación tomado)"""
+    shared_version = marker.get("version", 0) if marker else 0
+    return max(published.version, shared_version, max(disk_snapshot_versions(), default=0)) + 1
+
+def list_snapshots():
+    """Versiones disponibles (más nuevas primero); con SNAPSHOT_DIR, las que siguen en disco"""
+    with snapshot_registry_lock:
+        listed = {version: dict(snapshot_meta(entry), location="memory") for version, entry in snapshot_registry.items()}
+    on_disk = disk_snapshot_versions()
+    if SNAPSHOT_DIR:
+        listed = {version: meta for version, meta in listed.items() if version in on_disk}
+    for version in on_disk:
+        if version not in listed:
+            meta = read_snapshot_meta(version)
+            if meta:
+                listed[version] = dict(meta, location="disk")
+    return [listed[version] for version in sorted(listed, reverse=True)]
+
+def current_rollback_state(marker):
+    """Estado del rollback vigente: el de current.json si existe, si no el del proceso"""
+    if marker:
+        return {"blocked_hash": marker.get("blocked_hash"), "last_rollback": marker.get("last_rollback")}
+    return dict(rollback_state)
+
+def is_blocked_content(content_hash, source, marker):
+    """True si es el Excel que se revirtió (un rollback o un worker que sigue a otro no se bloquean)"""
+    return source not in ("rollback", "shared") and content_hash == current_rollback_state(marker)["blocked_hash"]
+
+# FUENTES DEL EXCEL (SharePoint, archivo local vigilado, subida por /api/upload)
+
+# Ruta local del Excel (p. ej. espejo on-prem o recuperación); si existe se vigila y se
+# reingiere en cuanto cambia. SHAREPOINT_URL="" desactiva la fuente remota.
+LOCAL_SOURCE_PATH = os.environ.get('LOCAL_SOURCE_PATH', '').strip()
+LOCAL_WATCH_SECONDS = float(os.environ.get('LOCAL_WATCH_SECONDS', 0.25))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 50 * 1024 * 1024))
+# También limita los cuerpos sin Content-Length (chunked): werkzeug los corta en este
+# límite sin avisar, así que se lee un byte de más y upload_workbook rechaza lo que lo pase
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_BYTES + 1
+MIN_WORKBOOK_BYTES = 1000
+
+def check_workbook_bytes(content):
+    """Verifica que el contenido parezca un .xlsx antes de procesarlo"""
+    if len(content) < MIN_WORKBOOK_BYTES:
+        raise Exception(f"Archivo muy pequeño o vacío: {len(content)} bytes")
+    if not content.startswith(b'PK'):
+        raise Exception("El archivo no es un Excel .xlsx válido")
+
+def fetch_sharepoint():
+    """Descarga el Excel de SharePoint"""
+    logger.info("Iniciando descarga de SharePoint...")
+    # Headers para evitar bloqueos
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+    
+    response = requests.get(SHAREPOINT_URL, headers=headers, timeout=30)
+    logger.info(f"Respuesta SharePoint: Status {response.status_code}, Tamaño: {len(response.content)} bytes")
+    
+    response.raise_for_status()
+    return response.content
+
+def fetch_local_file():
+    """Lee el Excel de LOCAL_SOURCE_PATH"""
+    logger.info(f"Leyendo Excel local: {LOCAL_SOURCE_PATH}")
+    with open(LOCAL_SOURCE_PATH, 'rb') as f:
+        return f.read()
+
+SOURCE_FETCHERS = {
+    "sharepoint": fetch_sharepoint,
+    "local": fetch_local_file
+    # "upload" no se descarga: el contenido llega en el request
+}
+
+def primary_source():
+    """Fuente que usan el arranque y el scheduler"""
+    if not SHAREPOINT_URL and LOCAL_SOURCE_PATH:
+        return "local"
+    return DATA_SOURCE
+
+@profiled_refresh
+def download_and_process_excel(source=DATA_SOURCE, content=None, rollback_of=None, shared=None):
+    """Obtiene el Excel de la fuente indicada (SharePoint por defecto) y procesa los datos.
+    `shared` es el current.json que publicó otro worker cuando source es "shared"."""
+    global published
+    
+    ingest_context.anomalies = []
+    try:
+        if content is None:
+            content = SOURCE_FETCHERS[source]()
         
         # Verificar que el archivo no esté vacío
-        if len(response.content) < 1000:
-            raise Exception(f"Archivo muy pequeño o vacío: {len(response.content)} bytes")
+        check_workbook_bytes(content)
+        content_hash = hashlib.sha256(content).hexdigest()
+        if is_blocked_content(content_hash, source, read_shared_marker()):
+            # Mismo Excel que se revirtió: se mantiene la versión del rollback
+            logger.warning(f"Contenido de {source} igual a la versión revertida, se conserva el rollback")
+            record_source_success(source, content_hash)
+            return
         
         # Cargar el Excel en memoria
-        logger.info("Cargando archivo Excel...")
-        workbook = openpyxl.load_workbook(BytesIO(response.content), data_only=True)
+        logger.info(f"Cargando archivo Excel (fuente: {source})...")
+        # El workbook global solo se reemplaza al publicar el snapshot completo.
+        # Solo se leen las hojas del dashboard; el resto queda pendiente hasta que se pida
+        new_workbook = LazyWorkbook(content)
         
-        logger.info(f"Hojas encontradas en Excel: {workbook.sheetnames}")
+        logger.info(f"Hojas encontradas en Excel: {new_workbook.sheetnames}")
         
         # Verificar que existen las hojas necesarias
         required_sheets = ['FLO', 'TEX']
         for sheet_name in required_sheets:
-            if sheet_name not in workbook.sheetnames:
-                raise Exception(f"Hoja '{sheet_name}' no encontrada. Disponibles: {workbook.sheetnames}")
+            if sheet_name not in new_workbook.sheetnames:
+                raise Exception(f"Hoja '{sheet_name}' no encontrada. Disponibles: {new_workbook.sheetnames}")
         
         logger.info("Archivo Excel cargado correctamente")
         
         # Procesar datos de Florida
         logger.info("Procesando datos de Florida...")
-        florida_data = process_sheet_data(workbook, 'FLO')
+        florida_data = process_sheet_data(new_workbook, 'FLO')
         
         # Procesar datos de Texas  
         logger.info("Procesando datos de Texas...")
-        texas_data = process_sheet_data(workbook, 'TEX')
+        texas_data = process_sheet_data(new_workbook, 'TEX')
         
         # Combinar datos globales
         logger.info("Combinando datos globales...")
@@ -84,26 +1025,155 @@ def download_and_process_excel():
         
         # Obtener fechas de remodelación
         logger.info("Obteniendo fechas de remodelación...")
-        remodel_dates = get_remodel_dates()
-        
-        # Actualizar datos globales
-        dashboard_data = {
-            "last_update": datetime.now().isoformat(),
-            "florida_data": florida_data,
-            "texas_data": texas_data,
-            "global_data": global_data,
-            "remodel_dates": remodel_dates,
-            "status": "success"
-        }
+        remodel_dates = get_remodel_dates(new_workbook)
+        
+        # Validar la calidad de los datos antes de publicar
+        logger.info("Validando calidad de datos...")
+        report = validate_snapshot(new_workbook, florida_data, texas_data, remodel_dates, list(ingest_context.anomalies))
+        # Las lecturas posteriores (índice de tiendas, prewarm) repiten celdas ya reportadas
+        ingest_context.anomalies = None
+        if report["status"] == "failed" and QUALITY_STRICT:
+            # Seguir sirviendo el último snapshot válido
+            report["rejected"] = True
+            report["serving_version"] = published.version
+            published = replace(published, quality_report=report)
+            invalidate_response_cache()
+            logger.error(f"Snapshot rechazado por validación: {report['errors']} errores")
+            record_source_failure(source, f"validación: {report['errors']} errores", retry=source in SOURCE_FETCHERS)
+            return
+        report["rejected"] = False
+        
+        # Calcular KPIs con el avance semanal del calendario
+        logger.info("Calculando KPIs...")
+        florida_calendar = get_weekly_schedule_data('FLO-COM', new_workbook)
+        texas_calendar = get_weekly_schedule_data('TEX-COM', new_workbook)
+        # Al seguir a otro worker se usa su fecha: /api/data es igual en todos los workers
+        last_update = shared["published"] if shared else datetime.now().isoformat()
+        # La edad de los datos cuenta desde la descarga original, no desde que se republicaron
+        if shared:
+            fetched_at = shared.get("fetched_at") or shared["published"]
+        elif source == "rollback":
+            original = get_snapshot_entry(rollback_of) or {}
+            fetched_at = original.get("fetched_at") or original.get("published")
+        else:
+            fetched_at = last_update
+        kpis = compute_kpis(florida_data, texas_data, global_data, florida_calendar, texas_calendar)
+        kpis["last_update"] = last_update
+        forecast = compute_forecasts(florida_data, texas_data, global_data, florida_calendar, texas_calendar)
+        forecast["last_update"] = last_update
+        
+        # Índice de tiendas para consultas por STORE en tiempo constante
+        logger.info("Construyendo índice de tiendas...")
+        previous = published
+        stores = build_store_index(new_workbook, [florida_calendar, texas_calendar], previous.store_index, previous.snapshot.last_update)
+        
+        snapshot = DashboardSnapshot(
+            last_update=last_update,
+            status="success",
+            florida_data=florida_data,
+            texas_data=texas_data,
+            global_data=global_data,
+            remodel_dates=remodel_dates
+        )
+        pivot_cube = build_pivot_cube(stores)
+        financials = build_financial_arrays(stores)
+        
+        # El número de versión, el estado del rollback y current.json se resuelven bajo el lock
+        # de publicación, así dos workers nunca publican la misma versión
+        with publish_lock():
+            if shared:
+                version = shared["version"]
+                new_rollback_state = current_rollback_state(shared)
+            else:
+                marker = read_shared_marker()
+                if is_blocked_content(content_hash, source, marker):
+                    # Otro worker hizo rollback mientras se procesaba este Excel
+                    logger.warning(f"Contenido de {source} revertido durante el refresco, se conserva el rollback")
+                    record_source_success(source, content_hash)
+                    return
+                version = next_snapshot_version(marker)
+                new_rollback_state = current_rollback_state(marker)
+                if source == "rollback":
+                    # Hasta que la fuente cambie, no volver a publicar el contenido que se revirtió
+                    replaced_hash = marker["content_hash"] if marker else previous.content_hash
+                    new_rollback_state["blocked_hash"] = replaced_hash if replaced_hash != content_hash else None
+                    new_rollback_state["last_rollback"] = {
+                        "from": marker.get("version", 0) if marker else previous.version,
+                        "to": rollback_of, "published_as": version, "at": datetime.now().isoformat()}
+                else:
+                    new_rollback_state["blocked_hash"] = None
+            
+            report["serving_version"] = version
+            state = PublishedState(
+                snapshot=snapshot,
+                version=version,
+                content_hash=content_hash,
+                fetched_at=fetched_at,
+                workbook=new_workbook,
+                quality_report=report,
+                kpis=kpis,
+                forecast=forecast,
+                store_index=stores,
+                pivot_cube=pivot_cube,
+                financials=financials
+            )
+            # Revisión de cada evento del .ics respecto de la última versión publicada (la de
+            # current.json, o la anterior de este proceso); quien sigue a otro worker usa la suya
+            event_revisions = load_event_revisions(version) if shared else None
+            if event_revisions is None:
+                base = load_event_revisions(marker.get("version")) if not shared and marker else None
+                event_revisions = revise_calendar_events(calendar_events('global', state),
+                                                         previous.event_revisions if base is None else base)
+            # Publicar todo junto: una sola asignación, los requests ven la versión anterior o la nueva
+            published = replace(state, event_revisions=event_revisions)
+            shared_state["pending"] = None
+            rollback_state.update(new_rollback_state)
+            entry = register_snapshot(published, shared["source"] if shared else source, content,
+                                      shared.get("rollback_of") if shared else rollback_of)
+            # Las respuestas se precalculan antes de anunciar la versión: van al paquete que
+            # sirven los demás workers (quien sigue a otro worker las toma de ese paquete)
+            if not (shared and install_response_pack(version)):
+                invalidate_response_cache()
+                prewarm_response_cache()
+            if not shared:
+                persist_snapshot(entry, event_revisions)
+                if write_response_pack(version):
+                    install_response_pack(version)
+                share_snapshot(entry, new_rollback_state)
+        record_source_success(source, content_hash)
         
-        logger.info("Datos procesados correctamente")
-        logger.info(f"Resumen - FL: {florida_data.get('aloha19', {}).get('total', 0)} tiendas, TX: {texas_data.get('aloha19', {}).get('total', 0)} tiendas")
+        logger.info(f"Datos procesados correctamente (snapshot v{published.version})")
+        logger.info(f"Resumen - FL: {zero_if_none((florida_data or RegionSummary()).aloha19.total)} tiendas, TX: {zero_if_none((texas_data or RegionSummary()).aloha19.total)} tiendas")
         logger.info(f"Fechas de remodelación: Stage 1: {remodel_dates.get('stage1_start', 'TBD')} → {remodel_dates.get('stage1_end', 'TBD')}")
         
     except Exception as e:
         error_msg = f"Error procesando datos: {str(e)}"
         logger.error(f"{error_msg}")
-        dashboard_data["status"] = f"error: {str(e)}"
+        # Reintentar solo fuentes que se pueden volver a leer (no una subida inválida)
+        record_source_failure(source, str(e), retry=source in SOURCE_FETCHERS)
+        # Sin un snapshot válido previo no hay nada que servir: se reporta el error
+        if published.snapshot.status != "success":
+            status = f"error: {str(e)}"
+            # La caché (precalculada y comprimida) solo se vacía si cambia lo publicado,
+            # no en cada reintento que falla igual
+            if status != published.snapshot.status:
+                published = replace(published, snapshot=replace(published.snapshot, status=status))
+                invalidate_response_cache()
+        else:
+            logger.warning(f"Sirviendo el último snapshot válido ({published.snapshot.last_update})")
+    finally:
+        ingest_context.anomalies = None
+
+def record_cell_anomaly(sheet, cell, value, issue):
+    """Registra una celda que se convirtió silenciosamente (solo durante la ingesta)"""
+    anomalies = getattr(ingest_context, "anomalies", None)
+    if anomalies is not None:
+        anomalies.append({
+            "sheet": getattr(sheet, "title", None),
+            "cell": cell,
+            "value": str(value) if value is not None else None,
+            "issue": issue
+        })
 
 def read_excel_cell(sheet, cell):
     """Lee una celda del Excel de forma segura con DEBUG"""
@@ -116,6 +1186,7 @@ def read_excel_cell(sheet, cell):
         
         if value is None:
             logger.warning(f" Celda {cell} está vacía")
+            record_cell_anomaly(sheet, cell, value, "blank")
             return 0
         
         # Convertir a número
@@ -127,11 +1198,13 @@ def read_excel_cell(sheet, cell):
                 num_value = float(str(value).strip())
             except:
                 logger.warning(f"No se pudo convertir '{value}' a número en celda {cell}")
+                record_cell_anomaly(sheet, cell, value, "not_numeric")
                 return 0
         
         # Validar que no sea negativo
         if num_value < 0:
             logger.warning(f"Valor negativo en celda {cell}: {num_value}")
+            record_cell_anomaly(sheet, cell, value, "negative")
             return 0
         
         logger.info(f"Celda {cell} = {num_value}")
@@ -151,6 +1224,7 @@ def read_excel_date_cell(sheet, cell):
         
         if value is None:
             logger.warning(f"Celda de fecha {cell} está vacía")
+            record_cell_anomaly(sheet, cell, value, "blank_date")
             return "TBD"
         
         # Si es una fecha de Excel (datetime)
@@ -217,6 +1291,7 @@ def read_excel_date_cell(sheet, cell):
             fallback_value = fallback_value.split(" ")[0]
         
         logger.warning(f"Formato de fecha no reconocido en {cell}: {value}, usando fallback: {fallback_value}")
+        record_cell_anomaly(sheet, cell, value, "unrecognized_date")
         return fallback_value
         
     except Exception as e:
@@ -232,11 +1307,11 @@ def combine_dates(date1, date2):
     else:
         return "TBD"
 
-def get_remodel_dates():
+def get_remodel_dates(wb=None):
     """Obtiene las fechas de remodelación desde SharePoint (celdas específicas)"""
     try:
-        global workbook
-        if not workbook:
+        wb = wb or published.workbook
+        if not wb:
             logger.warning("No hay workbook disponible para fechas de remodelación")
             return {
                 "stage1_start": "TBD",
@@ -251,7 +1326,7 @@ def get_remodel_dates():
         # Verificar que existen las hojas necesarias
         required_sheets = ['FLO', 'TEX']
         for sheet_name in required_sheets:
-            if sheet_name not in workbook.sheetnames:
+            if sheet_name not in wb.sheetnames:
                 logger.warning(f"Hoja {sheet_name} no encontrada para fechas")
                 return {
                     "stage1_start": "TBD",
@@ -262,7 +1337,7 @@ def get_remodel_dates():
                 }
         
         # Leer fechas de Florida (FLO)
-        flo_sheet = workbook['FLO']
+        flo_sheet = wb['FLO']
         logger.info("Leyendo fechas de Florida...")
         
         flo_stage1_start = read_excel_date_cell(flo_sheet, 'C3')  # Stage 1 Start
@@ -277,7 +1352,7 @@ def get_remodel_dates():
         logger.info(f"Florida - Julio: {flo_july_stores} tiendas, Agosto: {flo_august_stores} tiendas")
         
         # Leer fechas de Texas (TEX) - CORREGIDO según especificación del usuario
-        tex_sheet = workbook['TEX']
+        tex_sheet = wb['TEX']
         logger.info("Leyendo fechas de Texas...")
         
         tex_stage1_start = read_excel_date_cell(tex_sheet, 'C3')  # Stage 1 Start Remod
@@ -337,24 +1412,19 @@ def get_remodel_dates():
 
 # Correcciones y adiciones al backend para el calendario
 
-def get_weekly_schedule_data(sheet_name):
+def get_weekly_schedule_data(sheet_name, wb=None):
     try:
-        global workbook
-        if not workbook or sheet_name not in workbook.sheetnames:
+        wb = wb or published.workbook
+        if not wb or sheet_name not in wb.sheetnames:
             return {"error": f"La hoja '{sheet_name}' no existe o el workbook no está cargado."}
-        sheet = workbook[sheet_name]
+        sheet = wb[sheet_name]
         logger.info(f"Procesando fechas de calendario para {sheet_name}")
         
         # Leer todas las fechas de la columna M
         dates_data = []
         weekly_counts = {}
         
-        if sheet_name == 'TEX-COM':
-            max_row = min(59, sheet.max_row)
-        elif sheet_name == 'FLO-COM':
-            max_row = min(28, sheet.max_row)
-        else:
-            max_row = sheet.max_row
+        max_row = table_max_row(sheet_name, sheet)
         
         for row_num in range(2, max_row + 1):
             try:
@@ -539,36 +1609,36 @@ def process_sheet_data(workbook, sheet_name):
             project_fai_edmb_idmb_qb = read_excel_cell(sheet, 'B31')
             
             # Datos de Florida
-            data = {
-                "aloha19": {
-                    #"stage1": stage1,
-                    "july": july,  # Total de tiendas en junio
-                    "august": august,  # Total de tiendas en agosto
-                    "stage2": stage2, 
-                    "finished": finished,
-                    "total": total
-                },
-                "wiring": {
-                    "pending": wiring_pending,   
-                    "finished": wiring_finished  
-                },
-                "technologies": {
-                    "fresh_ai": fresh_ai,
-                    "edmb": edmb,
-                    "idmb": idmb,
-                    "qb": qb,
-                    "kiosk": kiosk
-                },
-                "projects": {
-                    "signed": signed,
-                    "quote": quote,
-                    "paid": paid
-                },
-                "project_types": {
-                    "edmb_idmb_qb": project_edmb_idmb_qb,
-                    "fai_edmb_idmb_qb": project_fai_edmb_idmb_qb
-                }
-            }
+            data = RegionSummary(
+                aloha19=Aloha19Summary(
+                    #stage1=stage1,
+                    july=july,  # Total de tiendas en junio
+                    august=august,  # Total de tiendas en agosto
+                    stage2=stage2, 
+                    finished=finished,
+                    total=total
+                ),
+                wiring=WiringSummary(
+                    pending=wiring_pending,   
+                    finished=wiring_finished  
+                ),
+                technologies=TechnologiesSummary(
+                    fresh_ai=fresh_ai,
+                    edmb=edmb,
+                    idmb=idmb,
+                    qb=qb,
+                    kiosk=kiosk
+                ),
+                projects=ProjectsSummary(
+                    signed=signed,
+                    quote=quote,
+                    paid=paid
+                ),
+                project_types=ProjectTypesSummary(
+                    edmb_idmb_qb=project_edmb_idmb_qb,
+                    fai_edmb_idmb_qb=project_fai_edmb_idmb_qb
+                )
+            )
             
         else:  # TEX
             logger.info("=== PROCESANDO TEXAS (TEX) ===")
@@ -611,289 +1681,1154 @@ def process_sheet_data(workbook, sheet_name):
             project_idmb_qb = read_excel_cell(sheet, 'B35')  # TEX con IDMB y QB
             
             # Datos de Texas
-            data = {
-                "aloha19": {
-                    #"stage1": stage1,
-                    "june": june,  # Total de tiendas en junio
-                    "july": july,  # Total de tiendas en julio
-                    "stage2": stage2,
-                    "close": close,
-                    "finished": finished,
-                    "total": total
-                },
-                "wiring": {
-                    "pending": wiring_pending,
-                    "finished": wiring_finished,
-                    "close": wiring_close 
-                },
-                "technologies": {
-                    "fresh_ai": fresh_ai,
-                    "edmb": edmb,
-                    "idmb": idmb,
-                    "qb": qb,
-                    "kiosk": kiosk
-                },
-                "projects": {
-                    "paid": paid,  # Texas Quote (B27)
-                    "signed": signed,  # Texas Pending (B28)
-                    "quote": quote,  # Texas Quote
-                },
-                "project_types": {
-                    "edmb": project_edmb,
-                    "edmb_idmb_qb": project_edmb_idmb_qb,  # TEX con EDMB-IDMB-QB 
-                    "idmb_qb": project_idmb_qb  # TEX con IDMB y QB
-                    
-                }
-            }
+            data = RegionSummary(
+                aloha19=Aloha19Summary(
+                    #stage1=stage1,
+                    june=june,  # Total de tiendas en junio
+                    july=july,  # Total de tiendas en julio
+                    stage2=stage2,
+                    close=close,
+                    finished=finished,
+                    total=total
+                ),
+                wiring=WiringSummary(
+                    pending=wiring_pending,
+                    finished=wiring_finished,
+                    close=wiring_close 
+                ),
+                technologies=TechnologiesSummary(
+                    fresh_ai=fresh_ai,
+                    edmb=edmb,
+                    idmb=idmb,
+                    qb=qb,
+                    kiosk=kiosk
+                ),
+                projects=ProjectsSummary(
+                    paid=paid,  # Texas Quote (B27)
+                    signed=signed,  # Texas Pending (B28)
+                    quote=quote,  # Texas Quote
+                ),
+                project_types=ProjectTypesSummary(
+                    edmb=project_edmb,
+                    edmb_idmb_qb=project_edmb_idmb_qb,  # TEX con EDMB-IDMB-QB 
+                    idmb_qb=project_idmb_qb  # TEX con IDMB y QB
+                )
+            )
         
         logger.info(f"Datos procesados para {sheet_name}:")
-        logger.info(f"   Aloha19 Total: {data['aloha19']['total']}")
-        logger.info(f"   Aloha19 Finished: {data['aloha19']['finished']}")
-        logger.info(f"   Wiring Finished: {data['wiring']['finished']}")
-        logger.info(f"   Wiring Pending: {data['wiring']['pending']}")
+        logger.info(f"   Aloha19 Total: {data.aloha19.total}")
+        logger.info(f"   Aloha19 Finished: {data.aloha19.finished}")
+        logger.info(f"   Wiring Finished: {data.wiring.finished}")
+        logger.info(f"   Wiring Pending: {data.wiring.pending}")
         if sheet_name == 'TEX':
-            logger.info(f"Wiring Close: {data['wiring'].get('close', 0)}")
-        logger.info(f"Fresh AI: {data['technologies']['fresh_ai']}")
+            logger.info(f"Wiring Close: {zero_if_none(data.wiring.close)}")
+        logger.info(f"Fresh AI: {data.technologies.fresh_ai}")
         
         return data
         
     except Exception as e:
         logger.error(f"Error procesando hoja {sheet_name}: {str(e)}")
-        return {}
+        return None
 
 def combine_regional_data(florida_data, texas_data):
     """Combina los datos de Florida y Texas para vista global con DEBUG"""
     try:
         logger.info(" === COMBINANDO DATOS GLOBALES ===")
         
-        # Helper para obtener valores seguros
-        def safe_get(data, path, default=0):
-            try:
-                result = data
-                for key in path.split('.'):
-                    result = result[key]
-                return result or default
-            except:
-                return default
+        # Las regiones que fallaron cuentan como 0
+        fl = florida_data or RegionSummary()
+        tx = texas_data or RegionSummary()
+        z = zero_if_none
         
-        fl_total = safe_get(florida_data, 'aloha19.total')
-        tx_total = safe_get(texas_data, 'aloha19.total')
+        fl_total = z(fl.aloha19.total)
+        tx_total = z(tx.aloha19.total)
         
-        fl_finished = safe_get(florida_data, 'aloha19.finished')
-        tx_finished = safe_get(texas_data, 'aloha19.finished')
+        fl_finished = z(fl.aloha19.finished)
+        tx_finished = z(tx.aloha19.finished)
         
         logger.info(f" Florida - Total: {fl_total}, Finished: {fl_finished}")
         logger.info(f"Texas - Total: {tx_total}, Finished: {tx_finished}")
         
         # CORREGIDO: Combinar proyectos de ambas regiones
-        fl_signed = safe_get(florida_data, 'projects.signed')
-        fl_quote = safe_get(florida_data, 'projects.quote')
-        fl_paid = safe_get(florida_data, 'projects.paid')
+        fl_signed = z(fl.projects.signed)
+        fl_quote = z(fl.projects.quote)
+        fl_paid = z(fl.projects.paid)
         
-        tx_paid = safe_get(texas_data, 'projects.paid')
-        tx_signed = safe_get(texas_data, 'projects.signed')
-        tx_quote = safe_get(texas_data, 'projects.quote')
-        tx_wiring_close = safe_get(texas_data, 'wiring.close')  # NUEVO: Wiring Close de Texas
+        tx_paid = z(tx.projects.paid)
+        tx_signed = z(tx.projects.signed)
+        tx_quote = z(tx.projects.quote)
+        tx_wiring_close = z(tx.wiring.close)  # NUEVO: Wiring Close de Texas
         
         logger.info(f"Florida Projects - Signed: {fl_signed}, Quote: {fl_quote}, Paid: {fl_paid}")
         logger.info(f"Texas Projects - Quote: {tx_quote}, Signed: {tx_signed}, Paid: {tx_paid}")
         logger.info(f"Texas Wiring Close: {tx_wiring_close}")
         
-        global_data = {
-            "aloha19": {
-               # "stage1": safe_get(florida_data, 'aloha19.july') + safe_get(texas_data, 'aloha19.stage1'),
-                "june":  safe_get(texas_data, 'aloha19.june') ,  # Solo Texas tiene junio
-                "july": safe_get(florida_data, 'aloha19.august') + safe_get(texas_data, 'aloha19.july'),
-                "august": safe_get(florida_data, 'aloha19.august'),  # Solo Florida tiene agosto
-                "stage2": safe_get(florida_data, 'aloha19.stage2') + safe_get(texas_data, 'aloha19.stage2'),
-                "close": safe_get(texas_data, 'aloha19.close'),  # Solo Texas tiene "close"
-                "finished": fl_finished + tx_finished,
-                "total": fl_total + tx_total
-            },
-            "wiring": {
-                "pending": safe_get(florida_data, 'wiring.pending') + safe_get(texas_data, 'wiring.pending'),
-                "finished": safe_get(florida_data, 'wiring.finished') + safe_get(texas_data, 'wiring.finished'),
-                "close": safe_get(texas_data, 'wiring.close')  # NUEVO: Solo Texas tiene wiring close
-            },
-            "technologies": {
-                "fresh_ai": safe_get(florida_data, 'technologies.fresh_ai') + safe_get(texas_data, 'technologies.fresh_ai'),
-                "edmb": safe_get(florida_data, 'technologies.edmb') + safe_get(texas_data, 'technologies.edmb'),
-                "idmb": safe_get(florida_data, 'technologies.idmb') + safe_get(texas_data, 'technologies.idmb'),
-                "qb": safe_get(florida_data, 'technologies.qb') + safe_get(texas_data, 'technologies.qb'),
-                "kiosk": safe_get(florida_data, 'technologies.kiosk') + safe_get(texas_data, 'technologies.kiosk')
-            },
+        global_data = GlobalSummary(
+            aloha19=Aloha19Summary(
+               # stage1=z(fl.aloha19.july) + z(tx.aloha19.stage1),
+                june=z(tx.aloha19.june),  # Solo Texas tiene junio
+                july=z(fl.aloha19.august) + z(tx.aloha19.july),
+                august=z(fl.aloha19.august),  # Solo Florida tiene agosto
+                stage2=z(fl.aloha19.stage2) + z(tx.aloha19.stage2),
+                close=z(tx.aloha19.close),  # Solo Texas tiene "close"
+                finished=fl_finished + tx_finished,
+                total=fl_total + tx_total
+            ),
+            wiring=WiringSummary(
+                pending=z(fl.wiring.pending) + z(tx.wiring.pending),
+                finished=z(fl.wiring.finished) + z(tx.wiring.finished),
+                close=tx_wiring_close  # NUEVO: Solo Texas tiene wiring close
+            ),
+            technologies=TechnologiesSummary(
+                fresh_ai=z(fl.technologies.fresh_ai) + z(tx.technologies.fresh_ai),
+                edmb=z(fl.technologies.edmb) + z(tx.technologies.edmb),
+                idmb=z(fl.technologies.idmb) + z(tx.technologies.idmb),
+                qb=z(fl.technologies.qb) + z(tx.technologies.qb),
+                kiosk=z(fl.technologies.kiosk) + z(tx.technologies.kiosk)
+            ),
             # CORREGIDO: Combinar proyectos globales
-            "projects": {
-                "signed": fl_signed + tx_signed,  # Solo Florida tiene signed
-                "quote": fl_quote + tx_quote,  # Florida + Texas quotes
-                "paid": fl_paid + tx_paid,  # Solo Florida tiene paid
-                
-            },
+            projects=ProjectsSummary(
+                signed=fl_signed + tx_signed,  # Solo Florida tiene signed
+                quote=fl_quote + tx_quote,  # Florida + Texas quotes
+                paid=fl_paid + tx_paid,  # Solo Florida tiene paid
+            ),
             # AGREGADO: Datos separados para gráficas individuales
-            "project_types_florida": {
-                "edmb_idmb_qb": safe_get(florida_data, 'project_types.edmb_idmb_qb'),
-                "fai_edmb_idmb_qb": safe_get(florida_data, 'project_types.fai_edmb_idmb_qb')
-            },
-            "project_types_texas": {
-                "edmb": safe_get(texas_data, 'project_types.edmb'),
-                "edmb_idmb_qb": safe_get(texas_data, 'project_types.edmb_idmb_qb'),
-                "idmb_qb": safe_get(texas_data, 'project_types.idmb_qb')
-            }
-        }
+            project_types_florida=ProjectTypesSummary(
+                edmb_idmb_qb=z(fl.project_types.edmb_idmb_qb),
+                fai_edmb_idmb_qb=z(fl.project_types.fai_edmb_idmb_qb)
+            ),
+            project_types_texas=ProjectTypesSummary(
+                edmb=z(tx.project_types.edmb),
+                edmb_idmb_qb=z(tx.project_types.edmb_idmb_qb),
+                idmb_qb=z(tx.project_types.idmb_qb)
+            )
+        )
         
-        logger.info(f"Global combinado - Total: {global_data['aloha19']['total']}, Finished: {global_data['aloha19']['finished']}")
-        logger.info(f"Global Fresh AI: {global_data['technologies']['fresh_ai']}")
+        logger.info(f"Global combinado - Total: {global_data.aloha19.total}, Finished: {global_data.aloha19.finished}")
+        logger.info(f"Global Fresh AI: {global_data.technologies.fresh_ai}")
         
         return global_data
         
     except Exception as e:
         logger.error(f"Error combinando datos: {str(e)}")
-        return {}
+        return None
+
+# KPIs PRECALCULADOS
+
+def percentage(part, total):
+    """Porcentaje con un decimal (0 si el total es 0)"""
+    try:
+        return round(part / total * 100, 1) if total else 0
+    except (TypeError, ZeroDivisionError):
+        return 0
+
+def weekly_completed_series(*calendars):
+    """Suma las tiendas completadas por semana de uno o más calendarios, ordenadas por fecha"""
+    completed_by_week = {}
+    for calendar in calendars:
+        if not calendar or calendar.get("status") != "success":
+            continue
+        for week in calendar.get("weekly_schedule", []):
+            try:
+                week_start = datetime.strptime(week["week_start"], "%m/%d/%Y")
+            except (KeyError, TypeError, ValueError):
+                continue
+            completed_by_week[week_start] = completed_by_week.get(week_start, 0) + week.get("completed", 0)
+    return sorted(completed_by_week.items())
+
+def throughput_series(series, today=None):
+    """Tiendas completadas por semana cerrada hasta hoy, rellenando con 0 las semanas sin datos.
+    Devuelve los valores y la última semana cerrada que tenía datos"""
+    today = today or datetime.now()
+    closed = [(week_start, completed) for week_start, completed in series
+              if week_start + timedelta(days=7) <= today]
+    if not closed:
+        return [], None
+
+    counts = dict(closed)
+    first_week = closed[0][0]
+    # Hasta la última semana cerrada: si no hubo avance reciente, el promedio lo refleja
+    n_weeks = (today - first_week).days // 7
+    weeks = [first_week + timedelta(weeks=i) for i in range(n_weeks)]
+    return [counts.get(week, 0) for week in weeks], closed[-1][0]
+
+def compute_burn_rate(series, weeks=BURN_RATE_WEEKS, today=None):
+    """Promedio de tiendas completadas por semana en las últimas semanas ya cerradas (con ceros)"""
+    values, _ = throughput_series(series, today)
+    recent = values[-weeks:]
+    if not recent:
+        return 0
+    return round(sum(recent) / len(recent), 2)
+
+def project_finish_date(remaining, burn_rate, today=None):
+    """Fecha estimada de fin a partir del avance semanal"""
+    today = today or datetime.now()
+    if remaining <= 0:
+        return today.strftime("%m/%d/%Y")
+    if burn_rate <= 0:
+        return "TBD"
+    return (today + timedelta(weeks=remaining / burn_rate)).strftime("%m/%d/%Y")
+
+def compute_region_kpis(data, series):
+    """KPIs de una región (o global) a partir de sus datos resumen y avance semanal"""
+    data = data or RegionSummary()
+    z = zero_if_none
+
+    total = z(data.aloha19.total)
+    finished = z(data.aloha19.finished)
+    remaining = max(total - finished, 0)
+    burn_rate = compute_burn_rate(series)
+
+    return {
+        "aloha19": {
+            "total": total,
+            "finished": finished,
+            "remaining": remaining,
+            "completion_rate": percentage(finished, total)
+        },
+        "wiring": {
+            "finished": z(data.wiring.finished),
+            "pending": z(data.wiring.pending),
+            "completion_rate": percentage(z(data.wiring.finished), total)
+        },
+        "projects": {
+            "paid": z(data.projects.paid),
+            "quote": z(data.projects.quote),
+            "signed": z(data.projects.signed),
+            "paid_rate": percentage(z(data.projects.paid), z(data.projects.quote))
+        },
+        "fresh_ai": z(data.technologies.fresh_ai),
+        "weekly_burn_rate": burn_rate,
+        "projected_finish": project_finish_date(remaining, burn_rate)
+    }
+
+def compute_kpis(florida_data, texas_data, global_data, florida_calendar, texas_calendar):
+    """Calcula los KPIs por región y globales (se ejecuta una vez por ingesta)"""
+    try:
+        return {
+            "florida": compute_region_kpis(florida_data, weekly_completed_series(florida_calendar)),
+            "texas": compute_region_kpis(texas_data, weekly_completed_series(texas_calendar)),
+            "global": compute_region_kpis(global_data, weekly_completed_series(florida_calendar, texas_calendar))
+        }
+    except Exception as e:
+        logger.error(f"Error calculando KPIs: {str(e)}")
+        return {"florida": {}, "texas": {}, "global": {}}
+
+# PRONÓSTICO DE FIN DEL ROLLOUT
+
+def fit_linear_trend(values):
+    """Mínimos cuadrados de la forma y = a + b*x sobre el índice de semana"""
+    n = len(values)
+    if n < 2:
+        return (values[0] if values else 0), 0, 0
+    xs = range(n)
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, values))
+    slope = sxy / sxx
+    intercept = mean_y - slope * mean_x
+    residuals = [y - (intercept + slope * x) for x, y in zip(xs, values)]
+    stderr = (sum(r * r for r in residuals) / max(n - 2, 1)) ** 0.5
+    return intercept, slope, stderr
+
+def weeks_to_complete_linear(remaining, intercept, slope, start_index):
+    """Semanas hasta acumular 'remaining' tiendas siguiendo la tendencia lineal"""
+    rates = [max(intercept + slope * (start_index + t), 0) for t in range(1, FORECAST_MAX_WEEKS + 1)]
+    accumulated = 0
+    for week, rate in enumerate(rates, start=1):
+        accumulated += rate
+        if accumulated >= remaining:
+            return week
+    return None
+
+def weeks_to_complete_poisson(remaining, rate):
+    """Semanas esperadas y banda de confianza suponiendo completadas ~ Poisson(rate) por semana"""
+    if rate <= 0:
+        return None, None, None
+    # N(t) ~ Normal(rate*t, rate*t): resolver rate*t ± z*sqrt(rate*t) = remaining
+    root = (FORECAST_Z ** 2 + 4 * remaining) ** 0.5
+    optimistic = ((root - FORECAST_Z) / 2) ** 2 / rate
+    pessimistic = ((root + FORECAST_Z) / 2) ** 2 / rate
+    return remaining / rate, optimistic, pessimistic
+
+def format_projection(weeks, today):
+    """Convierte semanas hacia adelante en fecha MM/DD/YYYY (TBD si no hay proyección)"""
+    if weeks is None or weeks > FORECAST_MAX_WEEKS:
+        return "TBD"
+    return (today + timedelta(weeks=weeks)).strftime("%m/%d/%Y")
+
+def forecast_region(data, series, today=None):
+    """Pronóstico de fecha de fin para una región a partir del avance semanal"""
+    today = today or datetime.now()
+    data = data or RegionSummary()
+    remaining = max(zero_if_none(data.aloha19.total) - zero_if_none(data.aloha19.finished), 0)
+    values, last_week = throughput_series(series, today)
+
+    result = {
+        "remaining": remaining,
+        "weeks_observed": len(values),
+        "last_observed_week": last_week.strftime("%m/%d/%Y") if last_week else None,
+        "confidence": 0.9
+    }
+
+    if remaining <= 0:
+        done = today.strftime("%m/%d/%Y")
+        result["moving_average"] = {"weekly_rate": 0, "projected_finish": done, "low": done, "high": done}
+        result["linear"] = {"intercept": 0, "slope": 0, "projected_finish": done, "low": done, "high": done}
+        return result
+
+    # Promedio móvil (el mismo burn rate de /api/kpis) + modelo Poisson para la banda
+    rate = compute_burn_rate(series, today=today)
+    expected, optimistic, pessimistic = weeks_to_complete_poisson(remaining, rate)
+    result["moving_average"] = {
+        "weekly_rate": round(rate, 2),
+        "projected_finish": format_projection(expected, today),
+        "low": format_projection(optimistic, today),
+        "high": format_projection(pessimistic, today)
+    }
+
+    # Tendencia lineal del avance semanal, banda con el error estándar de los residuos
+    intercept, slope, stderr = fit_linear_trend(values)
+    margin = FORECAST_Z * stderr / (len(values) ** 0.5) if values else 0
+    start_index = len(values) - 1
+    result["linear"] = {
+        "intercept": round(intercept, 3),
+        "slope": round(slope, 3),
+        "projected_finish": format_projection(
+            weeks_to_complete_linear(remaining, intercept, slope, start_index), today),
+        "low": format_projection(
+            weeks_to_complete_linear(remaining, intercept + margin, slope, start_index), today),
+        "high": format_projection(
+            weeks_to_complete_linear(remaining, intercept - margin, slope, start_index), today)
+    }
+    return result
+
+def compute_forecasts(florida_data, texas_data, global_data, florida_calendar, texas_calendar):
+    """Pronósticos por región y global (se ejecuta una vez por ingesta)"""
+    try:
+        return {
+            "florida": forecast_region(florida_data, weekly_completed_series(florida_calendar)),
+            "texas": forecast_region(texas_data, weekly_completed_series(texas_calendar)),
+            "global": forecast_region(global_data, weekly_completed_series(florida_calendar, texas_calendar))
+        }
+    except Exception as e:
+        logger.error(f"Error calculando pronósticos: {str(e)}")
+        return {"florida": {}, "texas": {}, "global": {}}
 
 # FUNCIONES PARA TABLAS DETALLADAS
 
-def get_table_data(sheet_name, columns=None, filter_rows=True, max_row=None):
+# Mapeo de columnas a nombres legibles (basado en el diagnóstico real)
+COLUMN_NAMES = {
+    'A': 'STORE', 'B': 'ADDRESS', 'C': 'PHONE/STORE PHONE', 'D': 'DM', 'E': 'GM',
+    'F': 'A19', 'G': 'WIRING', 'H': 'FRESH AI', 'I': 'EDMB', 'J': 'IDMB',
+    'K': 'QB', 'L': 'KIOSK', 'M': 'A19 UP', 'N':'NETXEO PRO', 'O': 'START REMOD', 'P': 'END REMOD',
+    'Q': 'PROJECT', 'R': 'AUV', 'S': 'COST', 'T': 'STATUS', 'U': 'CABLE INSTALL',
+    'V': 'DELIVERY DATE', 'W': 'INSTALLATION DATE', 'X': 'INSTALL'
+}
+
+# Columnas que contienen fechas (no convertir 0 a "---")
+DATE_COLUMNS = ['M', 'N', 'O', 'P', 'U', 'V', 'W']
+
+# Columnas específicas de la tabla de proyectos según diagnóstico:
+# A=STORE, B=ADDRESS, M=A19 UP, 
+PROJECT_COLUMNS = ['A', 'B', 'M', 'N', 'Q', 'R', 'S', 'T', 'U', 'V', 'W']
+
+# Filtros válidos para la columna PROJECT   
+VALID_PROJECTS = ['FAI,EDMB,IDMB,QUE', 'EDMB-IDMB-QB', 'EDMB', 'EDMB-IDMB-QB', 'IDMB-QB']
+
+# Última fila que se lee de cada hoja COM (rango de tiendas del Excel de SharePoint)
+COM_MAX_ROWS = {'TEX-COM': 59, 'FLO-COM': 28}
+
+def table_max_row(sheet_name, sheet, max_row=None):
+    """Última fila a leer según los rangos específicos de cada hoja"""
+    if max_row is not None:
+        return max_row
+    if sheet_name in COM_MAX_ROWS:
+        return min(COM_MAX_ROWS[sheet_name], sheet.max_row)
+    return sheet.max_row
+
+def iter_table_rows(sheet, columns, max_row, filter_rows=True):
+    """Genera las filas de una hoja (desde la fila 2) con el formato de tabla"""
+    # Leer datos fila por fila (empezar desde fila 2 para evitar headers)
+    for row_num in range(2, max_row + 1):
+        row_data = {}
+        valid_row = False
+        
+        for col in columns:
+            try:
+                cell_value = sheet[f"{col}{row_num}"].value
+                # Manejo especial para columnas de fecha
+                if col in DATE_COLUMNS:
+                    if cell_value is None:
+                        cell_value = "---"
+                    else:
+                        # Para fechas, usar la función de formateo de fecha
+                        formatted_date = read_excel_date_cell(sheet, f"{col}{row_num}")
+                        cell_value = formatted_date if formatted_date != "TBD" else "---"
+                else:
+                    # Para otras columnas, manejo normal
+                    if cell_value is None:
+                        cell_value = "---"
+                    elif isinstance(cell_value, (int, float)) and cell_value == 0:
+                        cell_value = "---"  # Cambiar 0 por "---" solo en columnas no-fecha
+                    else:
+                        cell_value = str(cell_value).strip()
+                        if cell_value in ["", "0", "0.0"]:
+                            cell_value = "---"
+                
+                row_data[col] = cell_value
+                row_data[f"{col}_name"] = COLUMN_NAMES.get(col, f"Col_{col}")
+                
+                # Marcar como fila válida si tiene contenido real
+                if cell_value not in ["---", "", " "]:
+                    valid_row = True
+                    
+            except Exception as e:
+                logger.error(f"Error leyendo celda {col}{row_num}: {str(e)}")
+                row_data[col] = "---"
+                row_data[f"{col}_name"] = COLUMN_NAMES.get(col, f"Col_{col}")
+        
+        # Agregar fila solo si es válida o si no estamos filtrando
+        if valid_row or not filter_rows:
+            yield {"row": row_num, "data": row_data}
+
+def get_table_data(sheet_name, columns=None, filter_rows=True, max_row=None, wb=None):
     """Obtiene datos de una hoja para tabla con filtros opcionales"""
     try:
-        global workbook
-        if not workbook or sheet_name not in workbook.sheetnames:
+        wb = wb or published.workbook
+        if not wb or sheet_name not in wb.sheetnames:
             return {"error": f"Hoja {sheet_name} no encontrada"}
         
-        sheet = workbook[sheet_name]
+        sheet = wb[sheet_name]
         logger.info(f"Leyendo tabla de hoja: {sheet_name}")
         
         # Definir rangos específicos por hoja
-        if sheet_name == 'TEX-COM':
-            actual_max_row = min(59, sheet.max_row) if max_row is None else max_row
-        elif sheet_name == 'FLO-COM':
-            actual_max_row = min(28, sheet.max_row) if max_row is None else max_row
-        else:
-            actual_max_row = sheet.max_row if max_row is None else max_row
+        actual_max_row = table_max_row(sheet_name, sheet, max_row)
         
         # Si no se especifican columnas, leer de A hasta W (23)
         if not columns:
             columns = [chr(65 + i) for i in range(24)]  # A-X
         
-        table_data = []
-        
-        # Mapeo de columnas a nombres legibles (basado en el diagnóstico real)
-        column_names = {
-            'A': 'STORE', 'B': 'ADDRESS', 'C': 'PHONE/STORE PHONE', 'D': 'DM', 'E': 'GM',
-            'F': 'A19', 'G': 'WIRING', 'H': 'FRESH AI', 'I': 'EDMB', 'J': 'IDMB',
-            'K': 'QB', 'L': 'KIOSK', 'M': 'A19 UP', 'N':'NETXEO PRO', 'O': 'START REMOD', 'P': 'END REMOD',
-            'Q': 'PROJECT', 'R': 'AUV', 'S': 'COST', 'T': 'STATUS', 'U': 'CABLE INSTALL',
-            'V': 'DELIVERY DATE', 'W': 'INSTALLATION DATE', 'X': 'INSTALL'
-        }
+        table_data = list(iter_table_rows(sheet, columns, actual_max_row, filter_rows))
         
-        # Columnas que contienen fechas (no convertir 0 a "---")
-        date_columns = ['M', 'N', 'O', 'P', 'U', 'V', 'W']
+        logger.info(f"Tabla {sheet_name} leída: {len(table_data)} filas (rango hasta fila {actual_max_row})")
         
-        # 
-        
-        # Leer datos fila por fila (empezar desde fila 2 para evitar headers)
-        for row_num in range(2, actual_max_row + 1):
-            row_data = {}
-            valid_row = False
-            
-            for col in columns:
-                try:
-                    cell_value = sheet[f"{col}{row_num}"].value
-                    # Manejo especial para columnas de fecha
-                    if col in date_columns:
-                        if cell_value is None:
-                            cell_value = "---"
-                        else:
-                            # Para fechas, usar la función de formateo de fecha
-                            formatted_date = read_excel_date_cell(sheet, f"{col}{row_num}")
-                            cell_value = formatted_date if formatted_date != "TBD" else "---"
-                    else:
-                        # Para otras columnas, manejo normal
-                        if cell_value is None:
-                            cell_value = "---"
-                        elif isinstance(cell_value, (int, float)) and cell_value == 0:
-                            cell_value = "---"  # Cambiar 0 por "---" solo en columnas no-fecha
-                        else:
-                            cell_value = str(cell_value).strip()
-                            if cell_value in ["", "0", "0.0"]:
-                                cell_value = "---"
-                    
-                    row_data[col] = cell_value
-                    row_data[f"{col}_name"] = column_names.get(col, f"Col_{col}")
-                    
-                    # Marcar como fila válida si tiene contenido real
-                    if cell_value not in ["---", "", " "]:
-                        valid_row = True
-                        
-                except Exception as e:
-                    logger.error(f"Error leyendo celda {col}{row_num}: {str(e)}")
-                    row_data[col] = "---"
-                    row_data[f"{col}_name"] = column_names.get(col, f"Col_{col}")
-            
-            # Agregar fila solo si es válida o si no estamos filtrando
-            if valid_row or not filter_rows:
-                table_data.append({"row": row_num, "data": row_data})
-        
-        logger.info(f"Tabla {sheet_name} leída: {len(table_data)} filas (rango hasta fila {actual_max_row})")
-        
-        return {"data": table_data, "columns": columns, "column_names": column_names}
+        return {"data": table_data, "columns": columns, "column_names": COLUMN_NAMES}
         
     except Exception as e:
         logger.error(f"Error leyendo tabla {sheet_name}: {str(e)}")
         return {"error": str(e)}
 
+FILTER_COLUMNS = ['A', 'B', 'Q']
+
+def iter_project_rows(wb, debug_info, columns=None):
+    """Genera las filas de FLO-COM y TEX-COM cuyo PROJECT coincide con los filtros válidos"""
+    columns = columns or PROJECT_COLUMNS
+    # STORE (A), ADDRESS (B) y PROJECT (Q) se necesitan para filtrar aunque no se proyecten;
+    # quien consume las filas proyecta solo las columnas pedidas
+    read_columns = columns + [col for col in FILTER_COLUMNS if col not in columns]
+    
+    for sheet_name in ['FLO-COM', 'TEX-COM']:
+        if sheet_name not in [s for s in (wb.sheetnames if wb else [])]:
+            logger.warning(f"Hoja {sheet_name} no encontrada")
+            debug_info["sheets_processed"].append(f"{sheet_name}: NO_EXISTE")
+            continue
+        
+        sheet = wb[sheet_name]
+        debug_info["sheets_processed"].append(f"{sheet_name}: PROCESADA")
+        
+        # Filtrar filas según PROJECT 
+        for row_info in iter_table_rows(sheet, read_columns, table_max_row(sheet_name, sheet), filter_rows=False):
+            row_data = row_info["data"]
+            debug_info["total_rows_checked"] += 1
+            
+            # PROJECT está en columna Q
+            project_value = row_data.get('Q', '---').strip()
+            
+            if project_value not in ['---', '', ' ', 'NULL', '-----']:
+                debug_info["rows_with_project_data"] += 1
+                logger.info(f"Proyecto encontrado en {sheet_name} fila {row_info['row']}: '{project_value}'")
+            
+            # Verificar si el proyecto coincide con alguno de los filtros válidos
+            project_matches = False
+            for valid_project in VALID_PROJECTS:
+                if valid_project.upper() in project_value.upper():
+                    project_matches = True
+                    debug_info["rows_matching_filters"] += 1
+                    logger.info(f"Coincidencia encontrada: '{project_value}' contiene '{valid_project}'")
+                    break
+            
+            # Solo incluir si tiene un proyecto válido y datos completos
+            if project_matches:
+                # Verificar que tenga al menos STORE o ADDRESS válidos
+                store = row_data.get('A', '---')
+                address = row_data.get('B', '---')
+                
+                if store not in ['---', '', ' '] or address not in ['---', '', ' ']:
+                    # Agregar información de la hoja de origen
+                    row_data['_source_sheet'] = sheet_name
+                    row_data['_region'] = 'Florida' if sheet_name == 'FLO-COM' else 'Texas'
+                    logger.info(f"Fila válida agregada: Store={store}, Project={project_value}")
+                    yield row_info
+
+# ÍNDICE DE TIENDAS (columna A de FLO-COM / TEX-COM)
+
+STORE_SHEETS = {'FLO-COM': 'Florida', 'TEX-COM': 'Texas'}
+STORE_SUMMARY_COLUMNS = ['B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'X']
+STORE_PROJECT_COLUMNS = ['Q', 'R', 'S', 'T', 'U', 'V', 'W']
+STORE_READ_COLUMNS = ['A'] + STORE_SUMMARY_COLUMNS + STORE_PROJECT_COLUMNS
+STORE_HISTORY_SIZE = int(os.environ.get("STORE_HISTORY_SIZE", "10"))
+
+def store_key(value):
+    """Normaliza el identificador de tienda para usarlo como llave del índice"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    key = str(value).strip().upper()
+    return key or None
+
+def build_store_index(wb, calendars, previous=None, previous_update=None):
+    """Construye el índice STORE -> registro combinado (se ejecuta una vez por ingesta)"""
+    index = {}
+    previous = previous or {}
+    
+    # Fechas de calendario por tienda (raw_dates de get_weekly_schedule_data)
+    calendar_by_store = {}
+    for calendar in calendars:
+        for entry in calendar.get("raw_dates", []):
+            calendar_by_store.setdefault(store_key(entry["store"]), entry)
+    
+    for sheet_name, region in STORE_SHEETS.items():
+        if not wb or sheet_name not in wb.sheetnames:
+            continue
+        sheet = wb[sheet_name]
+        for row_info in iter_table_rows(sheet, STORE_READ_COLUMNS, table_max_row(sheet_name, sheet)):
+            row_data = row_info["data"]
+            key = store_key(sheet[f"A{row_info['row']}"].value)
+            if not key:
+                continue
+            if key in index:
+                logger.warning(f"Tienda {key} duplicada en {sheet_name} fila {row_info['row']}, se conserva la primera")
+                continue
+            
+            # Solo se guardan las columnas con contenido para mantener el registro pequeño
+            columns = {COLUMN_NAMES[col]: row_data[col] for col in STORE_SUMMARY_COLUMNS if row_data[col] != "---"}
+            project = {COLUMN_NAMES[col]: row_data[col] for col in STORE_PROJECT_COLUMNS if row_data[col] != "---"}
+            project_value = row_data['Q'].upper()
+            project["valid"] = any(valid.upper() in project_value for valid in VALID_PROJECTS)
+            
+            calendar = calendar_by_store.get(key)
+            record = {
+                "store": row_data['A'],
+                "region": region,
+                "sheet": sheet_name,
+                "row": row_info["row"],
+                "columns": columns,
+                "project": project,
+                "calendar": {k: calendar[k] for k in ("date", "week", "status")} if calendar else None,
+                "history": []
+            }
+            
+            # Historial: cambios respecto al índice del snapshot anterior
+            old = previous.get(key)
+            if old:
+                record["history"] = old["history"]
+                changes = {}
+                for section in ("columns", "project"):
+                    for name in set(old[section]) | set(record[section]):
+                        if old[section].get(name) != record[section].get(name):
+                            changes[name] = [old[section].get(name), record[section].get(name)]
+                if changes:
+                    record["history"] = (old["history"] + [{"until": previous_update, "changes": changes}])[-STORE_HISTORY_SIZE:]
+            index[key] = record
+    
+    logger.info(f"Índice de tiendas construido: {len(index)} tiendas")
+    return index
+
+# CUBO DE CONTEOS PARA /api/pivot
+# Cada celda del cubo es una combinación de dimensiones con su número de tiendas; se
+# construye desde el índice de tiendas, así que las consultas no vuelven a leer filas.
+
+PIVOT_DIMENSIONS = ('REGION', 'DM', 'GM', 'A19', 'WIRING', 'PROJECT', 'STATUS', 'WEEK')
+
+def store_dimensions(record):
+    """Valores de las dimensiones del cubo para un registro del índice de tiendas"""
+    values = {
+        "REGION": record["region"].upper(),
+        "WEEK": record["calendar"]["week"] if record["calendar"] else "---"
+    }
+    for name in ('DM', 'GM', 'A19', 'WIRING'):
+        values[name] = record["columns"].get(name, "---").upper()
+    for name in ('PROJECT', 'STATUS'):
+        values[name] = record["project"].get(name, "---").upper()
+    return tuple(values[name] for name in PIVOT_DIMENSIONS)
+
+def build_pivot_cube(stores):
+    """Cuenta tiendas por combinación de dimensiones (se ejecuta una vez por ingesta)"""
+    cube = {}
+    for record in stores.values():
+        key = store_dimensions(record)
+        cube[key] = cube.get(key, 0) + 1
+    logger.info(f"Cubo de pivote: {len(cube)} combinaciones para {len(stores)} tiendas")
+    return cube
+
+def parse_pivot_filters(specs):
+    """Convierte filtros DIM:valor|valor (separados por coma) a {posición: valores}"""
+    filters = {}
+    for spec in specs:
+        for item in spec.split(','):
+            if not item.strip():
+                continue
+            name, separator, values = item.partition(':')
+            name = name.strip().upper()
+            if not separator or name not in PIVOT_DIMENSIONS:
+                raise ValueError(f"Filtro no válido: '{item}'. Dimensiones: {list(PIVOT_DIMENSIONS)}")
+            filters[PIVOT_DIMENSIONS.index(name)] = {v.strip().upper() for v in values.split('|')}
+    return filters
+
+def pivot_sort_key(dimension):
+    """Orden de los valores de una dimensión (semanas por fecha, '---' al final)"""
+    def key(value):
+        if value == "---":
+            return (1, "")
+        if dimension == 'WEEK':
+            parsed = parse_date_for_calendar(value)
+            return (0, parsed.isoformat() if parsed else value)
+        return (0, value)
+    return key
+
+def pivot(cube, rows, cols=None, filters=None):
+    """Agrega el cubo por las dimensiones rows × cols aplicando los filtros"""
+    row_index = PIVOT_DIMENSIONS.index(rows)
+    col_index = PIVOT_DIMENSIONS.index(cols) if cols else None
+    filters = filters or {}
+    counts = {}
+    for key, count in cube.items():
+        if any(key[position] not in values for position, values in filters.items()):
+            continue
+        cell = (key[row_index], key[col_index] if col_index is not None else "COUNT")
+        counts[cell] = counts.get(cell, 0) + count
+    
+    row_values = sorted({r for r, _ in counts}, key=pivot_sort_key(rows))
+    col_values = sorted({c for _, c in counts}, key=pivot_sort_key(cols)) if cols else ["COUNT"]
+    matrix = [[counts.get((r, c), 0) for c in col_values] for r in row_values]
+    return {
+        "rows": rows,
+        "cols": cols,
+        "row_values": row_values,
+        "col_values": col_values,
+        "matrix": matrix,
+        "row_totals": [sum(line) for line in matrix],
+        "col_totals": [sum(line[i] for line in matrix) for i in range(len(col_values))],
+        "total": sum(counts.values())
+    }
+
+# FINANZAS DE PROYECTOS (COST / AUV como arreglos numéricos)
+# Se parsean una vez en la ingesta a arreglos array('d') (NaN = sin dato) alineados con
+# las listas de región, tipo de proyecto y status; las consultas agregan por índices.
+
+FINANCIAL_GROUPS = {'region': 'REGION', 'project': 'PROJECT', 'status': 'STATUS'}
+
+def parse_money(value):
+    """Convierte '$12,345', '(1,200)', 1234 o '---' a float (NaN si no hay número)"""
+    if value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace('$', '').replace(',', '').replace(' ', '')
+    negative = text.startswith('(') and text.endswith(')')
+    try:
+        number = float(text.strip('()'))
+    except ValueError:
+        return math.nan
+    return -number if negative else number
+
+def build_financial_arrays(stores):
+    """Arreglos numéricos de AUV/COST de las tiendas con PROJECT válido (una vez por ingesta)"""
+    arrays = {"REGION": [], "PROJECT": [], "STATUS": [], "auv": array('d'), "cost": array('d')}
+    for record in stores.values():
+        project = record["project"]
+        if not project["valid"]:
+            continue
+        arrays["REGION"].append(record["region"])
+        arrays["PROJECT"].append(project.get("PROJECT", "---").upper())
+        arrays["STATUS"].append(project.get("STATUS", "---").upper())
+        arrays["auv"].append(parse_money(project.get("AUV")))
+        arrays["cost"].append(parse_money(project.get("COST")))
+    logger.info(f"Finanzas de proyectos: {len(arrays['cost'])} proyectos")
+    return arrays
+
+def quantile(ordered, q):
+    """Cuantil con interpolación lineal sobre valores ya ordenados"""
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def summarize_amounts(values):
+    """Total, promedio y distribución de un arreglo ignorando NaN"""
+    present = sorted(v for v in values if not math.isnan(v))
+    if not present:
+        return {"count": 0, "total": 0, "average": None, "min": None, "p25": None, "median": None, "p75": None, "max": None}
+    total = math.fsum(present)
+    return {
+        "count": len(present),
+        "total": round(total, 2),
+        "average": round(total / len(present), 2),
+        "min": present[0],
+        "p25": round(quantile(present, 0.25), 2),
+        "median": round(quantile(present, 0.5), 2),
+        "p75": round(quantile(present, 0.75), 2),
+        "max": present[-1]
+    }
+
+def summarize_financials(arrays, indexes):
+    """Resumen de COST y AUV para un subconjunto de proyectos"""
+    cost = array('d', (arrays["cost"][i] for i in indexes))
+    auv = array('d', (arrays["auv"][i] for i in indexes))
+    cost_summary = summarize_amounts(cost)
+    auv_summary = summarize_amounts(auv)
+    return {
+        "projects": len(indexes),
+        "cost": cost_summary,
+        "auv": auv_summary,
+        "cost_to_auv_pct": percentage(cost_summary["total"], auv_summary["total"])
+    }
+
+def compute_financials(arrays, region=None):
+    """Totales globales y por región, tipo de proyecto y status"""
+    indexes = [i for i, value in enumerate(arrays["REGION"]) if region is None or value.lower() == region]
+    groups = {}
+    for group, column in FINANCIAL_GROUPS.items():
+        members = {}
+        for i in indexes:
+            members.setdefault(arrays[column][i], []).append(i)
+        groups[group] = {key: summarize_financials(arrays, members[key]) for key in sorted(members)}
+    return {"totals": summarize_financials(arrays, indexes), "by": groups}
+
+# TABLAS GENÉRICAS POR HOJA (/api/sheets/<name>/table)
+
+HEADER_SCAN_ROWS = 10       # Filas revisadas para encontrar el encabezado
+SHEET_TABLE_PAGE_SIZE = 100
+SHEET_TABLE_MAX_PAGE = 1000
+
+# Esquema y columnas de cada hoja, construidos una sola vez por workbook publicado
+sheet_table_cache = {"workbook": None, "tables": {}}
+sheet_table_lock = threading.Lock()
+
+def detect_header_row(rows):
+    """Índice (base 0) de la fila solo-texto más completa entre las primeras HEADER_SCAN_ROWS (None si no hay)"""
+    best_index, best_count = None, 0
+    for index, row in enumerate(rows[:HEADER_SCAN_ROWS]):
+        filled = [value for value in row if value is not None and str(value).strip()]
+        if len(filled) > best_count and all(isinstance(value, str) for value in filled):
+            best_index, best_count = index, len(filled)
+    return best_index
+
+def value_kind(value):
+    """Tipo de un valor de celda para inferir el tipo de la columna"""
+    if hasattr(value, 'strftime'):
+        return "date"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return "number"
+    return "text"
+
+def render_table_value(value, column_type):
+    """Valor de celda en el formato de la tabla columnar"""
+    if value is None:
+        return None
+    if hasattr(value, 'strftime'):
+        return value.strftime("%m/%d/%Y")
+    if column_type == "number":
+        return value
+    value = str(value).strip()
+    return value or None
+
+def build_sheet_table(sheet):
+    """Infiere encabezado y tipos y convierte la hoja a columnas (una pasada por hoja)"""
+    from openpyxl.utils.cell import get_column_letter
+    rows = list(sheet.iter_rows(values_only=True))
+    if not rows:
+        return {"header_row": None, "columns": [], "rows": 0, "data": {}}
+    header_index = detect_header_row(rows)
+    # Sin encabezado reconocible las columnas se nombran por su letra
+    header = rows[header_index] if header_index is not None else ()
+    start = header_index + 1 if header_index is not None else 0
+    body = [row for row in rows[start:] if any(value is not None for value in row)]
+    width = max(len(header), max((len(row) for row in body), default=0))
+    
+    columns, data = [], {}
+    for position in range(width):
+        letter = get_column_letter(position + 1)
+        name = header[position] if position < len(header) else None
+        name = str(name).strip() if name is not None and str(name).strip() else letter
+        if name in data:
+            name = f"{name}_{letter}"
+        values = [row[position] if position < len(row) else None for row in body]
+        kinds = {value_kind(value) for value in values if value is not None}
+        column_type = kinds.pop() if len(kinds) == 1 else ("empty" if not kinds else "text")
+        columns.append({"name": name, "letter": letter, "type": column_type})
+        data[name] = [render_table_value(value, column_type) for value in values]
+    
+    return {"header_row": start or None, "columns": columns, "rows": len(body), "data": data}
+
+def get_sheet_table(sheet_name, wb):
+    """Tabla columnar de una hoja del workbook publicado (construida una vez por snapshot)"""
+    with sheet_table_lock:
+        if sheet_table_cache["workbook"] is not wb:
+            sheet_table_cache["workbook"] = wb
+            sheet_table_cache["tables"] = {}
+        table = sheet_table_cache["tables"].get(sheet_name)
+        # Se construye bajo el lock: varios clientes a la vez comparten la misma pasada
+        if table is None:
+            table = build_sheet_table(wb[sheet_name])
+            sheet_table_cache["tables"][sheet_name] = table
+            logger.info(f"Tabla genérica de {sheet_name}: {table['rows']} filas, {len(table['columns'])} columnas")
+    return table
+
+def parse_table_filters(specs, columns):
+    """Convierte filtros COLUMNA:valor a (columna, valor en mayúsculas)"""
+    names = {column["name"].upper(): column["name"] for column in columns}
+    filters = []
+    for spec in specs:
+        name, separator, value = spec.partition(':')
+        if not separator or name.strip().upper() not in names:
+            raise ValueError(f"Filtro no válido: '{spec}' (usar COLUMNA:valor)")
+        filters.append((names[name.strip().upper()], value.strip().upper()))
+    return filters
+
+# EXPORTACIÓN DE TABLAS (CSV / XLSX / PARQUET)
+
+EXPORT_TABLES = {
+    'florida': 'FLO-COM',
+    'texas': 'TEX-COM',
+    'projects': None  # FLO-COM + TEX-COM filtradas por PROJECT
+}
+EXPORT_BATCH_ROWS = 500  # Filas por bloque enviado al cliente
+
+class ChunkSink:
+    """Archivo de solo escritura que acumula bytes para enviarlos por bloques"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def iter_export_records(table, columns, wb):
+    """Genera listas de valores (una por fila) para exportar, con los mismos filtros que la API JSON"""
+    if table == 'projects':
+        debug_info = {"sheets_processed": [], "total_rows_checked": 0,
+                      "rows_with_project_data": 0, "rows_matching_filters": 0}
+        for row_info in iter_project_rows(wb, debug_info, columns):
+            row_data = row_info["data"]
+            yield [row_data.get('_region', '---')] + [row_data.get(col, '---') for col in columns]
+        return
+
+    sheet_name = EXPORT_TABLES[table]
+    if not wb or sheet_name not in wb.sheetnames:
+        return
+    sheet = wb[sheet_name]
+    for row_info in iter_table_rows(sheet, columns, table_max_row(sheet_name, sheet), filter_rows=True):
+        row_data = row_info["data"]
+        yield [row_data.get(col, '---') for col in columns]
+
+def export_csv(records, header):
+    """CSV por bloques: el encabezado se envía de inmediato"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    yield buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate(0)
+    
+    pending = 0
+    for record in records:
+        writer.writerow(record)
+        pending += 1
+        if pending >= EXPORT_BATCH_ROWS:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate(0)
+            pending = 0
+    if pending:
+        yield buffer.getvalue().encode('utf-8')
+
+def export_xlsx(records, header, sheet_title):
+    """XLSX con openpyxl en modo write-only (memoria constante, se envía al terminar el zip)"""
+    import openpyxl
+    export_wb = openpyxl.Workbook(write_only=True)
+    sheet = export_wb.create_sheet(title=sheet_title[:31])
+    sheet.append(header)
+    for record in records:
+        sheet.append(record)
+    
+    with tempfile.TemporaryFile() as tmp:
+        export_wb.save(tmp)
+        tmp.seek(0)
+        while True:
+            chunk = tmp.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+
+def export_parquet(records, header, pa, pq):
+    """Parquet por row groups; cada grupo se envía apenas se escribe"""
+    schema = pa.schema([(name, pa.string()) for name in header])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                writer.write_table(pa.Table.from_pylist(
+                    [dict(zip(header, (str(v) for v in row))) for row in batch], schema=schema))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(header, (str(v) for v in row))) for row in batch], schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+@app.before_request
+def start_request_profile():
+    """Arranca el profiler para este request si está armado"""
+    if not profiling_state["request"] or is_prewarm_request():
+        return
+    if take_profiler_slot("request", request.path):
+        g.profiler = start_profiler()
+
+@app.before_request
+def load_snapshot_for_request():
+    """Las rutas de la API que no salen de la caché de respuestas leen el snapshot procesado"""
+    view = app.view_functions.get(request.endpoint)
+    if request.path.startswith('/api/') and not getattr(view, 'response_cached', False):
+        load_pending_snapshot()
+
+@app.teardown_request
+def finish_request_profile(exc=None):
+    """Detiene y guarda el perfil del request (si se inició)"""
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        save_profile(profiler, "request", request.path)
+
+@app.after_request
+def add_data_age_headers(response):
+    """Edad del snapshot servido en cada respuesta de la API"""
+    if request.path.startswith('/api/'):
+        age = data_age_seconds()
+        response.headers['X-Data-Freshness'] = freshness_level(age)
+        if age is not None:
+            response.headers['X-Data-Age'] = str(age)
+            # Con su propio Cache-Control (p. ej. el .ics), Age se restaría de max-age en los caches
+            if 'Cache-Control' not in response.headers:
+                response.headers['Age'] = str(age)
+    return response
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({"error": f"Archivo mayor a {UPLOAD_MAX_BYTES} bytes"}), 413
+
 @app.route('/')
 def home():
+    current = published.snapshot
     return jsonify({
         "message": "916 Foods Dashboard API",
-        "status": dashboard_data["status"],
-        "last_update": dashboard_data["last_update"]
+        "status": current.status,
+        "last_update": current.last_update
     })
 
 @app.route('/api/data')
+@cached_response
 def get_dashboard_data():
-    """Endpoint principal que devuelve todos los datos"""
-    logger.info(f"API request - Status: {dashboard_data['status']}")
-    return jsonify(dashboard_data)
+    """Endpoint principal que devuelve todos los datos (?version= para una versión anterior)"""
+    current = published.snapshot
+    logger.info(f"API request - Status: {current.status}")
+    requested = request.args.get('version')
+    if requested:
+        try:
+            entry = get_snapshot_entry(int(requested))
+        except ValueError:
+            return jsonify({"error": "version debe ser un número"})
+        if entry is None:
+            return jsonify({"error": f"Versión {requested} no disponible", "available": [s["version"] for s in list_snapshots()]})
+        return Response(entry["payload"], mimetype='application/json')
+    return jsonify(current.to_dict())
 
 @app.route('/api/florida')
+@cached_response
 def get_florida_data():
     """Endpoint para datos solo de Florida"""
+    current = published.snapshot
     return jsonify({
-        "data": dashboard_data["florida_data"],
-        "last_update": dashboard_data["last_update"],
-        "status": dashboard_data["status"]
+        "data": current.florida_data.to_dict() if current.florida_data else {},
+        "last_update": current.last_update,
+        "status": current.status
     })
 
-@app.route('/api/texas') 
+@app.route('/api/texas')
+@cached_response
 def get_texas_data():
     """Endpoint para datos solo de Texas"""
+    current = published.snapshot
+    return jsonify({
+        "data": current.texas_data.to_dict() if current.texas_data else {},
+        "last_update": current.last_update,
+        "status": current.status
+    })
+
+@app.route('/api/kpis')
+@cached_response
+def get_kpis():
+    """Endpoint ligero con los KPIs precalculados (region=florida|texas|global)"""
+    current = published
+    region = request.args.get('region', '').lower()
+    if not region:
+        return jsonify({"status": current.snapshot.status, **current.kpis})
+    if region not in ('florida', 'texas', 'global'):
+        return jsonify({"error": "Región debe ser 'florida', 'texas' o 'global'"})
+    return jsonify({
+        "status": current.snapshot.status,
+        "last_update": current.kpis.get("last_update"),
+        "region": region,
+        "kpis": current.kpis.get(region, {})
+    })
+
+@app.route('/api/forecast')
+@cached_response
+def get_forecast():
+    """Pronóstico de fecha de fin del rollout (region=florida|texas|global)"""
+    current = published
+    region = request.args.get('region', '').lower()
+    if not region:
+        return jsonify({"status": current.snapshot.status, **current.forecast})
+    if region not in ('florida', 'texas', 'global'):
+        return jsonify({"error": "Región debe ser 'florida', 'texas' o 'global'"})
     return jsonify({
-        "data": dashboard_data["texas_data"],
-        "last_update": dashboard_data["last_update"],
-        "status": dashboard_data["status"]
+        "status": current.snapshot.status,
+        "last_update": current.forecast.get("last_update"),
+        "region": region,
+        "forecast": current.forecast.get(region, {})
+    })
+
+@app.route('/api/freshness')
+def get_freshness():
+    """Estado de frescura global y por fuente"""
+    age = data_age_seconds()
+    with freshness_lock:
+        sources = {
+            source: {
+                key: value.isoformat() if isinstance(value, datetime) else value
+                for key, value in state.items()
+            }
+            for source, state in freshness_state.items()
+        }
+    for source, state in sources.items():
+        last_success = freshness_state[source]["last_success"]
+        source_age = int((datetime.now() - last_success).total_seconds()) if last_success else None
+        state["age_seconds"] = source_age
+        state["level"] = freshness_level(source_age)
+    current = published.snapshot
+    return jsonify({
+        "status": current.status,
+        "last_update": current.last_update,
+        "age_seconds": age,
+        "level": freshness_level(age),
+        "thresholds": {"fresh_seconds": FRESH_SECONDS, "stale_seconds": STALE_SECONDS},
+        "sources": sources
+    })
+
+@app.route('/api/quality')
+@cached_response
+def get_quality_report():
+    """Reporte de calidad de datos de la última ingesta"""
+    current = published
+    return jsonify({
+        "strict_mode": QUALITY_STRICT,
+        "last_update": current.snapshot.last_update,
+        **current.quality_report
     })
 
 @app.route('/api/refresh')
 def manual_refresh():
     """Endpoint para forzar actualización manual"""
     logger.info("Refresh manual solicitado")
-    threading.Thread(target=download_and_process_excel).start()
+    threading.Thread(target=run_refresh, args=("manual",)).start()
     return jsonify({"message": "Actualización iniciada"})
 
+@app.route('/api/upload', methods=['POST'])
+def upload_workbook():
+    """Recibe un Excel (campo 'file' o cuerpo crudo) y lo procesa en segundo plano"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    if (request.content_length or 0) > UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"Archivo mayor a {UPLOAD_MAX_BYTES} bytes"})
+    upload = request.files.get('file')
+    content = upload.read(UPLOAD_MAX_BYTES + 1) if upload else request.get_data()
+    if len(content) > UPLOAD_MAX_BYTES:
+        return jsonify({"error": f"Archivo mayor a {UPLOAD_MAX_BYTES} bytes"})
+    try:
+        check_workbook_bytes(content)
+    except Exception as e:
+        return jsonify({"error": str(e)})
+    
+    content_hash = hashlib.sha256(content).hexdigest()
+    if LOCAL_SOURCE_PATH:
+        # Con archivo local vigilado se reemplaza el archivo: el worker del scheduler lo reingiere
+        directory = os.path.dirname(os.path.abspath(LOCAL_SOURCE_PATH))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.xlsx', delete=False) as tmp:
+            tmp.write(content)
+        os.replace(tmp.name, LOCAL_SOURCE_PATH)
+        target = LOCAL_SOURCE_PATH
+    else:
+        threading.Thread(target=run_refresh, args=("upload", "upload", content)).start()
+        target = "upload"
+    logger.info(f"Excel recibido por upload: {len(content)} bytes -> {target}")
+    return jsonify({"message": "Actualización iniciada", "bytes": len(content), "sha256": content_hash, "target": target})
+
 @app.route('/api/remodel-dates')
+@cached_response
 def get_remodel_dates_api():
     """Endpoint para obtener fechas de remodelación desde SharePoint"""
     try:
         logger.info("API request - Fechas de remodelación")
-        dates = dashboard_data.get("remodel_dates", {})
+        current = published
+        dates = current.snapshot.remodel_dates
         
-        # Si no hay fechas en dashboard_data, intentar obtenerlas directamente
+        # Si no hay fechas en el snapshot, intentar obtenerlas directamente
         if not dates or dates.get("source") == "fallback":
-            dates = get_remodel_dates()
+            dates = get_remodel_dates(current.workbook)
         
         return jsonify({
             "status": "success",
-            "last_update": dashboard_data.get("last_update"),
+            "last_update": current.snapshot.last_update,
             **dates
         })
         
@@ -910,14 +2845,20 @@ def get_remodel_dates_api():
 
 # Nuevo endpoint para el calendario
 @app.route('/api/calendar')
+@cached_response
 def get_calendar_data():
     """Endpoint para obtener datos del calendario semanal"""
+    return jsonify(build_calendar_payload(published))
+
+def build_calendar_payload(current):
+    """Calendario semanal combinado de Florida y Texas de un estado publicado"""
     try:
         logger.info("API request - Datos de calendario")
         
         # Obtener datos de ambas hojas
-        florida_calendar = get_weekly_schedule_data('FLO-COM')
-        texas_calendar = get_weekly_schedule_data('TEX-COM')
+        wb = current.workbook
+        florida_calendar = get_weekly_schedule_data('FLO-COM', wb)
+        texas_calendar = get_weekly_schedule_data('TEX-COM', wb)
         
         # Combinar datos de ambas regiones
         combined_weekly = {}
@@ -985,67 +2926,198 @@ def get_calendar_data():
         for week_key in sorted(combined_weekly.keys()):
             weekly_schedule.append(combined_weekly[week_key])
         
-        return jsonify({
+        return {
             "status": "success",
-            "last_update": dashboard_data.get("last_update"),
+            "last_update": current.snapshot.last_update,
             "weekly_schedule": weekly_schedule,
             "florida_data": florida_calendar,
             "texas_data": texas_calendar,
             "total_weeks": len(weekly_schedule)
-        })
+        }
         
     except Exception as e:
         logger.error(f"Error en endpoint calendario: {str(e)}")
-        return jsonify({
+        return {
             "status": "error",
             "message": str(e)
-        })
+        }
+
+
+# CALENDARIO iCALENDAR (/api/calendar.ics) PARA SUSCRIPCIONES
+# Los eventos se derivan del snapshot; el .ics (bytes, gzip/br y ETag) solo se regenera
+# si cambian los eventos, así que los clientes suscritos reciben 304 entre snapshots.
+
+ICS_REGIONS = {'global': ('Florida', 'Texas'), 'florida': ('Florida',), 'texas': ('Texas',)}
+ICS_CACHE_CONTROL = 'public, max-age=900'
+STAGE_LABELS = (('stage1', 'Stage 1 remodel'), ('stage2', 'Stage 2 remodel'))
+
+ics_cache = {}  # región -> {"version", "key", "asset"}
+ics_lock = threading.Lock()
+
+def ics_escape(text):
+    """Escapa texto según RFC 5545"""
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+def ics_fold(line):
+    """Parte líneas de más de 75 octetos (continuación con un espacio)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line
+    parts, current = [], b''
+    for char in line:
+        piece = char.encode('utf-8')
+        if len(current) + len(piece) > (75 if not parts else 74):
+            parts.append(current.decode('utf-8'))
+            current = b''
+        current += piece
+    parts.append(current.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+def calendar_events(region, current):
+    """Eventos de día completo (uid, inicio, fin exclusivo, título, descripción) de una región"""
+    regions = ICS_REGIONS[region]
+    events = []
+    for key, record in sorted(current.store_index.items()):
+        calendar = record["calendar"]
+        if record["region"] not in regions or not calendar:
+            continue
+        day = parse_date_for_calendar(calendar["date"])
+        if not day:
+            continue
+        events.append((
+            f"a19-{key.lower()}",
+            day.date(),
+            day.date() + timedelta(days=1),
+            f"A19 UP {record['store']} ({calendar['status']})",
+            f"Región: {record['region']}\nA19: {record['columns'].get('A19', '---')}\nWIRING: {record['columns'].get('WIRING', '---')}\nPROJECT: {record['project'].get('PROJECT', '---')}"
+        ))
+    details = current.snapshot.remodel_dates.get("regional_details", {})
+    for name in regions:
+        dates = details.get(name.lower(), {})
+        for stage, label in STAGE_LABELS:
+            start = parse_date_for_calendar(dates.get(f"{stage}_start"))
+            end = parse_date_for_calendar(dates.get(f"{stage}_end")) or start
+            if start:
+                events.append((f"{stage}-{name.lower()}", start.date(), max(end, start).date() + timedelta(days=1),
+                               f"{label} - {name}", f"{dates.get(f'{stage}_start')} → {dates.get(f'{stage}_end')}"))
+    return events
+
+def revise_calendar_events(events, previous):
+    """Revisión de cada evento: DTSTAMP/LAST-MODIFIED del snapshot en que cambió su contenido y
+    SEQUENCE que sube con cada cambio, para que los clientes suscritos reemplacen su copia"""
+    stamp = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    revisions = {}
+    for uid, start, end, summary, description in events:
+        digest = hashlib.sha256(repr((start, end, summary, description)).encode('utf-8')).hexdigest()[:16]
+        old = previous.get(uid)
+        if old and old["hash"] == digest:
+            revisions[uid] = old
+        else:
+            revisions[uid] = {"hash": digest, "stamp": stamp, "sequence": old["sequence"] + 1 if old else 0}
+    return revisions
 
+def render_ics(region, events, revisions):
+    """Documento iCalendar con los eventos"""
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//916 Foods//Dashboard//ES",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:916 Foods remodel ({region})"
+    ]
+    for uid, start, end, summary, description in events:
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{uid}@916foods-dashboard",
+            # Fecha del último cambio del evento: el documento y su ETag solo cambian con los eventos
+            f"DTSTAMP:{revisions[uid]['stamp']}",
+            f"LAST-MODIFIED:{revisions[uid]['stamp']}",
+            f"SEQUENCE:{revisions[uid]['sequence']}",
+            f"DTSTART;VALUE=DATE:{start.strftime('%Y%m%d')}",
+            f"DTEND;VALUE=DATE:{end.strftime('%Y%m%d')}",
+            f"SUMMARY:{ics_escape(summary)}",
+            f"DESCRIPTION:{ics_escape(description)}",
+            "TRANSP:TRANSPARENT",
+            "END:VEVENT"
+        ]
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(ics_fold(line) for line in lines) + "\r\n").encode('utf-8')
+
+def calendar_ics_asset(region):
+    """.ics de la región, regenerado solo si los eventos cambiaron desde el último snapshot"""
+    current = published
+    with ics_lock:
+        cached = ics_cache.get(region)
+        if cached and cached["version"] == current.version:
+            return cached["asset"]
+        events = calendar_events(region, current)
+        revisions = [current.event_revisions[event[0]] for event in events]
+        key = hashlib.sha256(repr((events, revisions)).encode('utf-8')).hexdigest()
+        if cached and cached["key"] == key:
+            cached["version"] = current.version
+            return cached["asset"]
+        asset = static_asset(render_ics(region, events, current.event_revisions), 'text/calendar')
+        ics_cache[region] = {"version": current.version, "key": key, "asset": asset}
+        logger.info(f"Calendario .ics {region} regenerado: {len(events)} eventos")
+        return asset
+
+@app.route('/api/calendar.ics')
+def get_calendar_ics():
+    """Feed iCalendar de fechas A19 UP y stages de remodelación (?region=florida|texas|global)"""
+    region = request.args.get('region', 'global').lower()
+    if region not in ICS_REGIONS:
+        return jsonify({"error": "Región debe ser 'florida', 'texas' o 'global'"})
+    return static_asset_response(calendar_ics_asset(region), ICS_CACHE_CONTROL)
 
 # ENDPOINTS PARA TABLAS DETALLADAS
 @app.route('/api/table/<region>/detailed')
+@cached_response
 def get_detailed_regional_table(region):
     """Obtiene tabla detallada regional de hojas FLO-COM o TEX-COM"""
+    return jsonify(build_region_table_payload(region, published))
+
+def build_region_table_payload(region, current):
+    """Tabla detallada de la hoja COM de una región"""
     try:
         if region.lower() == 'florida':
             sheet_name = 'FLO-COM'
         elif region.lower() == 'texas':
             sheet_name = 'TEX-COM'
         else:
-            return jsonify({"error": "Región debe ser 'florida' o 'texas'"})
+            return {"error": "Región debe ser 'florida' o 'texas'"}
         
         # Leer toda la tabla de la hoja COM
-        result = get_table_data(sheet_name, filter_rows=True)
+        result = get_table_data(sheet_name, filter_rows=True, wb=current.workbook)
         
         if "error" in result:
-            return jsonify(result)
+            return result
         
-        return jsonify({
+        return {
             "status": "success",
             "region": region,
             "sheet": sheet_name,
             "data": result["data"],
             "columns": result["columns"],
             "total_rows": len(result["data"])
-        })
+        }
         
     except Exception as e:
         logger.error(f"Error en tabla detallada {region}: {str(e)}")
-        return jsonify({"error": str(e)})
+        return {"error": str(e)}
 
 @app.route('/api/table/projects')
+@cached_response
 def get_project_details_table():
     """Obtiene tabla de detalles de proyectos con columnas específicas y filtros"""
+    return jsonify(build_projects_table_payload(published))
+
+def build_projects_table_payload(current):
+    """Tabla de proyectos de FLO-COM y TEX-COM filtrada por PROJECT"""
     try:
-        # Columnas específicas requeridas según diagnóstico:
-        # A=STORE, B=ADDRESS, M=A19 UP, 
-        required_columns = ['A', 'B', 'M', 'N', 'Q', 'R', 'S', 'T', 'U', 'V', 'W']
-        
-        # Filtros válidos para la columna PROJECT   
-        valid_projects = ['FAI,EDMB,IDMB,QUE', 'EDMB-IDMB-QB', 'EDMB', 'EDMB-IDMB-QB', 'IDMB-QB']
+        required_columns = PROJECT_COLUMNS
+        valid_projects = VALID_PROJECTS
         
         # Intentar con ambas hojas
-        project_data = []
         debug_info = {
             "sheets_processed": [],
             "total_rows_checked": 0,
@@ -1053,53 +3125,7 @@ def get_project_details_table():
             "rows_matching_filters": 0
         }
         
-        for sheet_name in ['FLO-COM', 'TEX-COM']:
-            if sheet_name not in [s for s in (workbook.sheetnames if workbook else [])]:
-                logger.warning(f"Hoja {sheet_name} no encontrada")
-                debug_info["sheets_processed"].append(f"{sheet_name}: NO_EXISTE")
-                continue
-                
-            result = get_table_data(sheet_name, required_columns, filter_rows=False)
-            
-            if "error" not in result:
-                debug_info["sheets_processed"].append(f"{sheet_name}: PROCESADA")
-                
-                # Filtrar filas según PROJECT 
-                for row_info in result["data"]:
-                    row_data = row_info["data"]
-                    debug_info["total_rows_checked"] += 1
-                    
-                    # PROJECT está en columna Q
-                    project_value = row_data.get('Q', '---').strip()
-                    
-                    if project_value not in ['---', '', ' ', 'NULL', '-----']:
-                        debug_info["rows_with_project_data"] += 1
-                        logger.info(f"Proyecto encontrado en {sheet_name} fila {row_info['row']}: '{project_value}'")
-                    
-                    # Verificar si el proyecto coincide con alguno de los filtros válidos
-                    project_matches = False
-                    for valid_project in valid_projects:
-                        if valid_project.upper() in project_value.upper():
-                            project_matches = True
-                            debug_info["rows_matching_filters"] += 1
-                            logger.info(f"Coincidencia encontrada: '{project_value}' contiene '{valid_project}'")
-                            break
-                    
-                    # Solo incluir si tiene un proyecto válido y datos completos
-                    if project_matches:
-                        # Verificar que tenga al menos STORE o ADDRESS válidos
-                        store = row_data.get('A', '---')
-                        address = row_data.get('B', '---')
-                        
-                        if store not in ['---', '', ' '] or address not in ['---', '', ' ']:
-                            # Agregar información de la hoja de origen
-                            row_data['_source_sheet'] = sheet_name
-                            row_data['_region'] = 'Florida' if sheet_name == 'FLO-COM' else 'Texas'
-                            project_data.append(row_info)
-                            logger.info(f"Fila válida agregada: Store={store}, Project={project_value}")
-            else:
-                debug_info["sheets_processed"].append(f"{sheet_name}: ERROR - {result['error']}")
-                logger.error(f"Error procesando {sheet_name}: {result['error']}")
+        project_data = list(iter_project_rows(current.workbook, debug_info, required_columns))
         
         # Log de resumen
         logger.info(f"RESUMEN: {debug_info['total_rows_checked']} filas revisadas, {debug_info['rows_with_project_data']} con datos de proyecto, {debug_info['rows_matching_filters']} coinciden con filtros")
@@ -1120,7 +3146,7 @@ def get_project_details_table():
             'X': 'INSTALL'   
         }
         
-        return jsonify({
+        return {
             "status": "success",
             "data": project_data,
             "columns": required_columns,
@@ -1131,74 +3157,1004 @@ def get_project_details_table():
                 "project_types": valid_projects,
                 "note": "Solo se muestran filas con PROJECT"
             }
-        })
+        }
         
     except Exception as e:
         logger.error(f"Error en tabla de proyectos: {str(e)}")
+        return {"error": str(e)}
+
+@app.route('/api/stores/<store_id>')
+def get_store(store_id):
+    """Registro de una tienda desde el índice por STORE (sin recorrer la tabla)"""
+    current = published
+    record = current.store_index.get(store_key(store_id))
+    if record is None:
+        return jsonify({"error": f"Tienda {store_id} no encontrada"})
+    return jsonify({"status": "success", "last_update": current.snapshot.last_update, "data": record})
+
+@app.route('/api/projects/financials')
+@cached_response
+def get_project_financials():
+    """Totales, promedios y distribución de COST/AUV por región, tipo de proyecto y status (?region=)"""
+    try:
+        region = request.args.get('region', '').lower() or None
+        if region and region not in ('florida', 'texas'):
+            return jsonify({"error": "Región debe ser 'florida' o 'texas'"})
+        current = published
+        result = compute_financials(current.financials, region)
+        result["status"] = "success"
+        result["region"] = region or "global"
+        result["last_update"] = current.snapshot.last_update
+        return jsonify(result)
+    
+    except Exception as e:
+        logger.error(f"Error en finanzas de proyectos: {str(e)}")
+        return jsonify({"error": str(e)})
+
+@app.route('/api/pivot')
+@cached_response
+def get_pivot():
+    """Conteo de tiendas agrupado (?rows=DM&cols=STATUS&filter=A19:SI,WIRING:NO|PENDING)"""
+    try:
+        rows = request.args.get('rows', '').strip().upper()
+        cols = request.args.get('cols', '').strip().upper() or None
+        if not rows:
+            return jsonify({"error": "Falta el parámetro rows", "dimensions": list(PIVOT_DIMENSIONS)})
+        invalid = [d for d in (rows, cols) if d is not None and d not in PIVOT_DIMENSIONS]
+        if invalid:
+            return jsonify({"error": f"Dimensiones no válidas: {invalid}", "dimensions": list(PIVOT_DIMENSIONS)})
+        try:
+            filters = parse_pivot_filters(request.args.getlist('filter'))
+        except ValueError as e:
+            return jsonify({"error": str(e)})
+        
+        current = published
+        result = pivot(current.pivot_cube, rows, cols, filters)
+        result["status"] = "success"
+        result["last_update"] = current.snapshot.last_update
+        return jsonify(result)
+    
+    except Exception as e:
+        logger.error(f"Error en pivote: {str(e)}")
+        return jsonify({"error": str(e)})
+
+@app.route('/api/sheets/<name>/table')
+@cached_response
+def get_sheet_table_api(name):
+    """Cualquier hoja como tabla columnar (?columns=&filter=COLUMNA:valor&offset=&limit=)"""
+    try:
+        wb = published.workbook
+        if not wb:
+            return jsonify({"error": "No workbook loaded"})
+        if name not in wb.sheetnames:
+            return jsonify({"error": f"Hoja {name} no encontrada", "sheets": wb.sheetnames})
+        table = get_sheet_table(name, wb)
+        
+        # Proyección de columnas por nombre (sin distinguir mayúsculas)
+        by_name = {column["name"].upper(): column for column in table["columns"]}
+        requested = [c.strip().upper() for c in request.args.get('columns', '').split(',') if c.strip()]
+        invalid = [c for c in requested if c not in by_name]
+        if invalid:
+            return jsonify({"error": f"Columnas no válidas: {invalid}", "columns": [c["name"] for c in table["columns"]]})
+        columns = [by_name[c] for c in requested] if requested else table["columns"]
+        
+        try:
+            filters = parse_table_filters(request.args.getlist('filter'), table["columns"])
+        except ValueError as e:
+            return jsonify({"error": str(e)})
+        try:
+            offset = max(0, int(request.args.get('offset', 0)))
+            limit = min(SHEET_TABLE_MAX_PAGE, max(1, int(request.args.get('limit', SHEET_TABLE_PAGE_SIZE))))
+        except ValueError:
+            return jsonify({"error": "offset y limit deben ser números enteros"})
+        
+        indexes = range(table["rows"])
+        for column_name, value in filters:
+            values = table["data"][column_name]
+            indexes = [i for i in indexes if values[i] is not None and str(values[i]).upper() == value]
+        indexes = list(indexes)
+        page = indexes[offset:offset + limit]
+        
+        return jsonify({
+            "status": "success",
+            "sheet": name,
+            "header_row": table["header_row"],
+            "columns": columns,
+            "total_rows": table["rows"],
+            "matched_rows": len(indexes),
+            "offset": offset,
+            "limit": limit,
+            "data": {column["name"]: [table["data"][column["name"]][i] for i in page] for column in columns}
+        })
+    
+    except Exception as e:
+        logger.error(f"Error en tabla genérica {name}: {str(e)}")
+        return jsonify({"error": str(e)})
+
+# ENDPOINT AGRUPADO PARA LA CARGA INICIAL DEL FRONTEND
+
+BUNDLE_PARTS = ('summary', 'kpis', 'forecast', 'calendar', 'tables')
+DEFAULT_BUNDLE_PARTS = ('summary', 'calendar')
+
+# Partes ya serializadas, compartidas entre combinaciones de parts/region del mismo snapshot
+bundle_part_cache = {"state": None, "parts": {}}
+bundle_part_lock = threading.Lock()
+
+def build_bundle_part(part, region, current):
+    """Construye una parte del bundle sin los sub-objetos compartidos (se emiten una sola vez)"""
+    if part == 'summary':
+        return {key: value for key, value in current.snapshot.to_dict().items()
+                if key not in ('remodel_dates', 'last_update', 'status')}
+    if part == 'kpis':
+        return {key: value for key, value in current.kpis.items() if key != 'last_update'}
+    if part == 'forecast':
+        return {key: value for key, value in current.forecast.items() if key != 'last_update'}
+    if part == 'calendar':
+        calendar = build_calendar_payload(current)
+        if calendar.get("status") != "success":
+            return calendar
+        # Las tiendas por semana ya vienen en weekly_schedule; de cada región solo se envía el total
+        return {
+            "weekly_schedule": calendar["weekly_schedule"],
+            "total_weeks": calendar["total_weeks"],
+            "florida_total_dates": calendar["florida_data"].get("total_dates", 0),
+            "texas_total_dates": calendar["texas_data"].get("total_dates", 0)
+        }
+    if part == 'tables':
+        regions = [region] if region in ('florida', 'texas') else ['florida', 'texas']
+        tables = {name: build_region_table_payload(name, current) for name in regions}
+        tables["projects"] = build_projects_table_payload(current)
+        return tables
+    raise ValueError(f"Parte desconocida: {part}")
+
+def serialized_bundle_part(part, region, current):
+    """JSON de una parte del bundle, serializado una vez por snapshot"""
+    # Se indexa por el estado publicado, no por la generación de la caché (que se incrementa
+    # después): así el encabezado y las partes del bundle siempre salen de la misma versión
+    key = (part, region if part == 'tables' else None)
+    with bundle_part_lock:
+        if bundle_part_cache["state"] is not current:
+            bundle_part_cache["state"] = current
+            bundle_part_cache["parts"] = {}
+        cached = bundle_part_cache["parts"].get(key)
+    if cached is not None:
+        return cached
+
+    serialized = app.json.dumps(build_bundle_part(part, region, current))
+    with bundle_part_lock:
+        if bundle_part_cache["state"] is current and published is current:
+            bundle_part_cache["parts"][key] = serialized
+    return serialized
+
+@app.route('/api/bundle')
+@cached_response
+def get_bundle():
+    """Todo lo que el frontend necesita al cargar, en un solo request (?parts=summary,calendar,tables&region=)"""
+    try:
+        requested = request.args.get('parts')
+        parts = [p.strip().lower() for p in requested.split(',') if p.strip()] if requested else list(DEFAULT_BUNDLE_PARTS)
+        invalid = [p for p in parts if p not in BUNDLE_PARTS]
+        if invalid:
+            return jsonify({"error": f"Partes no válidas: {invalid}. Disponibles: {list(BUNDLE_PARTS)}"})
+        region = request.args.get('region', '').lower() or None
+        if region and region not in ('florida', 'texas', 'global'):
+            return jsonify({"error": "Región debe ser 'florida', 'texas' o 'global'"})
+
+        # Se arma el JSON concatenando partes ya serializadas
+        current = published
+        header = {
+            "status": current.snapshot.status,
+            "last_update": current.snapshot.last_update,
+            "snapshot_version": current.version,
+            "parts": parts
+        }
+        pieces = [app.json.dumps(header)[:-1]]
+        pieces.append(',"remodel_dates":' + app.json.dumps(current.snapshot.remodel_dates))
+        for part in dict.fromkeys(parts):
+            pieces.append(f',"{part}":' + serialized_bundle_part(part, region, current))
+        pieces.append('}')
+
+        return app.response_class(''.join(pieces), mimetype='application/json')
+
+    except Exception as e:
+        logger.error(f"Error en bundle: {str(e)}")
         return jsonify({"error": str(e)})
 
+@app.route('/api/export/<table>')
+def export_table(table):
+    """Exporta florida, texas o projects como CSV, XLSX o Parquet (streaming)"""
+    try:
+        table = table.lower()
+        if table not in EXPORT_TABLES:
+            return jsonify({"error": "Tabla debe ser 'florida', 'texas' o 'projects'"})
+        
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in ('csv', 'xlsx', 'parquet'):
+            return jsonify({"error": "Formato debe ser 'csv', 'xlsx' o 'parquet'"})
+        
+        # Proyección de columnas (?columns=A,B,M), por defecto las mismas que la API JSON
+        default_columns = PROJECT_COLUMNS if table == 'projects' else [chr(65 + i) for i in range(24)]
+        columns = [c.strip().upper() for c in request.args.get('columns', '').split(',') if c.strip()]
+        columns = columns or default_columns
+        invalid = [c for c in columns if c not in COLUMN_NAMES]
+        if invalid:
+            return jsonify({"error": f"Columnas no válidas: {invalid}"})
+        
+        # Tomar el workbook actual: un refresco en medio de la descarga no mezcla datos
+        wb = published.workbook
+        if not wb:
+            return jsonify({"error": "No workbook loaded"})
+        
+        header = [COLUMN_NAMES[c] for c in columns]
+        if table == 'projects':
+            header = ['REGION'] + header
+        records = iter_export_records(table, columns, wb)
+        
+        if export_format == 'csv':
+            body, mimetype = export_csv(records, header), 'text/csv'
+        elif export_format == 'xlsx':
+            body = export_xlsx(records, header, table)
+            mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        else:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                return jsonify({"error": "Exportación Parquet requiere pyarrow instalado"})
+            body, mimetype = export_parquet(records, header, pa, pq), 'application/vnd.apache.parquet'
+        
+        filename = f"{table}-{datetime.now().strftime('%Y%m%d-%H%M')}.{export_format}"
+        logger.info(f"Exportando {table} como {export_format} ({len(columns)} columnas)")
+        return Response(body, mimetype=mimetype, headers={
+            "Content-Disposition": f"attachment; filename={filename}"
+        })
+        
+    except Exception as e:
+        logger.error(f"Error exportando {table}: {str(e)}")
+        return jsonify({"error": str(e)})
+
+# FRONTEND ESTÁTICO OPCIONAL (SERVE_FRONTEND=1, en /app/)
+# Al arrancar se separan el CSS y el JS inline de index.html, todos los archivos quedan con
+# el hash del contenido en el nombre (caché inmutable) y se precalculan gzip/br y ETag.
+# index.html se revalida con su ETag: una recarga solo transfiere los datos de la API.
+
+SERVE_FRONTEND = os.environ.get('SERVE_FRONTEND', '0') == '1'
+FRONTEND_DIR = os.environ.get('FRONTEND_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend'))
+FRONTEND_PREFIX = '/app'
+# Servido por el backend, el frontend llama a la API del mismo origen por defecto
+FRONTEND_API_BASE = os.environ.get('FRONTEND_API_BASE', '')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def static_asset(body, mimetype):
+    """Archivo estático con ETag y variantes comprimidas"""
+    return {
+        "body": body,
+        "mimetype": mimetype,
+        "etag": hashlib.sha256(body).hexdigest()[:20],
+        "variants": compress_variants(body)
+    }
+
+def hashed_filename(path, body):
+    """'images/logo.jpg' -> 'images/logo.<hash>.jpg'"""
+    base, extension = os.path.splitext(path)
+    return f"{base}.{hashlib.sha256(body).hexdigest()[:10]}{extension}"
+
+def extract_inline_block(html, tag, replacement):
+    """Saca el primer <tag> sin atributos de html y lo sustituye por replacement(contenido)"""
+    start = html.find(f"<{tag}>")
+    end = html.find(f"</{tag}>", start)
+    if start < 0 or end < 0:
+        return html, None
+    content = html[start + len(tag) + 2:end]
+    return html[:start] + replacement(content) + html[end + len(tag) + 3:], content
+
+def build_frontend_assets():
+    """Prepara index.html y sus archivos para servirlos desde FRONTEND_PREFIX"""
+    assets = {}
+    with open(os.path.join(FRONTEND_DIR, 'index.html'), encoding='utf-8') as f:
+        html = f.read()
+    
+    # Imágenes y demás archivos referenciados por ruta relativa
+    for root, _, files in os.walk(FRONTEND_DIR):
+        for name in sorted(files):
+            if name.endswith(('.html', '.json')):
+                continue
+            path = os.path.relpath(os.path.join(root, name), FRONTEND_DIR).replace(os.sep, '/')
+            with open(os.path.join(root, name), 'rb') as f:
+                body = f.read()
+            hashed = hashed_filename(path, body)
+            assets[hashed] = static_asset(body, mimetypes.guess_type(name)[0] or 'application/octet-stream')
+            for quote in ('"', "'"):
+                html = html.replace(f'{quote}{path}{quote}', f'{quote}{FRONTEND_PREFIX}/{hashed}{quote}')
+    
+    def add_text_asset(content, extension, mimetype):
+        body = content.encode('utf-8')
+        hashed = hashed_filename(f"assets/app{extension}", body)
+        assets[hashed] = static_asset(body, mimetype)
+        return f"{FRONTEND_PREFIX}/{hashed}"
+    
+    html, _ = extract_inline_block(html, 'style', lambda css: f'<link rel="stylesheet" href="{add_text_asset(css, ".css", "text/css")}">')
+    
+    def script_tag(js):
+        js = re.sub(r"const API_BASE_URL = '[^']*';", lambda _: f"const API_BASE_URL = '{FRONTEND_API_BASE}';", js, count=1)
+        return f'<script src="{add_text_asset(js, ".js", "application/javascript")}"></script>'
+    html, _ = extract_inline_block(html, 'script', script_tag)
+    
+    assets['index.html'] = static_asset(html.encode('utf-8'), 'text/html')
+    logger.info(f"Frontend preparado: {len(assets)} archivos desde {FRONTEND_DIR}")
+    return assets
+
+def static_asset_response(asset, cache_control):
+    """Respuesta de un archivo estático: 304 si el ETag coincide, si no la variante aceptada"""
+    if request.if_none_match.contains_weak(asset["etag"]):
+        response = app.response_class(status=304)
+    else:
+        response = cached_entry_response((asset["body"], 200, asset["mimetype"], asset["variants"]), "STATIC")
+    # ETag débil: es el mismo para todas las codificaciones del contenido
+    response.set_etag(asset["etag"], weak=True)
+    response.headers['Cache-Control'] = cache_control
+    if asset["variants"]:
+        response.vary.add('Accept-Encoding')
+    return response
+
+frontend_assets = {}
+if SERVE_FRONTEND:
+    try:
+        frontend_assets = build_frontend_assets()
+    except OSError as e:
+        logger.error(f"No se pudo preparar el frontend: {str(e)}")
+
+@app.route(f'{FRONTEND_PREFIX}/')
+@app.route(f'{FRONTEND_PREFIX}/<path:filename>')
+def serve_frontend(filename='index.html'):
+    """Frontend con archivos versionados por hash (solo con SERVE_FRONTEND=1)"""
+    asset = frontend_assets.get(filename)
+    if asset is None:
+        return jsonify({"error": "Archivo no encontrado"}), 404
+    # index.html cambia de contenido sin cambiar de nombre: siempre se revalida
+    cache_control = 'no-cache' if filename == 'index.html' else IMMUTABLE_CACHE_CONTROL
+    return static_asset_response(asset, cache_control)
+
 # ENDPOINTS DE DEBUG Y UTILIDAD
 
 @app.route('/api/debug')
 def debug_info():
     """Endpoint para información de debug"""
+    current = published
+    florida = current.snapshot.florida_data or RegionSummary()
+    texas = current.snapshot.texas_data or RegionSummary()
+    global_summary = current.snapshot.global_data or GlobalSummary()
     return jsonify({
-        "status": dashboard_data["status"],
-        "last_update": dashboard_data["last_update"],
-        "remodel_dates_status": dashboard_data.get("remodel_dates", {}).get("source", "not_loaded"),
+        "status": current.snapshot.status,
+        "last_update": current.snapshot.last_update,
+        "remodel_dates_status": current.snapshot.remodel_dates.get("source", "not_loaded"),
+        "snapshot_version": current.version,
+        "materialized_sheets": current.workbook.materialized if current.workbook else [],
+        "response_cache": {
+            "entries": len(response_cache),
+            "max_entries": RESPONSE_CACHE_SIZE,
+            "bytes": response_cache_state["bytes"],
+            "max_bytes": RESPONSE_CACHE_BYTES,
+            "hits": response_cache_state["hits"],
+            "misses": response_cache_state["misses"],
+            "evictions": response_cache_state["evictions"]
+        },
         "data_summary": {
-            "florida_total": dashboard_data.get("florida_data", {}).get("aloha19", {}).get("total", 0),
-            "texas_total": dashboard_data.get("texas_data", {}).get("aloha19", {}).get("total", 0),
-            "global_total": dashboard_data.get("global_data", {}).get("aloha19", {}).get("total", 0),
-            "florida_wiring_pending": dashboard_data.get("florida_data", {}).get("wiring", {}).get("pending", 0),
-            "florida_wiring_finished": dashboard_data.get("florida_data", {}).get("wiring", {}).get("finished", 0),
-            "texas_wiring_close": dashboard_data.get("texas_data", {}).get("wiring", {}).get("close", 0)
+            "florida_total": zero_if_none(florida.aloha19.total),
+            "texas_total": zero_if_none(texas.aloha19.total),
+            "global_total": zero_if_none(global_summary.aloha19.total),
+            "florida_wiring_pending": zero_if_none(florida.wiring.pending),
+            "florida_wiring_finished": zero_if_none(florida.wiring.finished),
+            "texas_wiring_close": zero_if_none(texas.wiring.close)
         }
     })
 
 @app.route('/api/sheets-available')
+@cached_response
 def list_available_sheets():
     """Lista todas las hojas disponibles en el Excel"""
     try:
-        global workbook
-        if not workbook:
+        wb = published.workbook
+        if not wb:
             return jsonify({"error": "No workbook loaded"})
         
         return jsonify({
             "status": "success",
-            "sheets": workbook.sheetnames,
+            "sheets": wb.sheetnames,
             "required_for_dashboard": ["FLO", "TEX"],
             "required_for_tables": ["FLO-COM", "TEX-COM"],
             "com_sheets_available": {
-                "FLO-COM": "FLO-COM" in workbook.sheetnames,
-                "TEX-COM": "TEX-COM" in workbook.sheetnames
+                "FLO-COM": "FLO-COM" in wb.sheetnames,
+                "TEX-COM": "TEX-COM" in wb.sheetnames
             }
         })
         
     except Exception as e:
         return jsonify({"error": str(e)})
 
+# ENDPOINTS DE ADMINISTRACIÓN
+
+def check_admin_token():
+    """Devuelve una respuesta de error salvo que ADMIN_TOKEN esté definido y coincida"""
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "Endpoint de administración deshabilitado (definir ADMIN_TOKEN)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({"error": "No autorizado"}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """Arma el profiler (POST) o devuelve el estado y los resúmenes (GET)"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+
+    if request.method == 'POST':
+        params = request.get_json(silent=True) or request.args
+        target = params.get("target", "refresh")
+        if target not in ("refresh", "request"):
+            return jsonify({"error": "target debe ser 'refresh' o 'request'"})
+        try:
+            count = int(params.get("count", 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "count debe ser un número"})
+        if not 0 <= count <= MAX_PROFILE_COUNT:
+            return jsonify({"error": f"count debe estar entre 0 y {MAX_PROFILE_COUNT}"})
+
+        with profiling_lock:
+            profiling_state[target] = count
+            if target == "request":
+                profiling_state["request_path"] = params.get("path") or None
+        logger.info(f"Profiler armado: {target} x{count}")
+
+    with profiling_lock:
+        return jsonify({
+            "status": "success",
+            "armed": {
+                "refresh": profiling_state["refresh"],
+                "request": profiling_state["request"],
+                "request_path": profiling_state["request_path"]
+            },
+            "profile_dir": PROFILE_DIR,
+            "profiles": list(profiling_state["profiles"])
+        })
+
+@app.route('/api/admin/snapshots')
+def admin_snapshots():
+    """Versiones retenidas del snapshot (memoria y disco) y estado del rollback"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    with snapshot_registry_lock:
+        memory_bytes = sum(entry["bytes"] for entry in snapshot_registry.values())
+    return jsonify({
+        "status": "success",
+        "current_version": published.version,
+        "memory_bytes": memory_bytes,
+        "settings": {
+            "history": SNAPSHOT_HISTORY,
+            "memory_budget_bytes": SNAPSHOT_MEMORY_BYTES,
+            "snapshot_dir": SNAPSHOT_DIR or None,
+            "disk_keep": SNAPSHOT_DISK_KEEP
+        },
+        "rollback": current_rollback_state(read_shared_marker()),
+        "versions": list_snapshots()
+    })
+
+@app.route('/api/admin/rollback', methods=['POST'])
+def admin_rollback():
+    """Vuelve a publicar una versión anterior desde su Excel guardado (sin descargar)"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    params = request.get_json(silent=True) or request.args
+    try:
+        version = int(params.get("version"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "version debe ser un número"})
+    entry = get_snapshot_entry(version)
+    if entry is None:
+        return jsonify({"error": f"Versión {version} no disponible"})
+    
+    # La publicación bloquea el contenido revertido y registra el rollback en current.json
+    started = datetime.now()
+    run_refresh("rollback", "rollback", entry["content"], rollback_of=version)
+    state = source_state("rollback")
+    if state["last_success"] is None or state["last_success"] < started:
+        return jsonify({"error": "El rollback no se pudo publicar", "detail": state["last_error"]})
+    
+    last_rollback = rollback_state["last_rollback"]
+    logger.warning(f"Rollback: v{last_rollback['from']} -> contenido de v{version} (publicado como v{last_rollback['published_as']})")
+    return jsonify({"status": "success", "rollback": last_rollback})
+
+@app.route('/api/admin/profile/<path:filename>')
+def download_profile(filename):
+    """Descarga un archivo .prof guardado"""
+    denied = check_admin_token()
+    if denied:
+        return denied
+    return send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
+
+@app.route('/api/scheduler')
+def get_scheduler_status():
+    """Próximo refresco programado, intervalo adaptativo e historial"""
+    with scheduler_lock:
+        return jsonify({
+            "status": "success",
+            "running": scheduler_state["running"],
+            "role": shared_state["role"],
+            "interval_seconds": scheduler_state["interval"],
+            "next_run": scheduler_state["next_run"].isoformat() if scheduler_state["next_run"] else None,
+            "in_refresh_window": in_refresh_window(datetime.now()),
+            "source": primary_source(),
+            "local_source_path": LOCAL_SOURCE_PATH or None,
+            "settings": {
+                "min_interval_seconds": SCHEDULER_MIN_SECONDS,
+                "max_interval_seconds": SCHEDULER_MAX_SECONDS,
+                "backoff_factor": SCHEDULER_BACKOFF_FACTOR,
+                "jitter": SCHEDULER_JITTER,
+                "refresh_window": REFRESH_WINDOW or None
+            },
+            "history": list(scheduler_state["history"])
+        })
+
+
+# SCHEDULER ADAPTATIVO
+# El intervalo baja al mínimo cuando un refresco encuentra cambios en el Excel y crece
+# (hasta el máximo) mientras no cambia. Fuera de la ventana de REFRESH_WINDOW solo se
+# refresca al abrir la siguiente ventana. El jitter evita que varias instancias coincidan.
+
+SCHEDULER_MIN_SECONDS = int(os.environ.get('SCHEDULER_MIN_SECONDS', 5 * 60))
+SCHEDULER_MAX_SECONDS = int(os.environ.get('SCHEDULER_MAX_SECONDS', 2 * 60 * 60))
+SCHEDULER_START_SECONDS = int(os.environ.get('SCHEDULER_START_SECONDS', 30 * 60))
+SCHEDULER_BACKOFF_FACTOR = float(os.environ.get('SCHEDULER_BACKOFF_FACTOR', 1.5))
+SCHEDULER_JITTER = float(os.environ.get('SCHEDULER_JITTER', 0.1))  # ±10% del intervalo
+# Ventanas tipo cron, p. ej. "mon-fri 07:00-19:00; sat 08:00-12:00" (vacío = siempre)
+REFRESH_WINDOW = os.environ.get('REFRESH_WINDOW', '').strip()
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+scheduler_state = {
+    "running": False,
+    "interval": SCHEDULER_START_SECONDS,
+    "next_run": None,
+    "history": deque(maxlen=50)
+}
+scheduler_lock = threading.Lock()
+scheduler_wakeup = threading.Event()
+refresh_lock = threading.RLock()  # load_pending_snapshot lo toma antes de run_refresh
+
+def parse_weekdays(spec):
+    """'mon-fri', 'sat,sun' o '*' -> conjunto de días (0 = lunes)"""
+    if spec == '*':
+        return set(range(7))
+    days = set()
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = (WEEKDAYS.index(d) for d in part.split('-'))
+            days.update(range(first, last + 1) if first <= last else list(range(first, 7)) + list(range(0, last + 1)))
+        else:
+            days.add(WEEKDAYS.index(part))
+    return days
+
+def parse_refresh_windows(spec):
+    """Convierte REFRESH_WINDOW en una lista de (días, hora inicio, hora fin)"""
+    windows = []
+    for chunk in filter(None, (c.strip().lower() for c in spec.split(';'))):
+        days, hours = chunk.split()
+        start, end = hours.split('-')
+        windows.append((
+            parse_weekdays(days),
+            datetime.strptime(start, "%H:%M").time(),
+            datetime.strptime(end, "%H:%M").time()
+        ))
+    return windows
+
+try:
+    refresh_windows = parse_refresh_windows(REFRESH_WINDOW)
+except (ValueError, IndexError) as e:
+    logger.error(f"REFRESH_WINDOW inválido '{REFRESH_WINDOW}': {str(e)}; se refresca siempre")
+    refresh_windows = []
+
+def in_refresh_window(moment):
+    """True si el momento cae en alguna ventana (o si no hay ventanas configuradas)"""
+    if not refresh_windows:
+        return True
+    return any(moment.weekday() in days and start <= moment.time() < end
+               for days, start, end in refresh_windows)
+
+def next_window_start(moment):
+    """Inicio de la siguiente ventana de refresco a partir de 'moment'"""
+    for offset in range(8):
+        day = moment.date() + timedelta(days=offset)
+        starts = sorted(datetime.combine(day, start) for days, start, end in refresh_windows
+                        if day.weekday() in days)
+        for start in starts:
+            if start > moment:
+                return start
+    return moment + timedelta(seconds=SCHEDULER_MAX_SECONDS)
+
+def schedule_next_run(now=None):
+    """Calcula el próximo refresco con el intervalo actual, la ventana y el jitter"""
+    now = now or datetime.now()
+    with scheduler_lock:
+        interval = scheduler_state["interval"]
+        jitter = random.uniform(-SCHEDULER_JITTER, SCHEDULER_JITTER) * interval
+        next_run = now + timedelta(seconds=interval + jitter)
+        if not in_refresh_window(next_run):
+            # Fuera de horario: esperar a que abra la ventana (con jitter de hasta un minuto)
+            next_run = next_window_start(next_run) + timedelta(seconds=random.uniform(0, 60))
+        scheduler_state["next_run"] = next_run
+    scheduler_wakeup.set()
+    return next_run
+
+def run_refresh(trigger="scheduled", source=None, content=None, rollback_of=None, shared=None):
+    """Ejecuta un refresco, ajusta el intervalo según si el Excel cambió y lo registra"""
+    source = source or primary_source()
+    # Solo la fuente que sondea el scheduler ajusta el intervalo (una subida no lo reprograma)
+    polled = source == primary_source()
+    if shared is None:
+        # Un refresco propio parte del snapshot servido completo, no del paquete compartido
+        load_pending_snapshot()
+    with refresh_lock:
+        previous_change = source_state(source)["last_change"]
+        started = datetime.now()
+        download_and_process_excel(source, content, rollback_of, shared)
+        state = source_state(source)
+        succeeded = state["last_success"] is not None and state["last_success"] >= started
+        changed = succeeded and state["last_change"] != previous_change
+
+        with scheduler_lock:
+            if polled and changed:
+                scheduler_state["interval"] = SCHEDULER_MIN_SECONDS
+            elif polled and succeeded:
+                scheduler_state["interval"] = min(
+                    int(scheduler_state["interval"] * SCHEDULER_BACKOFF_FACTOR), SCHEDULER_MAX_SECONDS)
+            scheduler_state["history"].append({
+                "started": started.isoformat(),
+                "duration_seconds": round((datetime.now() - started).total_seconds(), 3),
+                "trigger": trigger,
+                "source": source,
+                "status": "success" if succeeded else "error",
+                "changed": changed,
+                "next_interval_seconds": scheduler_state["interval"]
+            })
+
+    if not polled or shared_state["role"] == "follower":
+        logger.info(f"Refresco {trigger} ({source}): {'con cambios' if changed else 'sin cambios'}")
+        return
+    next_run = schedule_next_run()
+    logger.info(f"Refresco {trigger}: {'con cambios' if changed else 'sin cambios'}, próximo a las {next_run.strftime('%H:%M:%S')}")
+
+def file_signature(path):
+    """(mtime, tamaño) de un archivo, None si no existe"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def watch_local_source():
+    """Sondea LOCAL_SOURCE_PATH y reingiere en cuanto el archivo cambia y termina de escribirse"""
+    # Solo se reacciona a cambios: el contenido actual ya lo cargó el arranque o viene de otra fuente
+    seen = file_signature(LOCAL_SOURCE_PATH)
+    pending = None
+    logger.info(f"Vigilando {LOCAL_SOURCE_PATH} cada {LOCAL_WATCH_SECONDS}s")
+    while True:
+        time.sleep(LOCAL_WATCH_SECONDS)
+        signature = file_signature(LOCAL_SOURCE_PATH)
+        if signature is None or signature == seen:
+            pending = None
+            continue
+        # Esperar a que dos lecturas seguidas coincidan (el archivo ya no se está escribiendo)
+        if signature != pending:
+            pending = signature
+            continue
+        seen, pending = signature, None
+        run_refresh("watch", "local")
 
 def run_scheduler():
     """Ejecuta el scheduler en un hilo separado"""
+    scheduler_state["running"] = True
+    # Siempre con jitter propio: el next_run heredado del maestro (preload) es el mismo en todos
+    schedule_next_run()
     while True:
-        schedule.run_pending()
-        time.sleep(60)
+        scheduler_wakeup.clear()
+        wait_seconds = (scheduler_state["next_run"] - datetime.now()).total_seconds()
+        if wait_seconds > 0:
+            # Se despierta antes si otro refresco reprogramó next_run
+            if scheduler_wakeup.wait(timeout=wait_seconds):
+                continue
+        run_refresh("scheduled")
+
+def start_leader_tasks():
+    """Scheduler, reintento pendiente y watcher local: solo en el worker elegido"""
+    global retry_timer
+    # Los hilos no sobreviven al fork: un reintento pendiente del proceso padre se rearma aquí
+    source = primary_source()
+    with freshness_lock:
+        next_retry = source_state(source)["next_retry"]
+        if next_retry is not None and (retry_timer is None or not retry_timer.is_alive()):
+            delay = max(0, (next_retry - datetime.now()).total_seconds())
+            retry_timer = threading.Timer(delay, run_refresh, args=("retry", source))
+            retry_timer.daemon = True
+            retry_timer.start()
+    scheduler_thread = threading.Thread(target=run_scheduler)
+    scheduler_thread.daemon = True
+    scheduler_thread.start()
+    if LOCAL_SOURCE_PATH:
+        threading.Thread(target=watch_local_source, daemon=True).start()
+
+# PUBLICACIÓN COMPARTIDA ENTRE WORKERS (gunicorn con varios workers)
+# Solo el worker que toma el lock de SNAPSHOT_DIR/scheduler.lock consulta las fuentes con
+# el scheduler (y vigila LOCAL_SOURCE_PATH); si muere, el lock se libera y lo toma otro.
+# Todo snapshot publicado en cualquier worker (scheduler, /api/refresh, /api/upload,
+# rollback) toma SNAPSHOT_DIR/publish.lock, recibe el siguiente número de versión, deja su
+# Excel en SNAPSHOT_DIR/blobs/<sha256>.xlsx y actualiza current.json (versión, contenido y
+# estado del rollback); los demás workers vigilan ese marcador y toman la misma versión sin
+# volver a descargarla. Antes del marcador quien publica deja sus respuestas precalculadas
+# (cuerpos y variantes gzip/br de PREWARM_PATHS) en un solo archivo versions/v{N}.pack que
+# todos los workers, incluido el que publica, sirven desde un mmap: esas páginas están una
+# vez en el page cache y no en cada proceso. Un worker que sigue a otro procesa el Excel
+# recién cuando un request pide algo fuera del paquete (load_pending_snapshot); sin paquete
+# lo procesa al ver el marcador. Sin SNAPSHOT_DIR cada proceso refresca y numera por su
+# cuenta: gunicorn.conf.py limita entonces a un solo worker.
+
+SHARED_MARKER = 'current.json'
+SHARED_WATCH_SECONDS = float(os.environ.get('SHARED_WATCH_SECONDS', 1.0))
+LEADER_RETRY_SECONDS = float(os.environ.get('LEADER_RETRY_SECONDS', 5.0))
+
+# pending: marcador de la versión que se sirve desde el paquete y cuyo Excel aún no se procesó
+shared_state = {"role": "standalone", "lock_file": None, "pending": None}
+
+def shared_path(*parts):
+    return os.path.join(SNAPSHOT_DIR, *parts)
+
+def write_atomic(path, data):
+    """Escribe el archivo completo con un rename (quien lo lee nunca ve uno a medias)"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, path)
+
+def read_shared_marker():
+    """Contenido de current.json (None si no hay snapshot compartido)"""
+    if not SNAPSHOT_DIR:
+        return None
+    try:
+        with open(shared_path(SHARED_MARKER)) as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+@contextmanager
+def publish_lock():
+    """Lock entre workers para publicar (flock en SNAPSHOT_DIR/publish.lock); sin SNAPSHOT_DIR no hace nada"""
+    if fcntl is None or not SNAPSHOT_DIR:
+        yield
+        return
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    with open(shared_path("publish.lock"), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)  # Se libera al cerrar el archivo
+        yield
+
+def share_snapshot(entry, rollback):
+    """Actualiza current.json con la versión recién guardada (llamar con el lock de publicación tomado)"""
+    if not SNAPSHOT_DIR:
+        return
+    marker = dict(snapshot_meta(entry), pid=os.getpid(), **rollback)
+    try:
+        write_atomic(shared_path(SHARED_MARKER), json.dumps(marker).encode('utf-8'))
+    except OSError as e:
+        logger.error(f"Error compartiendo el snapshot en {SNAPSHOT_DIR}: {str(e)}")
+
+def write_response_pack(version):
+    """Guarda las respuestas precalculadas en versions/v{N}.pack (el índice v{N}.pack.json se
+    escribe al final); llamar con el lock de publicación tomado. False si no hay nada que guardar"""
+    if not SNAPSHOT_DIR:
+        return False
+    with response_cache_lock:
+        generation = response_cache_state["generation"]
+        entries = [(key, entry) for key, entry in response_cache.items() if key[0] == generation]
+    chunks, index, offset = [], [], 0
+    for (_, path, args), (body, status, mimetype, variants) in entries:
+        spans = {}
+        for name, data in [("identity", body)] + list(variants.items()):
+            chunks.append(data)
+            spans[name] = [offset, len(data)]
+            offset += len(data)
+        index.append({"path": path, "args": args, "status": status, "mimetype": mimetype, "spans": spans})
+    if not offset:
+        return False
+    try:
+        write_atomic(snapshot_path(version, "pack"), b"".join(chunks))
+        write_atomic(snapshot_path(version, "pack.json"), json.dumps(index).encode('utf-8'))
+    except OSError as e:
+        logger.error(f"Error guardando el paquete de respuestas v{version}: {str(e)}")
+        return False
+    return True
+
+def install_response_pack(version):
+    """Reemplaza la caché de respuestas por las del paquete de la versión, como vistas de un
+    mmap de solo lectura (sin copias por worker). False si la versión no tiene paquete"""
+    if not SNAPSHOT_DIR:
+        return False
+    try:
+        with open(snapshot_path(version, "pack.json")) as f:
+            index = json.loads(f.read())
+        with open(snapshot_path(version, "pack"), 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    except (OSError, ValueError):
+        return False
+    entries = []
+    for item in index:
+        spans = {name: buffer[start:start + length] for name, (start, length) in item["spans"].items()}
+        args = tuple((key, tuple(values)) for key, values in item["args"])
+        entries.append((item["path"], args, (spans.pop("identity"), item["status"], item["mimetype"], spans)))
+    with response_cache_lock:
+        response_cache_state["generation"] += 1
+        response_cache_state["bytes"] = 0
+        response_cache.clear()
+        for path, args, entry in entries:
+            size = cache_entry_bytes(entry)
+            if len(response_cache) < RESPONSE_CACHE_SIZE and response_cache_state["bytes"] + size <= RESPONSE_CACHE_BYTES:
+                response_cache[(response_cache_state["generation"], path, args)] = entry
+                response_cache_state["bytes"] += size
+    return True
+
+def load_pending_snapshot():
+    """Procesa el Excel de la versión servida desde el paquete compartido (la primera vez que
+    un request o un refresco lo necesita)"""
+    if shared_state["pending"] is None:
+        return
+    with refresh_lock:
+        marker = shared_state["pending"]
+        if marker is None:
+            return
+        try:
+            with open(blob_path(marker["content_hash"]), 'rb') as f:
+                content = f.read()
+            run_refresh("follow", "shared", content, shared=marker)
+        except OSError as e:
+            logger.error(f"Error leyendo el Excel compartido v{marker['version']}: {str(e)}")
+        if shared_state["pending"] is marker:
+            # No se pudo procesar: volver a servir (y cachear) el último snapshot procesado
+            shared_state["pending"] = None
+            invalidate_response_cache()
+            prewarm_response_cache()
+
+def adopt_shared_version(marker):
+    """Mismo Excel que el publicado: se toma la versión y la fecha del marcador sin reprocesarlo"""
+    global published
+    current = published
+    last_update = marker["published"]
+    published = replace(
+        current,
+        snapshot=replace(current.snapshot, last_update=last_update),
+        version=marker["version"],
+        fetched_at=marker.get("fetched_at") or marker["published"],
+        quality_report=dict(current.quality_report, serving_version=marker["version"]),
+        kpis=dict(current.kpis, last_update=last_update),
+        forecast=dict(current.forecast, last_update=last_update)
+    )
+    shared_state["pending"] = None
+    rollback_state.update(current_rollback_state(marker))
+    record_source_success("shared", marker["content_hash"])
+    if not install_response_pack(marker["version"]):
+        invalidate_response_cache()
+        prewarm_response_cache()
+
+def follow_shared_snapshot():
+    """Carga el snapshot que publicó otro worker; False si no hay ninguno"""
+    marker = read_shared_marker()
+    if not marker or "version" not in marker:
+        return False
+    with refresh_lock:
+        pending = shared_state["pending"]
+        if marker["version"] == (pending["version"] if pending else published.version):
+            # Ya es la versión servida (la publicó este proceso o ya se siguió)
+            rollback_state.update(current_rollback_state(marker))
+            return True
+        if marker["content_hash"] == published.content_hash:
+            adopt_shared_version(marker)
+            return True
+        if install_response_pack(marker["version"]):
+            shared_state["pending"] = marker
+            rollback_state.update(current_rollback_state(marker))
+            logger.info(f"Sirviendo v{marker['version']} desde el paquete de respuestas del proceso {marker['pid']}")
+            return True
+    with open(blob_path(marker["content_hash"]), 'rb') as f:
+        content = f.read()
+    logger.info(f"Siguiendo el snapshot v{marker['version']} de {marker['source']} publicado por el proceso {marker['pid']}")
+    run_refresh("follow", "shared", content, shared=marker)
+    return True
+
+def watch_shared_snapshot():
+    """Sondea current.json y carga cada snapshot nuevo que publique otro worker"""
+    seen = file_signature(shared_path(SHARED_MARKER))
+    while True:
+        time.sleep(SHARED_WATCH_SECONDS)
+        signature = file_signature(shared_path(SHARED_MARKER))
+        if signature is None or signature == seen:
+            continue
+        seen = signature
+        try:
+            follow_shared_snapshot()
+        except Exception as e:
+            logger.error(f"Error siguiendo el snapshot compartido: {str(e)}")
+
+def acquire_leadership():
+    """Toma el lock del scheduler sin bloquear; el sistema lo libera si el proceso muere"""
+    if fcntl is None or not SNAPSHOT_DIR:
+        return True
+    if shared_state["lock_file"] is None:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        shared_state["lock_file"] = open(shared_path("scheduler.lock"), 'a')
+    try:
+        fcntl.flock(shared_state["lock_file"], fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def run_leader_election():
+    """Espera a ser el worker elegido y entonces arranca el scheduler"""
+    while not acquire_leadership():
+        shared_state["role"] = "follower"
+        time.sleep(LEADER_RETRY_SECONDS)
+    shared_state["role"] = "leader"
+    logger.info(f"Proceso {os.getpid()} elegido para el scheduler")
+    start_leader_tasks()
+
+def start_scheduler():
+    """Arranca el seguimiento del snapshot compartido y la elección del scheduler (con gunicorn, en cada worker)"""
+    # El next_run heredado del maestro solo aplica al worker que gane la elección
+    with scheduler_lock:
+        scheduler_state["next_run"] = None
+    if SNAPSHOT_DIR:
+        threading.Thread(target=watch_shared_snapshot, daemon=True).start()
+    threading.Thread(target=run_leader_election, daemon=True).start()
+
+def parse_iso_timestamp(value):
+    """datetime de un ISO 8601 (None si falta o no se reconoce)"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def load_initial_snapshot():
+    """Carga inicial de un worker sin preload: el snapshot compartido si es reciente, si no la fuente"""
+    marker = read_shared_marker()
+    published_at = parse_iso_timestamp(marker.get("published")) if marker else None
+    if published_at and (datetime.now() - published_at).total_seconds() <= FRESH_SECONDS:
+        try:
+            if follow_shared_snapshot():
+                return
+        except Exception as e:
+            logger.error(f"Error cargando el snapshot compartido: {str(e)}")
+    run_refresh("startup")
+
+def preload_snapshot():
+    """Carga el snapshot en el proceso maestro antes del fork (gunicorn --preload)"""
+    global retry_timer
+    logger.info("Carga inicial de datos (preload)...")
+    run_refresh("startup")
+    # El reintento lo rearma el worker elegido en start_leader_tasks()
+    with freshness_lock:
+        if retry_timer is not None:
+            retry_timer.cancel()
+            retry_timer = None
 
 if __name__ == '__main__':
     logger.info("Iniciando 916 Foods Dashboard API...")
     
-    # Configurar actualizaciones automáticas cada 30 minutos
-    schedule.every(30).minutes.do(download_and_process_excel)
-    
-    # Ejecutar una vez al inicio
+    # Ejecutar una vez al inicio (programa el siguiente refresco adaptativo)
     logger.info("Carga inicial de datos...")
-    download_and_process_excel()
+    run_refresh("startup")
     
     # Iniciar scheduler en hilo separado
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
+    start_scheduler()
     
     # Iniciar servidor Flask
     port = int(os.environ.get('PORT', 5000))
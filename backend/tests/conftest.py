@@ -0,0 +1,6 @@
+# conftest.py - Importa main.py desde backend/ sin directorio compartido (cada test usa el suyo)
+import os
+import sys
+
+os.environ.pop('SNAPSHOT_DIR', None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import main
+
+TODAY = datetime(2025, 3, 3)  # Lunes
+SERIES = [
+    (datetime(2025, 1, 6), 2),
+    (datetime(2025, 1, 20), 4),
+    (datetime(2025, 3, 3), 5),  # Semana en curso: todavía no cuenta
+]
+
+
+def test_throughput_series_fills_missing_weeks_up_to_today():
+    values, last_week = main.throughput_series(SERIES, TODAY)
+    assert values == [2, 0, 4, 0, 0, 0, 0, 0]
+    assert last_week == datetime(2025, 1, 20)
+
+
+def test_throughput_series_without_closed_weeks():
+    assert main.throughput_series(SERIES[-1:], TODAY) == ([], None)
+
+
+def test_burn_rate_uses_the_zero_filled_series():
+    # Sin avance en las últimas cuatro semanas cerradas el ritmo es 0
+    assert main.compute_burn_rate(SERIES, weeks=4, today=TODAY) == 0
+    assert main.compute_burn_rate(SERIES, weeks=8, today=TODAY) == 0.75
+    assert main.compute_burn_rate([], today=TODAY) == 0
+
+
+def test_weekly_completed_series_sums_calendars():
+    florida = {"status": "success", "weekly_schedule": [{"week_start": "01/06/2025", "completed": 2}]}
+    texas = {"status": "success", "weekly_schedule": [{"week_start": "01/06/2025", "completed": 1},
+                                                      {"week_start": "TBD", "completed": 9}]}
+    failed = {"status": "error", "weekly_schedule": [{"week_start": "01/13/2025", "completed": 7}]}
+    assert main.weekly_completed_series(florida, texas, failed) == [(datetime(2025, 1, 6), 3)]
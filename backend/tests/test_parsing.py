@@ -0,0 +1,72 @@
+import math
+from datetime import datetime, time
+
+import main
+
+
+def test_parse_money_formats():
+    assert main.parse_money('$12,345') == 12345.0
+    assert main.parse_money('(1,200)') == -1200.0
+    assert main.parse_money(' $ 99.5 ') == 99.5
+    assert main.parse_money(1234) == 1234.0
+
+
+def test_parse_money_without_number():
+    for value in (None, '---', '', 'TBD'):
+        assert math.isnan(main.parse_money(value))
+
+
+def test_ics_escape():
+    assert main.ics_escape('a,b;c\\d\ne') == r'a\,b\;c\\d\ne'
+
+
+def test_ics_fold_short_line_untouched():
+    line = 'SUMMARY:' + 'x' * 67
+    assert main.ics_fold(line) == line
+
+
+def test_ics_fold_limits_octets_without_splitting_characters():
+    line = 'DESCRIPTION:' + 'ñ' * 80
+    parts = main.ics_fold(line).split('\r\n')
+    assert all(len(part.encode('utf-8')) <= 75 for part in parts)
+    assert all(part.startswith(' ') for part in parts[1:])
+    assert parts[0] + ''.join(part[1:] for part in parts[1:]) == line
+
+
+def test_ics_revisions_bump_only_changed_events():
+    start = datetime(2025, 6, 2)
+    events = [("a", start, start, "A (pending)", ""), ("b", start, start, "B (pending)", "")]
+    first = main.revise_calendar_events(events, {})
+    assert {uid: revision["sequence"] for uid, revision in first.items()} == {"a": 0, "b": 0}
+
+    changed = [events[0], ("b", start, start, "B (completed)", "")]
+    second = main.revise_calendar_events(changed, first)
+    assert second["a"] == first["a"]
+    assert second["b"]["sequence"] == 1
+    assert second["b"]["hash"] != first["b"]["hash"]
+    assert main.revise_calendar_events(changed[:1], second) == {"a": first["a"]}
+
+
+def test_parse_weekdays():
+    assert main.parse_weekdays('mon-fri') == {0, 1, 2, 3, 4}
+    assert main.parse_weekdays('fri-mon') == {4, 5, 6, 0}
+    assert main.parse_weekdays('sat,sun') == {5, 6}
+    assert main.parse_weekdays('*') == set(range(7))
+
+
+def test_parse_refresh_windows():
+    windows = main.parse_refresh_windows('mon-fri 07:00-19:00; SAT 08:00-12:00;')
+    assert windows == [({0, 1, 2, 3, 4}, time(7, 0), time(19, 0)), ({5}, time(8, 0), time(12, 0))]
+
+
+def test_in_refresh_window_and_next_start(monkeypatch):
+    monkeypatch.setattr(main, 'refresh_windows', main.parse_refresh_windows('mon-fri 07:00-19:00'))
+    friday_evening = datetime(2025, 6, 6, 19, 0)
+    assert main.in_refresh_window(datetime(2025, 6, 6, 18, 59))
+    assert not main.in_refresh_window(friday_evening)
+    assert main.next_window_start(friday_evening) == datetime(2025, 6, 9, 7, 0)
+
+
+def test_empty_refresh_window_always_open(monkeypatch):
+    monkeypatch.setattr(main, 'refresh_windows', main.parse_refresh_windows(''))
+    assert main.in_refresh_window(datetime(2025, 6, 8, 3, 0))
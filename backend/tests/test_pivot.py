@@ -0,0 +1,46 @@
+import pytest
+
+import main
+
+
+def store(region, dm, status, week=None):
+    return {
+        "region": region,
+        "calendar": {"week": week} if week else None,
+        "columns": {"DM": dm, "GM": "gm", "A19": "done", "WIRING": "done"},
+        "project": {"PROJECT": "EDMB", "STATUS": status},
+    }
+
+
+@pytest.fixture
+def cube():
+    stores = {
+        "FL1": store("Florida", "ana", "completed", "06/02/2025"),
+        "FL2": store("Florida", "ana", "pending", "05/26/2025"),
+        "FL3": store("Florida", "luis", "completed"),
+        "TX1": store("Texas", "eva", "completed", "06/02/2025"),
+    }
+    return main.build_pivot_cube(stores)
+
+
+def test_pivot_counts_and_totals(cube):
+    result = main.pivot(cube, 'REGION', 'STATUS')
+    assert result["row_values"] == ["FLORIDA", "TEXAS"]
+    assert result["col_values"] == ["COMPLETED", "PENDING"]
+    assert result["matrix"] == [[2, 1], [1, 0]]
+    assert result["row_totals"] == [3, 1]
+    assert result["col_totals"] == [3, 1]
+    assert result["total"] == 4
+
+
+def test_pivot_filters_and_week_order(cube):
+    filters = main.parse_pivot_filters(['status:completed|pending', 'region:florida'])
+    result = main.pivot(cube, 'WEEK', filters=filters)
+    # Semanas por fecha y sin semana ('---') al final
+    assert result["row_values"] == ["05/26/2025", "06/02/2025", "---"]
+    assert result["matrix"] == [[1], [1], [1]]
+
+
+def test_parse_pivot_filters_rejects_unknown_dimension():
+    with pytest.raises(ValueError):
+        main.parse_pivot_filters(['color:red'])
@@ -0,0 +1,38 @@
+import main
+
+
+def failed(checks):
+    return {(check["check"], check["severity"]) for check in checks if not check["passed"]}
+
+
+def test_region_summary_consistent():
+    data = main.RegionSummary(
+        aloha19=main.Aloha19Summary(total=10, finished=4),
+        wiring=main.WiringSummary(pending=3, finished=4, close=3))
+    assert failed(main.check_region_summary('Florida', data)) == set()
+
+
+def test_region_summary_inconsistent():
+    data = main.RegionSummary(
+        aloha19=main.Aloha19Summary(total=10, finished=12),
+        wiring=main.WiringSummary(pending=1, finished=11))
+    assert failed(main.check_region_summary('Texas', data)) == {
+        ("finished_le_total", "error"),
+        ("wiring_matches_total", "warning"),
+        ("wiring_finished_le_total", "error"),
+    }
+
+
+def test_region_summary_missing():
+    assert failed(main.check_region_summary('Florida', None)) == {("summary_parsed", "error")}
+
+
+def test_remodel_dates_order_and_unparsed_values():
+    remodel_dates = {"regional_details": {"Florida": {
+        "stage1_start": "06/02/2025", "stage1_end": "05/01/2025",
+        "stage2_start": "TBD", "stage2_end": "pronto",
+    }}}
+    checks = main.check_remodel_dates(remodel_dates)
+    assert failed(checks) == {("remodel_dates_parseable", "warning"), ("stage1_start_le_stage1_end", "error")}
+    parseable = next(check for check in checks if check["check"] == "remodel_dates_parseable")
+    assert parseable["details"] == ["stage2_end=pronto"]
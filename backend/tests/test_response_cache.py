@@ -0,0 +1,71 @@
+import pytest
+
+import main
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    main.invalidate_response_cache()
+    yield
+    main.invalidate_response_cache()
+
+
+def counting_view(on_call=None):
+    calls = []
+
+    def view():
+        calls.append(main.request.full_path)
+        if on_call:
+            on_call()
+        return main.jsonify({"calls": len(calls)})
+    return main.cached_response(view), calls
+
+
+def get(view, url):
+    with main.app.test_request_context(url):
+        return view()
+
+
+def test_hit_ignores_query_arg_order():
+    view, calls = counting_view()
+    assert get(view, '/x?b=1&a=2').headers['X-Cache'] == 'MISS'
+    response = get(view, '/x?a=2&b=1')
+    assert response.headers['X-Cache'] == 'HIT'
+    assert response.get_json() == {"calls": 1}
+    assert len(calls) == 1
+
+
+def test_new_generation_drops_entries():
+    view, calls = counting_view()
+    get(view, '/x')
+    main.invalidate_response_cache()
+    assert get(view, '/x').headers['X-Cache'] == 'MISS'
+    assert len(calls) == 2
+
+
+def test_response_from_an_old_generation_is_not_stored():
+    # Se publica un snapshot mientras se genera la respuesta
+    view, calls = counting_view(on_call=main.invalidate_response_cache)
+    get(view, '/x')
+    assert len(main.response_cache) == 0
+
+
+def test_lru_eviction_by_count(monkeypatch):
+    monkeypatch.setattr(main, 'RESPONSE_CACHE_SIZE', 2)
+    view, calls = counting_view()
+    evictions = main.response_cache_state["evictions"]
+    for url in ('/a', '/b', '/a', '/c'):
+        get(view, url)
+    # /a se usó después de /b: sale /b
+    assert [key[1] for key in main.response_cache] == ['/a', '/c']
+    assert main.response_cache_state["evictions"] == evictions + 1
+    assert get(view, '/b').headers['X-Cache'] == 'MISS'
+
+
+def test_eviction_by_bytes(monkeypatch):
+    view, calls = counting_view()
+    get(view, '/a')
+    monkeypatch.setattr(main, 'RESPONSE_CACHE_BYTES', main.response_cache_state["bytes"] * 2 - 1)
+    get(view, '/b')
+    assert [key[1] for key in main.response_cache] == ['/b']
+    assert main.response_cache_state["bytes"] <= main.RESPONSE_CACHE_BYTES
@@ -0,0 +1,61 @@
+import json
+import os
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'SNAPSHOT_DIR', str(tmp_path))
+    os.makedirs(tmp_path / "versions")
+    os.makedirs(tmp_path / "blobs")
+    return tmp_path
+
+
+def write_version(directory, version, content_hash):
+    for extension, data in (("json", "{}"), ("events.json", "{}"),
+                            ("meta.json", json.dumps({"version": version, "content_hash": content_hash}))):
+        (directory / "versions" / f"v{version}.{extension}").write_text(data)
+    (directory / "blobs" / f"{content_hash}.xlsx").write_bytes(b"xlsx")
+
+
+def write_marker(directory, version, content_hash):
+    (directory / main.SHARED_MARKER).write_text(json.dumps({"version": version, "content_hash": content_hash}))
+
+
+def test_prune_keeps_recent_versions_and_the_marker(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(main, 'SNAPSHOT_DISK_KEEP', 2)
+    for version in range(1, 6):
+        write_version(snapshot_dir, version, f"h{version}")
+    write_marker(snapshot_dir, 1, "h1")  # Rollback a la versión más vieja
+
+    main.prune_snapshot_dir()
+
+    assert main.disk_snapshot_versions() == [1, 4, 5]
+    assert not (snapshot_dir / "versions" / "v2.json").exists()
+    assert not (snapshot_dir / "versions" / "v2.events.json").exists()
+    assert sorted(os.listdir(snapshot_dir / "blobs")) == ["h1.xlsx", "h4.xlsx", "h5.xlsx"]
+
+
+def test_prune_keeps_blobs_shared_by_kept_versions(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(main, 'SNAPSHOT_DISK_KEEP', 1)
+    write_version(snapshot_dir, 1, "same")
+    write_version(snapshot_dir, 2, "same")
+
+    main.prune_snapshot_dir()
+
+    assert main.disk_snapshot_versions() == [2]
+    assert os.listdir(snapshot_dir / "blobs") == ["same.xlsx"]
+
+
+def test_prune_disabled_with_zero(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(main, 'SNAPSHOT_DISK_KEEP', 0)
+    for version in range(1, 4):
+        write_version(snapshot_dir, version, f"h{version}")
+
+    main.prune_snapshot_dir()
+
+    assert main.disk_snapshot_versions() == [1, 2, 3]
+    assert len(os.listdir(snapshot_dir / "blobs")) == 3